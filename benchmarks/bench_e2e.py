@@ -0,0 +1,391 @@
+# benchmarks/bench_e2e.py
+"""
+End to end: job submission through the FastAPI app, then the whole Celery pipeline, with stand-in stages.
+
+    python -m benchmarks.bench_e2e --jobs 50 --concurrency 8 [--stage-seconds train_splatting=0.5,sparse_mapping=0.2]
+                                   [--mode chain|fused] [--gpu-slots 1] [--cpu-workers 4] [--output run.json]
+
+Runs in one process, without RabbitMQ or Postgres:
+- The interface app (interface/app/main.py) runs with its lifespan, outbox dispatcher included. It is
+  driven in-process over ASGI: POST /create_job with a small random video, then GET /gallery and /health.
+- The database is a temporary SQLite file that both the interface and the worker code use.
+- The broker is Celery's in-memory transport. Two worker threads consume it, cpu_queue (--cpu-workers)
+  and gpu_queue (--gpu-slots).
+- Every pipeline task is replaced by a stand-in registered under the real task name. A stand-in sleeps
+  for its stage's duration (--stage-seconds, --default-stage-seconds) instead of running ffmpeg, COLMAP
+  or training. It reports status and progress through the real worker/tasks/utils.py, and is
+  measured into job_stage by worker/stage_metrics.py (its rows are part of the worker SQL). schedule_gpu
+  drives the real GpuScheduler over an in-memory store, because the SQL store needs a Postgres
+  advisory lock.
+
+The run therefore measures the platform around the stages: the request path, the outbox, the broker
+hops, the GPU scheduler and the status writes. It reports:
+- submit latency percentiles and jobs per hour;
+- queue wait per stage, from the end of the previous stage (or the submit response) to the start;
+- SQL statements per job, from the interface and from the workers;
+- gallery and /health latency once all jobs are done.
+Results are printed as JSON and written to --output, to diff runs.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Dict, List
+
+# The application modules read their configuration at import time
+_TMP = tempfile.TemporaryDirectory(prefix="bench_e2e_")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(_TMP.name) / 'bench.db'}"
+os.environ["RABBITMQ_URL"] = "memory://"
+os.environ["DATA_DIR"] = str(Path(_TMP.name) / "data")
+os.environ.setdefault("OUTBOX_LINGER_SECONDS", "0.005")
+
+import httpx
+from celery import Celery, chain
+from celery.contrib.testing.worker import start_worker
+from sqlalchemy import event, func, select
+
+from interface.app import database, dispatch, main
+from interface.app.models import Base, Job, JobStatus
+from worker import database as worker_database
+from worker.gpu_scheduler import GpuJob, GpuScheduler, MemoryGpuStore
+from worker.stage_metrics import PUBLISHED_AT_HEADER, measure_stage
+from worker.tasks.utils import get_job_params, report_progress, update_job_status
+
+CPU_STAGES = [name.rsplit(".", 1)[1] for name in dispatch.CPU_STAGE_TASKS]
+GPU_STAGES = ["train_splatting", "convert_ply_to_splat", "build_lod"]
+STAGES = CPU_STAGES + GPU_STAGES
+# Status set when a stage starts, as the real tasks do
+STAGE_STATUS = {
+    "extract_frames": JobStatus.PREPROCESSING,
+    "feature_extraction": JobStatus.RUNNING_COLMAP,
+    "train_splatting": JobStatus.RUNNING_SPLATTING,
+    "convert_ply_to_splat": JobStatus.POSTPROCESSING,
+}
+GPU_TASKS = {
+    "train_splatting": ("worker.tasks.splatting.train_splatting", "gpu_queue"),
+    "convert_ply_to_splat": ("worker.tasks.convert.convert_ply_to_splat", "cpu_queue"),
+    "build_lod": ("worker.tasks.convert.build_lod", "cpu_queue"),
+}
+
+
+# --- Measurements ---
+
+class QueryCounter:
+    """Counts the SQL statements an engine sends (an executemany counts once)."""
+
+    def __init__(self, sync_engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+
+
+def use_wal(sync_engine) -> None:
+    """Readers and the writer no longer block each other, closer to Postgres than SQLite's default journal."""
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+class Timeline:
+    """Start and end time of every stage of every job."""
+
+    def __init__(self):
+        self.registered: Dict[str, float] = {}
+        self.stages: Dict[str, Dict[str, List[float]]] = {}
+        self.done = threading.Event()
+        self.expected = 0
+        self._lock = threading.Lock()
+
+    def start(self, job_id: str, stage: str) -> None:
+        with self._lock:
+            self.stages.setdefault(job_id, {})[stage] = [time.time(), None]
+
+    def end(self, job_id: str, stage: str) -> None:
+        with self._lock:
+            self.stages[job_id][stage][1] = time.time()
+            finished = sum(1 for stages in self.stages.values() if stages.get("build_lod", [0, None])[1])
+            if finished >= self.expected:
+                self.done.set()
+
+
+def percentiles(samples: List[float], scale: float = 1.0) -> Dict[str, float]:
+    """Nearest-rank p50/p90/p99, max and mean, multiplied by `scale`."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * scale, 2)
+
+    return {"n": len(ordered), "p50": rank(50), "p90": rank(90), "p99": rank(99),
+            "max": round(ordered[-1] * scale, 2), "mean": round(sum(ordered) / len(ordered) * scale, 2)}
+
+
+# --- Stand-in worker ---
+
+def build_worker_app(durations: Dict[str, float], timeline: Timeline, gpu_slots: int) -> Celery:
+    """Celery app with a stand-in for every pipeline task, under the names the interface dispatches."""
+    app = Celery("bench_e2e", broker="memory://")
+    app.conf.update(
+        task_serializer="json",
+        accept_content=["json"],
+        task_queues={
+            "cpu_queue": {"exchange": "cpu_queue", "routing_key": "cpu_queue"},
+            "gpu_queue": {"exchange": "gpu_queue", "routing_key": "gpu_queue"},
+        },
+        task_default_queue="cpu_queue",
+        task_default_exchange="cpu_queue",
+        task_default_routing_key="cpu_queue",
+        broker_transport_options={"polling_interval": 0.005}, # Default 1 s: would dominate every hop
+        # No prefetch limit: with the threads pool, acks are sent from the consumer loop, which blocks up to 2 s
+        # while the limit is reached. gpu_queue still holds no more than --gpu-slots messages (the scheduler).
+        worker_prefetch_multiplier=0,
+        worker_hijack_root_logger=False,
+    )
+
+    def run_stage(job_id: str, stage: str) -> None:
+        timeline.start(job_id, stage)
+        report_progress(job_id, stage)
+        if stage in STAGE_STATUS:
+            update_job_status(job_id, status=STAGE_STATUS[stage])
+        time.sleep(durations[stage])
+        if stage == "build_lod":
+            update_job_status(job_id, status=JobStatus.COMPLETED)
+        timeline.end(job_id, stage)
+
+    def stage_task(task_name: str, stage: str):
+        @app.task(name=task_name)
+        def stand_in(job_id: str):
+            run_stage(job_id, stage)
+            return job_id
+        return stand_in
+
+    for task_name, stage in zip(dispatch.CPU_STAGE_TASKS, CPU_STAGES):
+        stage_task(task_name, stage)
+
+    @app.task(name=dispatch.FUSED_CPU_STAGES_TASK, bind=True, measures_stages=True)
+    def run_cpu_stages(self, job_id: str, start_stage: int = 0):
+        for index, stage in enumerate(CPU_STAGES[start_stage:]):
+            published_at = self.request.get(PUBLISHED_AT_HEADER) if index == 0 else None
+            with measure_stage(job_id, stage, self.request, published_at): # As worker/tasks/pipeline.py
+                run_stage(job_id, stage)
+        return job_id
+
+    # --- GPU scheduling: the real policy over an in-memory store ---
+    store = MemoryGpuStore()
+    store_lock = threading.Lock() # enqueue/finished do not take the store's transaction lock
+
+    def dispatch_gpu_chain(job_id: str) -> None:
+        chain(*(app.signature(name, args=(job_id,), immutable=True, queue=queue)
+                for name, queue in GPU_TASKS.values())).apply_async()
+
+    scheduler = GpuScheduler(store, dispatch_gpu_chain, slots=gpu_slots)
+
+    @app.task(name=dispatch.SCHEDULE_GPU_TASK)
+    def schedule_gpu(job_id: str):
+        report_progress(job_id, "waiting_for_gpu")
+        params = get_job_params(job_id)
+        with store_lock:
+            store.add(GpuJob(job_id, "bench", 0, params["num_frames"], params["iterations"], enqueued_at=time.time()))
+            scheduler.enqueue(job_id)
+            scheduler.schedule()
+        return job_id
+
+    @app.task(name=GPU_TASKS["train_splatting"][0], acks_late=True)
+    def train_splatting(job_id: str):
+        try:
+            run_stage(job_id, "train_splatting")
+        finally:
+            with store_lock:
+                scheduler.finished(job_id)
+                scheduler.schedule()
+        return job_id
+
+    for stage in GPU_STAGES[1:]:
+        stage_task(GPU_TASKS[stage][0], stage)
+    return app
+
+
+# --- Interface ---
+
+def record_registrations(timeline: Timeline) -> None:
+    """Records when create_job committed each job (its row and outbox row): the start of the first queue wait."""
+    register_job = main.register_job
+
+    async def timed_register_job(session, job_id, *args, **kwargs):
+        job = await register_job(session, job_id, *args, **kwargs)
+        timeline.registered[job_id] = time.time()
+        return job
+
+    main.register_job = timed_register_job
+
+
+async def submit_jobs(client: httpx.AsyncClient, args, rng: random.Random) -> List[float]:
+    """Submits --jobs jobs from --concurrency clients. Returns the latency of every request."""
+    latencies: List[float] = []
+    counter = iter(range(args.jobs))
+
+    async def submitter():
+        for i in counter:
+            video = rng.randbytes(args.video_kb * 1024) # Unique content: no duplicate reuse
+            start = time.perf_counter()
+            response = await client.post("/create_job", files={"video_file": (f"clip{i}.mp4", video, "video/mp4")},
+                                         data={"splat_name": f"Bench {i}", "num_frames": "60", "iterations": "7000"})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 303:
+                raise RuntimeError(f"create_job returned {response.status_code}: {response.text[:200]}")
+
+    await asyncio.gather(*(submitter() for _ in range(args.concurrency)))
+    return latencies
+
+
+async def timed_gets(client: httpx.AsyncClient, path: str, repeat: int, counter: QueryCounter):
+    """Latencies of `repeat` GETs and the SQL statements per request."""
+    latencies = []
+    before = counter.count
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(path)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return latencies, round((counter.count - before) / repeat, 2)
+
+
+async def run(args) -> dict:
+    durations = {stage: args.default_stage_seconds for stage in STAGES}
+    durations.update(args.stage_seconds)
+    timeline = Timeline()
+    timeline.expected = args.jobs
+    worker_app = build_worker_app(durations, timeline, args.gpu_slots)
+    record_registrations(timeline)
+
+    for sync_engine in (database.engine.sync_engine, worker_database.sync_engine):
+        use_wal(sync_engine)
+    Base.metadata.create_all(worker_database.sync_engine)
+    interface_queries = QueryCounter(database.engine.sync_engine)
+    worker_queries = QueryCounter(worker_database.sync_engine)
+    main.DATA_DIR = Path(os.environ["DATA_DIR"])
+    main.DATA_DIR.mkdir(parents=True, exist_ok=True)
+    main.PIPELINE_MODE = args.mode
+
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=main.app)
+    with ExitStack() as workers:
+        for queue, concurrency in (("cpu_queue", args.cpu_workers), ("gpu_queue", args.gpu_slots)):
+            workers.enter_context(start_worker(worker_app, concurrency=concurrency, pool="threads", queues=[queue],
+                                               perform_ping_check=False, loglevel=args.log_level))
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                started = time.time()
+                latencies = await submit_jobs(client, args, rng)
+                submit_seconds = time.time() - started
+                finished = await asyncio.to_thread(timeline.done.wait, args.timeout)
+                wall_seconds = time.time() - started
+                await asyncio.sleep(0.1) # Last status flush
+                pipeline_queries = (interface_queries.count, worker_queries.count)
+
+                gallery, gallery_queries = await timed_gets(client, "/gallery", args.repeat, interface_queries)
+                health, health_queries = await timed_gets(client, "/health", args.repeat, interface_queries)
+
+            async with database.AsyncSessionFactory() as session:
+                statuses = dict((await session.execute(select(Job.status, func.count()).group_by(Job.status))).all())
+
+    waits: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    end_to_end = []
+    for job_id, stages in timeline.stages.items():
+        previous_end = timeline.registered[job_id]
+        for stage in STAGES:
+            if stage not in stages or stages[stage][1] is None:
+                break
+            start, end = stages[stage]
+            waits[stage].append(max(0.0, start - previous_end))
+            previous_end = end
+        else:
+            end_to_end.append(previous_end - timeline.registered[job_id])
+
+    completed = statuses.get(JobStatus.COMPLETED, 0)
+    return {
+        "config": {"jobs": args.jobs, "concurrency": args.concurrency, "mode": args.mode, "cpu_workers": args.cpu_workers,
+                   "gpu_slots": args.gpu_slots, "video_kb": args.video_kb, "stage_seconds": durations},
+        "all_completed": finished and completed == args.jobs,
+        "statuses": {status.value: count for status, count in statuses.items()},
+        "submit_seconds": round(submit_seconds, 2),
+        "wall_seconds": round(wall_seconds, 2),
+        "jobs_per_hour": round(completed / wall_seconds * 3600, 1),
+        "submit_latency_ms": percentiles(latencies, 1000),
+        "end_to_end_seconds": percentiles(end_to_end),
+        "stage_seconds_total": round(sum(durations.values()), 3),
+        "queue_wait_ms": {stage: percentiles(w, 1000) for stage, w in waits.items()},
+        "db_queries_per_job": {
+            "interface": round(pipeline_queries[0] / args.jobs, 2),
+            "worker": round(pipeline_queries[1] / args.jobs, 2),
+            "total": round(sum(pipeline_queries) / args.jobs, 2),
+        },
+        "gallery_latency_ms": percentiles(gallery, 1000),
+        "gallery_queries_per_request": gallery_queries,
+        "health_latency_ms": percentiles(health, 1000),
+        "health_queries_per_request": health_queries,
+    }
+
+
+def parse_stage_seconds(value: str) -> Dict[str, float]:
+    """"stage=seconds,..." or the path of a JSON object of the same."""
+    if value.endswith(".json"):
+        durations = json.loads(Path(value).read_text())
+    else:
+        durations = dict(item.split("=", 1) for item in value.split(",") if item)
+    unknown = set(durations) - set(STAGES)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown stage(s) {', '.join(sorted(unknown))}; stages: {', '.join(STAGES)}")
+    return {stage: float(seconds) for stage, seconds in durations.items()}
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent submitting clients")
+    parser.add_argument("--mode", choices=("chain", "fused"), default="chain", help="PIPELINE_MODE of the interface")
+    parser.add_argument("--cpu-workers", type=int, default=4, help="Concurrency of the cpu_queue worker")
+    parser.add_argument("--gpu-slots", type=int, default=1, help="Concurrency of the gpu_queue worker and GPU_SLOTS")
+    parser.add_argument("--default-stage-seconds", type=float, default=0.02)
+    parser.add_argument("--stage-seconds", type=parse_stage_seconds, default={"train_splatting": 0.2},
+                        help="Per-stage durations, 'stage=seconds,...' or a .json file")
+    parser.add_argument("--video-kb", type=int, default=256, help="Size of each uploaded video")
+    parser.add_argument("--repeat", type=int, default=50, help="GETs of /gallery and /health after the run")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for the pipelines")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", type=Path, help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    database.engine.sync_engine.echo = False # The interface engine logs every statement otherwise
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        _TMP.cleanup()
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + "\n")
+    if not result["all_completed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
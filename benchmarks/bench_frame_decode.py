@@ -0,0 +1,83 @@
+# benchmarks/bench_frame_decode.py
+"""
+Keyframe extraction throughput: single-stream decoding against parallel segmented decoding.
+
+    python -m benchmarks.bench_frame_decode --seconds 60 --size 3840x2160 --workers 4,8,16,32 [--video path.mp4]
+
+Generates a synthetic H.264 video with ffmpeg unless --video is given. Reports frames/s for
+OpenCV single-stream decoding, one ffmpeg stream in this process, and the segmented decoder at
+each worker count, plus whether each run selected the same frames as the largest worker count
+(OpenCV scales differently, so its selection may legitimately differ).
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import write_synthetic_video
+from worker.keyframes import extract_keyframes
+from worker.video_decode import Segment, extract_keyframes_parallel, output_size, probe_video, select_segment
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", type=Path, help="Use an existing video instead of a synthetic one")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of the synthetic video")
+    parser.add_argument("--size", default="3840x2160", help="Size of the synthetic video")
+    parser.add_argument("--num-frames", type=int, default=200, help="Keyframes to select")
+    parser.add_argument("--max-size", type=int, default=1600, help="Long side of the extracted frames")
+    parser.add_argument("--workers", default="2,4,8", help="Comma-separated worker counts")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        if args.video:
+            video_path = args.video
+        else:
+            width, height = (int(v) for v in args.size.split("x"))
+            video_path = write_synthetic_video(tmp_dir / "synthetic.mp4", args.seconds, width, height)
+
+        info = probe_video(video_path)
+        total = len(info.frame_times_us)
+        runs = {}
+
+        start = time.perf_counter()
+        manifest = extract_keyframes(video_path, tmp_dir / "opencv", args.num_frames, max_size=args.max_size)
+        runs["opencv_single"] = (time.perf_counter() - start, manifest)
+
+        # One ffmpeg stream, decoded and scaled by ffmpeg like the segments, in this process
+        (tmp_dir / "ffmpeg").mkdir()
+        size = output_size(info.width, info.height, args.max_size)
+        start = time.perf_counter()
+        result = select_segment(video_path, Segment(0, total, 0), size, 0, args.num_frames, total, tmp_dir / "ffmpeg", "jpg")
+        runs["ffmpeg_single"] = (time.perf_counter() - start, {"decoded_frames": result["decoded"], "frames": None})
+
+        for workers in (int(w) for w in args.workers.split(",") if w.strip()):
+            start = time.perf_counter()
+            manifest = extract_keyframes_parallel(video_path, tmp_dir / f"parallel_{workers}", args.num_frames,
+                                                  max_size=args.max_size, workers=workers)
+            runs[f"parallel_{workers}"] = (time.perf_counter() - start, manifest)
+
+        reference = [f["source_index"] for f in runs[f"parallel_{workers}"][1]["frames"]]
+        baseline = runs["ffmpeg_single"][0]
+        print(json.dumps({
+            "video": str(args.video or f"synthetic {args.size}, {args.seconds}s"),
+            "frames": total,
+            "keyframes": len(info.keyframes),
+            "output_size": f"{size[0]}x{size[1]}",
+            "runs": {
+                name: {
+                    "seconds": round(seconds, 3),
+                    "frames_per_s": round(manifest["decoded_frames"] / seconds, 1),
+                    "speedup_vs_ffmpeg_single": round(baseline / seconds, 2),
+                    "same_selection": None if manifest["frames"] is None
+                                      else [f["source_index"] for f in manifest["frames"]] == reference,
+                }
+                for name, (seconds, manifest) in runs.items()
+            },
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
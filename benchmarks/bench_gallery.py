@@ -0,0 +1,130 @@
+# benchmarks/bench_gallery.py
+"""
+Gallery query latency as the job table grows: keyset pages against the old unbounded query.
+
+    python -m benchmarks.bench_gallery --sizes 1000,10000,100000,300000 [--database-url postgresql+asyncpg://.../scratch]
+
+Fills a job table in steps up to each size and times, at every size, the first page, a page
+from the middle of the table (by cursor), a status-filtered page, and the previous
+`select(Job).order_by(Job.created_at.desc())` without a limit (only up to --legacy-max rows).
+Uses a temporary SQLite database unless --database-url is given. A given database must be
+a scratch database: the job table is created in it and dropped at the end.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from interface.app.gallery import encode_cursor, fetch_gallery_page
+from interface.app.models import Base, Job, JobStatus
+
+STATUS_WEIGHTS = {JobStatus.COMPLETED: 80, JobStatus.FAILED: 15, JobStatus.QUEUED: 3, JobStatus.RUNNING_COLMAP: 2}
+INSERT_BATCH = 5000
+
+
+def job_rows(start: int, count: int, rng: random.Random):
+    """Jobs `start`..`start+count`, one per second, with texts the size of real descriptions/errors."""
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    statuses, weights = zip(*STATUS_WEIGHTS.items())
+    for i in range(start, start + count):
+        status = rng.choices(statuses, weights)[0]
+        yield {
+            "jobid": "".join(rng.choices(string.ascii_lowercase, k=12)),
+            "name": f"Splat {i}",
+            "description": "x" * rng.randint(200, 2000),
+            "status": status,
+            "error_message": "Traceback ...\n" * 60 if status == JobStatus.FAILED else None,
+            "created_at": base + timedelta(seconds=i),
+        }
+
+
+async def timed(coroutine_factory, repeat: int) -> float:
+    """Median milliseconds of `repeat` runs."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coroutine_factory()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+async def run(args) -> dict:
+    engine = create_async_engine(args.database_url)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    rng = random.Random(0)
+    results = []
+    rows = 0
+    try:
+        for size in sorted(args.sizes):
+            while rows < size:
+                count = min(INSERT_BATCH, size - rows)
+                async with engine.begin() as connection:
+                    await connection.execute(insert(Job), list(job_rows(rows, count, rng)))
+                rows += count
+            async with sessions() as session:
+                middle = (await session.execute(
+                    select(Job.created_at, Job.jobid).order_by(Job.created_at.desc(), Job.jobid.desc())
+                    .offset(size // 2).limit(1))).one()
+                middle_cursor = encode_cursor(middle.created_at, middle.jobid)
+
+                async def first_page():
+                    await fetch_gallery_page(session, limit=args.page_size)
+
+                async def middle_page():
+                    await fetch_gallery_page(session, middle_cursor, limit=args.page_size)
+
+                async def failed_page():
+                    await fetch_gallery_page(session, middle_cursor, [JobStatus.FAILED], limit=args.page_size)
+
+                async def legacy():
+                    (await session.execute(select(Job).order_by(Job.created_at.desc()))).scalars().all()
+                    session.expunge_all()
+
+                result = {
+                    "rows": size,
+                    "first_page_ms": await timed(first_page, args.repeat),
+                    "middle_page_ms": await timed(middle_page, args.repeat),
+                    "failed_middle_page_ms": await timed(failed_page, args.repeat),
+                }
+                if size <= args.legacy_max:
+                    result["legacy_all_rows_ms"] = await timed(legacy, max(1, args.repeat // 10))
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+    finally:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+    return {"database": args.database_url.split("://")[0], "page_size": args.page_size, "repeat": args.repeat,
+            "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Async SQLAlchemy URL of a scratch database (default: temporary SQLite)")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated table sizes")
+    parser.add_argument("--page-size", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=50, help="Runs per query and size (median reported)")
+    parser.add_argument("--legacy-max", type=int, default=100000, help="Largest table to time the unbounded query on")
+    args = parser.parse_args()
+    args.sizes = [int(v) for v in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.database_url:
+            args.database_url = f"sqlite+aiosqlite:///{Path(tmp) / 'gallery.db'}"
+        print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_sparse_mapping.py
+"""
+Sparse mapping wall time and registered images: one incremental mapper against partitioned submodels.
+
+    python -m benchmarks.bench_sparse_mapping --frames 600 --threads 8 [--images path/to/frames]
+
+Renders a synthetic room walkthrough (one closed loop) unless --images is given. It then
+extracts and sequentially matches features once with COLMAP, and maps the same database
+with each mapper. Needs the colmap binary (COLMAP_BIN).
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import write_synthetic_room
+from worker import matching, sparse_mapping
+from worker.colmap_cli import COLMAP_BIN, run_colmap
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, help="Use existing frames instead of a synthetic walkthrough")
+    parser.add_argument("--frames", type=int, default=600, help="Frames of the synthetic walkthrough")
+    parser.add_argument("--size", default="960x540", help="Size of the synthetic frames")
+    parser.add_argument("--threads", type=int, default=8, help="CPU threads for every COLMAP step")
+    parser.add_argument("--submodel-images", type=int, default=sparse_mapping.MAPPER_SUBMODEL_IMAGES)
+    parser.add_argument("--submodel-overlap", type=int, default=sparse_mapping.MAPPER_SUBMODEL_OVERLAP)
+    args = parser.parse_args()
+    if shutil.which(COLMAP_BIN) is None:
+        sys.exit(f"COLMAP binary '{COLMAP_BIN}' not found (set COLMAP_BIN).")
+    sparse_mapping.MAPPER_SUBMODEL_IMAGES = args.submodel_images
+    sparse_mapping.MAPPER_SUBMODEL_OVERLAP = args.submodel_overlap
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        log_dir = tmp_dir / "logs"
+        if args.images:
+            image_dir = args.images
+        else:
+            width, height = (int(v) for v in args.size.split("x"))
+            start = time.perf_counter()
+            image_dir = write_synthetic_room(tmp_dir / "images", args.frames, width, height)
+            print(f"Rendered {args.frames} frames in {time.perf_counter() - start:.1f}s.", file=sys.stderr)
+
+        database_path = tmp_dir / "database.db"
+        extract_seconds = run_colmap("feature_extractor", {
+            "database_path": database_path,
+            "image_path": image_dir,
+            "ImageReader.single_camera": True,
+            "SiftExtraction.use_gpu": False,
+            "SiftExtraction.num_threads": args.threads,
+        }, log_dir, threads=args.threads)
+        match_seconds = run_colmap("sequential_matcher", {
+            "database_path": database_path,
+            "SequentialMatching.overlap": matching.MATCH_SEQUENTIAL_OVERLAP,
+            "SequentialMatching.quadratic_overlap": True,
+            "SiftMatching.use_gpu": False,
+            "SiftMatching.num_threads": args.threads,
+        }, log_dir, threads=args.threads)
+        num_images = len(matching.read_image_names(database_path))
+
+        runs = {}
+        for mode in sparse_mapping.MAPPER_MODES:
+            output_dir = tmp_dir / mode / "sparse"
+            output_dir.parent.mkdir()
+            start = time.perf_counter()
+            try:
+                summary = sparse_mapping.run_sparse_mapping(database_path, image_dir, output_dir, log_dir,
+                                                            num_images, args.threads, requested=mode)
+            except Exception as e:
+                runs[mode] = {"error": str(e)[-500:]}
+                continue
+            runs[mode] = {
+                "seconds": round(time.perf_counter() - start, 2),
+                "registered_images": summary["registered_images"],
+                "models": summary["models"],
+                "kept": summary["mode"], # Differs from the mode if the partitioned result was replaced
+            }
+
+        single = runs.get("single", {}).get("seconds")
+        for run in runs.values():
+            if single and "seconds" in run:
+                run["speedup_vs_single"] = round(single / run["seconds"], 2)
+        print(json.dumps({
+            "images": str(args.images or f"synthetic room, {args.frames} frames {args.size}"),
+            "num_images": num_images,
+            "threads": args.threads,
+            "submodel_images": args.submodel_images,
+            "submodel_overlap": args.submodel_overlap,
+            "feature_extraction_seconds": round(extract_seconds, 2),
+            "matching_seconds": round(match_seconds, 2),
+            "runs": runs,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/bench_splat_compress.py
+"""
+Round-trip benchmark of the compressed splat format against .splat.
+
+    python -m benchmarks.bench_splat_compress --count 2000000 [--profile compact|high] [--noise]
+                                              [--keep-sh] [--ply path/to/point_cloud.ply] [--output run.json]
+
+Reports encode time, file sizes, size ratios, decode time and quantization error. The
+errors compare the decoded file with the PLY, in the file's order and with its canonical
+rotations: position error (absolute and relative to the scene size), rotation angle,
+log-scale and colour error (in 8-bit steps). The synthetic scene models a trained one;
+--noise uses independent random rotations, scales and opacities: a worst case. Results
+are printed as JSON and written to --output.
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import write_synthetic_ply
+from worker.splat_compress import (
+    DEFAULT_PROFILE, PROFILES,
+    canonicalize_rotations, decode_compressed_attributes, encoding_order, write_compressed_splat,
+)
+from worker.splat_io import ORDER_MORTON, SH_C0, open_ply_vertices, write_splat
+
+
+def reference_attributes(ply_path: Path, position_bits: int) -> dict:
+    """The PLY's attributes in the compressed file's order, with canonical rotations."""
+    vertices = open_ply_vertices(ply_path)
+    order = encoding_order(vertices, position_bits)
+    block = vertices.take(order)
+    quat = np.stack([block[f"rot_{i}"] for i in range(4)], axis=1).astype(np.float32)
+    log_scale = np.stack([block[f"scale_{i}"] for i in range(3)], axis=1).astype(np.float32)
+    rotation, log_scale = canonicalize_rotations(quat, log_scale)
+    color = np.empty((len(block), 4), dtype=np.float32)
+    for channel in range(3):
+        color[:, channel] = 0.5 + SH_C0 * block[f"f_dc_{channel}"]
+    color[:, 3] = 1.0 / (1.0 + np.exp(-block["opacity"].astype(np.float32)))
+    position = np.stack([block["x"], block["y"], block["z"]], axis=1).astype(np.float32)
+    return {"position": position, "log_scale": log_scale, "rotation": rotation, "color": np.clip(color, 0.0, 1.0)}
+
+
+def errors(reference: dict, decoded: dict) -> dict:
+    if not len(reference["position"]):
+        return {}
+    position = np.abs(reference["position"] - decoded["position"]).max(axis=1)
+    extent = float((reference["position"].max(axis=0) - reference["position"].min(axis=0)).max())
+    dot = np.abs((reference["rotation"] * decoded["rotation"]).sum(axis=1)).clip(0.0, 1.0)
+    angle = np.degrees(2.0 * np.arccos(dot))
+    log_scale = np.abs(reference["log_scale"] - decoded["log_scale"])
+    color = np.abs(reference["color"] - decoded["color"]) * 255.0
+    return {
+        "max_position_error": float(position.max()),
+        "mean_position_error": float(position.mean()),
+        "max_position_error_of_extent": float(position.max() / max(extent, 1e-12)),
+        "max_rotation_error_deg": round(float(angle.max()), 3),
+        "mean_rotation_error_deg": round(float(angle.mean()), 3),
+        "max_log_scale_error": round(float(log_scale.max()), 4),
+        "max_rgb_error_8bit": round(float(color[:, :3].max()), 2),
+        "max_alpha_error_8bit": round(float(color[:, 3].max()), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1_000_000, help="Gaussians in the synthetic scene")
+    parser.add_argument("--ply", type=Path, help="Use a trained point_cloud.ply instead of a synthetic scene")
+    parser.add_argument("--noise", action="store_true", help="Synthetic scene with random rotations, scales and opacities")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument("--keep-sh", action="store_true", help="Also encode SH band 1+ codebooks")
+    parser.add_argument("--output", type=Path, help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        ply_path = args.ply or write_synthetic_ply(tmp_dir / "scene.ply", args.count, noise=args.noise)
+        splat_path = tmp_dir / "scene.splat"
+        compressed_path = tmp_dir / "scene.csplat"
+
+        start = time.perf_counter()
+        count = write_splat(ply_path, splat_path, order=ORDER_MORTON)
+        splat_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_compressed_splat(ply_path, compressed_path, keep_sh=args.keep_sh, profile=args.profile)
+        encode_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decoded = decode_compressed_attributes(compressed_path)
+        decode_seconds = time.perf_counter() - start
+
+        reference = reference_attributes(ply_path, PROFILES[args.profile]["position"])
+
+        ply_bytes = ply_path.stat().st_size
+        splat_bytes = splat_path.stat().st_size
+        compressed_bytes = compressed_path.stat().st_size
+        result = {
+            "splats": count,
+            "scene": "ply" if args.ply else ("noise" if args.noise else "structured"),
+            "profile": args.profile,
+            "keep_sh": args.keep_sh,
+            "ply_bytes": ply_bytes,
+            "splat_bytes": splat_bytes,
+            "compressed_bytes": compressed_bytes,
+            "bytes_per_splat": round(compressed_bytes / max(count, 1), 2),
+            "ratio_vs_splat": round(splat_bytes / compressed_bytes, 2),
+            "ratio_vs_ply": round(ply_bytes / compressed_bytes, 2),
+            "splat_write_s": round(splat_seconds, 3),
+            "encode_s": round(encode_seconds, 3),
+            "decode_s": round(decode_seconds, 3),
+            "decode_splats_per_s": round(count / max(decode_seconds, 1e-9)),
+            **errors(reference, decoded),
+        }
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
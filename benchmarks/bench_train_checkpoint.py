@@ -0,0 +1,202 @@
+# benchmarks/bench_train_checkpoint.py
+"""
+Kill-and-resume check of the checkpointed training loop (worker/splat_training.py), with the CPU stand-in trainer.
+
+    python -m benchmarks.bench_train_checkpoint --iterations 3000 --gaussians 100000 [--kills 3]
+                                                [--checkpoint-iterations 500] [--step-ms 1] [--output run.json]
+
+1. Trains once without interruption: the reference model.
+2. Trains in a child process and SIGKILLs it at a random point, --kills times in a row. Each new child
+   resumes from the checkpoints the previous one left, like a redelivered train_splatting task. The
+   last run is not killed. Its model must be identical to the reference.
+3. Times a blocking checkpoint write and the training loop's cost of submitting a snapshot.
+4. Truncates the newest checkpoint and checks that loading falls back to the previous one.
+
+Reports the iterations redone after each kill, checkpoint size and write time, and the stall per
+checkpoint. Results are printed as JSON and written to --output. Exits 1 if a check fails.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from worker.splat_io import find_trained_ply, write_splat
+from worker.splat_training import CheckpointStore, CheckpointWriter, CpuStandInTrainer, run_training
+
+FINGERPRINT = "bench"
+
+
+class CountingTrainer(CpuStandInTrainer):
+    """Stand-in trainer that publishes its last finished iteration to the parent process."""
+
+    def __init__(self, done, **kwargs):
+        super().__init__(**kwargs)
+        self.done = done
+
+    def step(self, iteration: int) -> None:
+        super().step(iteration)
+        self.done.value = iteration + 1
+
+
+def make_trainer(args, done=None) -> CpuStandInTrainer:
+    kwargs = dict(num_gaussians=args.gaussians, seed=args.seed, seconds_per_iteration=args.step_ms / 1000)
+    return CountingTrainer(done, **kwargs) if done is not None else CpuStandInTrainer(**kwargs)
+
+
+def train_child(args, directory: Path, done) -> None:
+    run_training(make_trainer(args, done), CheckpointStore(directory, FINGERPRINT), args.iterations,
+                 checkpoint_iterations=args.checkpoint_iterations, checkpoint_seconds=args.checkpoint_seconds)
+
+
+def killed_runs(args, directory: Path, rng: random.Random) -> list:
+    context = multiprocessing.get_context("fork")
+    runs = []
+    for _ in range(args.kills):
+        store = CheckpointStore(directory, FINGERPRINT)
+        latest = store.latest()
+        resumed_from = latest[0] if latest else 0
+        done = context.Value("q", resumed_from)
+        child = context.Process(target=train_child, args=(args, directory, done))
+        kill_at = rng.randint(resumed_from + 1, args.iterations - 1)
+        child.start()
+        while done.value < kill_at and child.is_alive():
+            time.sleep(0.001)
+        killed_at = done.value
+        os.kill(child.pid, signal.SIGKILL)
+        child.join()
+        after = store.latest()
+        runs.append({"resumed_from": resumed_from, "killed_at": killed_at,
+                     "checkpoint_after_kill": after[0] if after else 0,
+                     "iterations_lost": killed_at - (after[0] if after else 0)})
+    return runs
+
+
+def time_checkpoints(args, directory: Path) -> dict:
+    trainer = make_trainer(args)
+    store = CheckpointStore(directory, FINGERPRINT)
+    save_seconds = []
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        path = store.save(i + 1, trainer.state())
+        save_seconds.append(time.perf_counter() - start)
+    checkpoint_bytes = path.stat().st_size
+
+    # What the training loop pays per checkpoint: a snapshot copy and a hand-off to the writer thread
+    writer = CheckpointWriter(store)
+    submit_seconds = []
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        writer.submit(args.repeat + i + 1, trainer.state())
+        submit_seconds.append(time.perf_counter() - start)
+    writer.close()
+
+    step_seconds = []
+    for i in range(min(args.repeat, 20)):
+        start = time.perf_counter()
+        trainer.step(i)
+        step_seconds.append(time.perf_counter() - start)
+    return {
+        "checkpoint_bytes": checkpoint_bytes,
+        "save_ms_median": round(statistics.median(save_seconds) * 1000, 2),
+        "save_ms_max": round(max(save_seconds) * 1000, 2),
+        "submit_stall_ms_median": round(statistics.median(submit_seconds) * 1000, 3),
+        "submit_stall_ms_max": round(max(submit_seconds) * 1000, 3),
+        "step_ms_median": round(statistics.median(step_seconds) * 1000, 3),
+        "snapshots_replaced": writer.replaced,
+    }
+
+
+def corrupt_fallback(args, directory: Path) -> bool:
+    store = CheckpointStore(directory, FINGERPRINT, keep=2)
+    state = make_trainer(args).state()
+    store.save(1, state)
+    newest = store.save(2, state)
+    with open(newest, "r+b") as f:
+        f.truncate(newest.stat().st_size // 2)
+    latest = store.latest()
+    return latest is not None and latest[0] == 1
+
+
+def run(args) -> dict:
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="bench_train_checkpoint_") as tmp:
+        tmp_dir = Path(tmp)
+
+        start = time.perf_counter()
+        reference = make_trainer(args)
+        run_training(reference, CheckpointStore(tmp_dir / "reference", FINGERPRINT), args.iterations,
+                     checkpoint_iterations=args.checkpoint_iterations, checkpoint_seconds=args.checkpoint_seconds)
+        reference_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        runs = killed_runs(args, tmp_dir / "killed", rng)
+        resumed = make_trainer(args)
+        final_resumed_from = run_training(resumed, CheckpointStore(tmp_dir / "killed", FINGERPRINT), args.iterations,
+                                          checkpoint_iterations=args.checkpoint_iterations,
+                                          checkpoint_seconds=args.checkpoint_seconds)
+        interrupted_seconds = time.perf_counter() - start
+
+        reference_state, resumed_state = reference.state(), resumed.state()
+        identical = all(np.array_equal(reference_state[name], resumed_state[name]) for name in reference_state)
+
+        # The exported model goes through the same conversion as a trained one
+        resumed.export(tmp_dir / "model", args.iterations)
+        ply_path = find_trained_ply(tmp_dir / "model")
+        splats = write_splat(ply_path, tmp_dir / "model.splat")
+
+        timings = time_checkpoints(args, tmp_dir / "timing")
+        fallback = corrupt_fallback(args, tmp_dir / "corrupt")
+
+    lost = [r["iterations_lost"] for r in runs]
+    return {
+        "iterations": args.iterations,
+        "gaussians": args.gaussians,
+        "checkpoint_iterations": args.checkpoint_iterations,
+        "kills": runs,
+        "final_resumed_from": final_resumed_from,
+        "iterations_lost_total": sum(lost),
+        "iterations_lost_max": max(lost, default=0),
+        "reference_s": round(reference_seconds, 3),
+        "interrupted_s": round(interrupted_seconds, 3),
+        "identical_to_reference": identical,
+        "exported_splats": splats,
+        **timings,
+        "corrupt_checkpoint_fallback": fallback,
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=3000)
+    parser.add_argument("--gaussians", type=int, default=100_000)
+    parser.add_argument("--kills", type=int, default=3, help="Training processes to SIGKILL before the final run")
+    parser.add_argument("--checkpoint-iterations", type=int, default=500)
+    parser.add_argument("--checkpoint-seconds", type=float, default=300)
+    parser.add_argument("--step-ms", type=float, default=1.0, help="Simulated GPU time per iteration")
+    parser.add_argument("--repeat", type=int, default=20, help="Checkpoint writes and submits to time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Also write the JSON results to this file")
+    args = parser.parse_args()
+    if args.iterations < 2:
+        parser.error("--iterations must be at least 2")
+
+    result = run(args)
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + "\n")
+    if not (result["identical_to_reference"] and result["corrupt_checkpoint_fallback"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
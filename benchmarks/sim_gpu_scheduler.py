@@ -0,0 +1,134 @@
+# benchmarks/sim_gpu_scheduler.py
+"""
+GPU scheduling simulated with a fake clock and a fake GPU worker: FIFO against worker/gpu_scheduler.py.
+
+    python -m benchmarks.sim_gpu_scheduler --slots 1 --heavy-jobs 20 --light-submitters 6 [--seed 0]
+
+One submitter queues --heavy-jobs long jobs at t=0. The other submitters queue a few
+short jobs each over the following hours, and one of them sends a priority job. Real
+durations differ from the estimates by up to +-30%. Reports each submitter's mean and
+worst wait under plain FIFO (today's gpu_queue) and under the scheduler, plus the error
+of the ETA the scheduler gave each job when it was queued. Runs in milliseconds; no GPU,
+broker or database is involved.
+"""
+import argparse
+import heapq
+import json
+import random
+import statistics
+from typing import Dict, List, Tuple
+
+from worker.gpu_scheduler import GpuJob, GpuScheduler, MemoryGpuStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeGpuWorker:
+    """Runs dispatched jobs for their real duration on the fake clock."""
+
+    def __init__(self, clock: FakeClock, durations: Dict[str, float]):
+        self.clock = clock
+        self.durations = durations
+        self.completions: List[Tuple[float, str]] = []
+        self.started: Dict[str, float] = {}
+
+    def dispatch(self, job_id: str) -> None:
+        self.started[job_id] = self.clock.now
+        heapq.heappush(self.completions, (self.clock.now + self.durations[job_id], job_id))
+
+
+def workload(args, rng: random.Random) -> List[GpuJob]:
+    jobs = [GpuJob(f"heavy-{i}", "heavy", 0, 300, 30000, enqueued_at=0.0) for i in range(args.heavy_jobs)]
+    for s in range(args.light_submitters):
+        for i in range(rng.randint(1, 3)):
+            jobs.append(GpuJob(f"light{s}-{i}", f"light{s}", 0, rng.choice((60, 120, 200)), rng.choice((3000, 7000)),
+                               enqueued_at=rng.uniform(60, args.arrival_hours * 3600)))
+    jobs.append(GpuJob("urgent", "light0", 5, 120, 7000, enqueued_at=args.arrival_hours * 1800))
+    return sorted(jobs, key=lambda j: j.enqueued_at)
+
+
+def simulate_fifo(jobs: List[GpuJob], durations: Dict[str, float], slots: int) -> Dict[str, float]:
+    """Start time of every job when gpu_queue is consumed in arrival order."""
+    free_at = [0.0] * slots
+    starts = {}
+    for job in jobs:
+        slot_free = heapq.heappop(free_at)
+        starts[job.job_id] = max(slot_free, job.enqueued_at)
+        heapq.heappush(free_at, starts[job.job_id] + durations[job.job_id])
+    return starts
+
+
+def simulate_scheduler(jobs: List[GpuJob], durations: Dict[str, float], slots: int):
+    """Start times and the ETA given at queueing time, driving GpuScheduler with a fake clock and worker."""
+    clock = FakeClock()
+    store = MemoryGpuStore()
+    worker = FakeGpuWorker(clock, durations)
+    scheduler = GpuScheduler(store, worker.dispatch, clock=clock, slots=slots)
+    arrivals = list(jobs)
+    etas = {}
+    while arrivals or worker.completions:
+        if arrivals and (not worker.completions or arrivals[0].enqueued_at <= worker.completions[0][0]):
+            job = arrivals.pop(0)
+            clock.now = job.enqueued_at
+            store.add(job)
+            scheduler.enqueue(job.job_id)
+            scheduler.schedule()
+            etas[job.job_id] = store.queue_info[job.job_id][1]
+        else:
+            clock.now, job_id = heapq.heappop(worker.completions)
+            scheduler.finished(job_id)
+            scheduler.schedule()
+    return worker.started, etas
+
+
+def wait_stats(jobs: List[GpuJob], starts: Dict[str, float]) -> Dict[str, Dict]:
+    waits: Dict[str, List[float]] = {}
+    for job in jobs:
+        waits.setdefault(job.submitter, []).append((starts[job.job_id] - job.enqueued_at) / 60)
+    return {submitter: {"jobs": len(w), "mean_wait_min": round(statistics.mean(w), 1), "max_wait_min": round(max(w), 1)}
+            for submitter, w in sorted(waits.items())}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=1, help="GPU slots")
+    parser.add_argument("--heavy-jobs", type=int, default=20)
+    parser.add_argument("--light-submitters", type=int, default=6)
+    parser.add_argument("--arrival-hours", type=float, default=8.0, help="Light jobs arrive over this many hours")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    jobs = workload(args, rng)
+    durations = {job.job_id: job.estimate * rng.uniform(0.7, 1.3) for job in jobs}
+
+    fifo_starts = simulate_fifo(jobs, durations, args.slots)
+    starts, etas = simulate_scheduler(jobs, durations, args.slots)
+    eta_errors = [abs(etas[j.job_id] - (starts[j.job_id] + durations[j.job_id])) / 60 for j in jobs]
+    light = [j for j in jobs if j.submitter != "heavy"]
+    print(json.dumps({
+        "slots": args.slots,
+        "jobs": len(jobs),
+        "gpu_hours": round(sum(durations.values()) / 3600, 1),
+        "fifo": wait_stats(jobs, fifo_starts),
+        "scheduler": wait_stats(jobs, starts),
+        "light_mean_wait_min": {
+            "fifo": round(statistics.mean((fifo_starts[j.job_id] - j.enqueued_at) / 60 for j in light), 1),
+            "scheduler": round(statistics.mean((starts[j.job_id] - j.enqueued_at) / 60 for j in light), 1),
+        },
+        "urgent_wait_min": {
+            "fifo": round((fifo_starts["urgent"] - next(j for j in jobs if j.job_id == "urgent").enqueued_at) / 60, 1),
+            "scheduler": round((starts["urgent"] - next(j for j in jobs if j.job_id == "urgent").enqueued_at) / 60, 1),
+        },
+        "eta_error_min": {"median": round(statistics.median(eta_errors), 1), "max": round(max(eta_errors), 1)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# benchmarks/synthetic.py
+"""Synthetic inputs for the benchmarks, generated locally so no dataset has to be downloaded."""
+import os
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+
+def write_synthetic_ply(path: Path, count: int, sh_degree: int = 3, seed: int = 0, noise: bool = False) -> Path:
+    """
+    Writes a binary Gaussian Splatting PLY with `count` Gaussians.
+
+    By default the Gaussians are structured like those of a trained scene. They lie on a
+    few curved surfaces as flattened disks along the surface, twisted randomly about its
+    normal. Colour and size vary smoothly, with per-Gaussian noise on top, and most
+    Gaussians are nearly opaque. This is a model, not a measurement: the compression of
+    real scenes has to be checked on a trained PLY. With `noise`, rotations, scales and
+    opacities are independent random values instead: a worst case for compression.
+    """
+    rng = np.random.default_rng(seed)
+    num_rest = 3 * ((sh_degree + 1) ** 2 - 1)
+    names = (["x", "y", "z", "nx", "ny", "nz", "f_dc_0", "f_dc_1", "f_dc_2"]
+             + [f"f_rest_{i}" for i in range(num_rest)]
+             + ["opacity", "scale_0", "scale_1", "scale_2", "rot_0", "rot_1", "rot_2", "rot_3"])
+    vertices = np.zeros(count, dtype=[(name, "<f4") for name in names])
+
+    u, v = rng.random(count, dtype=np.float32), rng.random(count, dtype=np.float32)
+    surface = rng.integers(0, 4, count)
+    vertices["x"] = u * 4.0 + surface * 0.5
+    vertices["y"] = np.sin(u * 6.0 + surface) * 0.5 + np.sin(v * 5.0 + surface) * 0.3 + surface * 0.7
+    vertices["z"] = v * 3.0
+    texture = rng.normal(0.0, 0.15, (count, 3)) # Per-Gaussian colour detail
+    vertices["f_dc_0"] = np.sin(u * 10.0) + texture[:, 0]
+    vertices["f_dc_1"] = np.cos(v * 7.0) + texture[:, 1]
+    vertices["f_dc_2"] = u * v - 0.5 + texture[:, 2]
+    for i in range(num_rest):
+        vertices[f"f_rest_{i}"] = rng.normal(0.0, 0.05, count) * np.cos(u * (i + 1))
+
+    if noise:
+        vertices["opacity"] = rng.normal(2.0, 1.5, count)
+        for axis in range(3):
+            vertices[f"scale_{axis}"] = rng.normal(-5.0, 0.4, count) + u
+        for i in range(4):
+            vertices[f"rot_{i}"] = rng.normal(size=count)
+    else:
+        opaque = rng.random(count) < 0.7
+        vertices["opacity"] = np.where(opaque, rng.normal(4.0, 1.5, count), rng.normal(-1.0, 2.0, count))
+        size = -5.0 + 0.6 * np.sin(u * 3.0) + 0.3 * v
+        vertices["scale_0"] = size + rng.normal(0.0, 0.25, count)
+        vertices["scale_1"] = size + rng.normal(0.0, 0.25, count)
+        vertices["scale_2"] = size - 2.0 + rng.normal(0.0, 0.4, count) # Flat along the normal
+        # Surface normal from the partial derivatives of the surface
+        d_u = np.stack([np.full(count, 4.0), 3.0 * np.cos(u * 6.0 + surface), np.zeros(count)], axis=1)
+        d_v = np.stack([np.zeros(count), 1.5 * np.cos(v * 5.0 + surface), np.full(count, 3.0)], axis=1)
+        normal = np.cross(d_u, d_v)
+        normal /= np.linalg.norm(normal, axis=1, keepdims=True)
+        # Rotation taking the local z axis to the normal, after a random twist about z
+        align = np.concatenate([(1.0 + normal[:, 2])[:, None], -normal[:, 1:2], normal[:, 0:1], np.zeros((count, 1))], axis=1)
+        align /= np.linalg.norm(align, axis=1, keepdims=True)
+        twist = rng.uniform(0.0, np.pi, count)
+        w1, x1, y1, z1 = align.T
+        w2, z2 = np.cos(twist), np.sin(twist)
+        rotation = (w1 * w2 - z1 * z2, x1 * w2 + y1 * z2, y1 * w2 - x1 * z2, w1 * z2 + z1 * w2)
+        for i in range(4):
+            vertices[f"rot_{i}"] = rotation[i]
+
+    header = (f"ply\nformat binary_little_endian 1.0\nelement vertex {count}\n"
+              + "".join(f"property float {name}\n" for name in names)
+              + "end_header\n")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        vertices.tofile(f)
+    return path
+
+
+def write_synthetic_video(path: Path, seconds: float, width: int = 3840, height: int = 2160,
+                          fps: int = 30, gop: int = 60) -> Path:
+    """
+    Encodes an H.264 test pattern (ffmpeg's testsrc2: moving, high-detail content) with a
+    keyframe every `gop` frames and B-frames, like a phone or camera recording.
+    """
+    subprocess.run(
+        [os.getenv("FFMPEG_BIN", "ffmpeg"), "-v", "error", "-y",
+         "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}",
+         "-t", str(seconds), "-c:v", "libx264", "-preset", "veryfast", "-g", str(gop), "-bf", "2",
+         "-pix_fmt", "yuv420p", str(path)],
+        check=True,
+    )
+    return path
+
+
+def _noise_texture(rng: np.random.Generator, size: int) -> np.ndarray:
+    """Colour noise summed over several scales: distinctive features at every scale SIFT looks at."""
+    import cv2
+    texture = np.zeros((size, size, 3), dtype=np.float32)
+    for scale in (1, 4, 16):
+        # Coarse noise is drawn small and upsampled: same look as a wide blur, much cheaper
+        noise = cv2.GaussianBlur(rng.random((size // scale, size // scale, 3), dtype=np.float32), (0, 0), 1.0)
+        texture += cv2.resize(noise, (size, size), interpolation=cv2.INTER_CUBIC) * scale
+    texture -= texture.min()
+    return (texture * (255.0 / texture.max())).astype(np.uint8)
+
+
+def write_synthetic_room(out_dir: Path, num_frames: int, width: int = 960, height: int = 540,
+                         laps: float = 1.0, texture_size: int = 2048, seed: int = 0) -> Path:
+    """
+    Renders a walkthrough of a box room with noise-textured walls as frame_00001.jpg, ...
+    The camera walks `laps` times around an ellipse looking ahead and slightly outwards, like
+    a handheld video. Frames are ray-cast, so the views are geometrically exact (a single
+    pinhole camera) and a lap closes a loop.
+    """
+    import cv2
+    rng = np.random.default_rng(seed)
+    half = np.array([6.0, 2.5, 4.0]) # Room half-extents (x, y up, z)
+    textures = [_noise_texture(rng, texture_size) for _ in range(6)]
+    focal = 0.8 * width
+    u, v = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+    rays_cam = np.stack([(u - width / 2) / focal, (v - height / 2) / focal, np.ones_like(u)], axis=-1)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for frame in range(num_frames):
+        angle = 2 * np.pi * laps * frame / num_frames
+        center = np.array([3.0 * np.cos(angle), 0.3 * np.sin(3 * angle), 2.0 * np.sin(angle)])
+        forward = np.array([-np.sin(angle), 0.0, np.cos(angle)]) + 0.4 * np.array([np.cos(angle), 0.0, np.sin(angle)])
+        forward /= np.linalg.norm(forward)
+        right = np.cross(np.array([0.0, 1.0, 0.0]), forward)
+        right /= np.linalg.norm(right)
+        down = np.cross(forward, right)
+        rays = rays_cam @ np.stack([right, down, forward]) # Camera -> world rotation
+
+        # Nearest wall hit along each ray (the camera is inside a convex room: no occlusion)
+        best_t = np.full(u.shape, np.inf)
+        wall = np.zeros(u.shape, dtype=np.int8)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for axis in range(3):
+                for side, sign in enumerate((-1.0, 1.0)):
+                    t = (sign * half[axis] - center[axis]) / rays[..., axis]
+                    closer = (t > 0) & (t < best_t)
+                    best_t[closer] = t[closer]
+                    wall[closer] = axis * 2 + side
+        hits = center + rays * best_t[..., None]
+
+        image = np.zeros((height, width, 3), dtype=np.uint8)
+        for index in range(6):
+            axis = index // 2
+            a, b = [i for i in range(3) if i != axis] # In-plane axes of this wall
+            map_x = ((hits[..., a] / half[a] + 1) * 0.5 * (texture_size - 1)).astype(np.float32)
+            map_y = ((hits[..., b] / half[b] + 1) * 0.5 * (texture_size - 1)).astype(np.float32)
+            rendered = cv2.remap(textures[index], map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+            mask = wall == index
+            image[mask] = rendered[mask]
+        cv2.imwrite(str(out_dir / f"frame_{frame + 1:05d}.jpg"), image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    return out_dir
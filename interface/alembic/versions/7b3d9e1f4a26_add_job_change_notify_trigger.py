@@ -0,0 +1,61 @@
+"""Notify job status and progress changes
+
+Revision ID: 7b3d9e1f4a26
+Revises: 5e8a2f4c7b19
+Create Date: 2026-10-17 17:12:30.514870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3d9e1f4a26'
+down_revision: Union[str, None] = '5e8a2f4c7b19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # NOTIFY on channel 'job_events' (interface/app/events.py) when a job is created or its
+    # status/progress changes. Payloads must stay below 8000 bytes, hence the truncated error.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_job_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('job_events', json_build_object(
+                'jobid', NEW.jobid,
+                'status', NEW.status,
+                'current_stage', NEW.current_stage,
+                'progress', NEW.progress,
+                'failed_at_step', NEW.failed_at_step,
+                'error_message', left(NEW.error_message, 500),
+                'updated_at', NEW.updated_at
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER job_notify_insert AFTER INSERT ON job
+        FOR EACH ROW EXECUTE FUNCTION notify_job_change();
+    """)
+    op.execute("""
+        CREATE TRIGGER job_notify_update AFTER UPDATE ON job
+        FOR EACH ROW WHEN (
+            OLD.status IS DISTINCT FROM NEW.status OR
+            OLD.current_stage IS DISTINCT FROM NEW.current_stage OR
+            OLD.progress IS DISTINCT FROM NEW.progress OR
+            OLD.failed_at_step IS DISTINCT FROM NEW.failed_at_step
+        )
+        EXECUTE FUNCTION notify_job_change();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS job_notify_update ON job;")
+    op.execute("DROP TRIGGER IF EXISTS job_notify_insert ON job;")
+    op.execute("DROP FUNCTION IF EXISTS notify_job_change();")
@@ -0,0 +1,196 @@
+# interface/app/artifacts.py
+"""
+Serving of job output artifacts (data/<jobid>/output/*).
+
+Supports strong ETags with If-None-Match, single byte ranges (with If-Range),
+precompressed .br/.gz siblings written by the worker when a job completes, and
+zero-copy transfer: either via the ASGI pathsend extension (FileResponse) or, when
+ARTIFACT_ACCEL_REDIRECT_PREFIX is set, by handing the file to a fronting nginx
+with X-Accel-Redirect.
+
+Without nginx, only whole-file responses are zero-copy. A range is read through
+aiofiles in RANGE_CHUNK_SIZE pieces and copied through Python, costing a thread-pool
+hop per piece; deployments that serve many range requests (progressive viewers,
+resumed downloads) should set ARTIFACT_ACCEL_REDIRECT_PREFIX, so that nginx answers
+them with sendfile().
+"""
+import os
+import re
+import stat
+import logging
+import mimetypes
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+log = logging.getLogger(__name__)
+
+# Internal nginx location that maps to DATA_DIR, e.g. "/_protected_data" (disabled if unset)
+ACCEL_REDIRECT_PREFIX = os.getenv("ARTIFACT_ACCEL_REDIRECT_PREFIX", "").rstrip("/")
+CACHE_CONTROL = os.getenv("ARTIFACT_CACHE_CONTROL", "public, max-age=3600")
+RANGE_CHUNK_SIZE = 1024 * 1024
+
+# Precompressed siblings, in order of preference
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+mimetypes.add_type("application/octet-stream", ".splat")
+mimetypes.add_type("application/octet-stream", ".csplat")
+mimetypes.add_type("application/octet-stream", ".ply")
+
+
+def make_etag(stat_result: os.stat_result, encoding: Optional[str] = None) -> str:
+    """Strong ETag from inode, size and mtime; outputs are only ever replaced by rename, never rewritten."""
+    tag = f"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+    if encoding:
+        tag += f"-{encoding}"
+    return f'"{tag}"'
+
+
+def etag_matches(header_value: Optional[str], etag: str) -> bool:
+    """Evaluates an If-None-Match header (weak comparison, as RFC 9110 requires for it)."""
+    if not header_value:
+        return False
+    if header_value.strip() == "*":
+        return True
+    candidates = [c.strip() for c in header_value.split(",")]
+    return any(c.removeprefix("W/") == etag for c in candidates)
+
+
+def parse_range(header_value: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single byte range into an inclusive (start, end) pair.
+    Returns None when the header should be ignored (unsupported or multiple ranges),
+    raises 416 when the range cannot be satisfied.
+    """
+    match = _RANGE_PATTERN.match(header_value.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise _range_not_satisfiable(size)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise _range_not_satisfiable(size)
+    return start, end
+
+
+def _range_not_satisfiable(size: int) -> HTTPException:
+    return HTTPException(
+        status_code=416, # Range Not Satisfiable (constant name differs across Starlette versions)
+        detail="Requested range not satisfiable",
+        headers={"Content-Range": f"bytes */{size}"},
+    )
+
+
+def accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(name.lower())
+    return accepted
+
+
+def resolve_artifact(output_dir: Path, relative_path: str) -> Path:
+    """Resolves a path inside a job output directory, refusing anything that escapes it."""
+    root = output_dir.resolve()
+    path = (root / relative_path).resolve()
+    if not path.is_relative_to(root) or path == root:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Artifact not found")
+    return path
+
+
+async def _stat_file(path: Path) -> Optional[os.stat_result]:
+    try:
+        stat_result = await aiofiles.os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return stat_result if stat.S_ISREG(stat_result.st_mode) else None
+
+
+async def _read_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    remaining = end - start + 1
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        while remaining > 0:
+            chunk = await f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def serve_artifact(request: Request, path: Path, data_dir: Path,
+                         download_name: Optional[str] = None, extra_headers: Optional[dict] = None) -> Response:
+    """Builds the response for one artifact file, honouring conditional, range and encoding headers."""
+    stat_result = await _stat_file(path)
+    if stat_result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Artifact not found")
+
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+
+    # Precompressed sibling, only for whole-file responses (ranges always address the identity encoding)
+    serve_path, encoding = path, None
+    if not range_header:
+        accepted = accepted_encodings(request)
+        for name, suffix in PRECOMPRESSED_ENCODINGS:
+            if name in accepted:
+                sibling = path.with_name(path.name + suffix)
+                sibling_stat = await _stat_file(sibling)
+                if sibling_stat is not None and sibling_stat.st_mtime_ns >= stat_result.st_mtime_ns:
+                    serve_path, encoding, stat_result = sibling, name, sibling_stat
+                    break
+
+    etag = make_etag(stat_result, encoding)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if extra_headers:
+        headers.update(extra_headers)
+    if download_name:
+        headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if ACCEL_REDIRECT_PREFIX:
+        # nginx sends the file with sendfile() and answers Range requests itself; the body here stays empty
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        headers["X-Accel-Redirect"] = f"{ACCEL_REDIRECT_PREFIX}/{serve_path.relative_to(data_dir.resolve()).as_posix()}"
+        return Response(media_type=media_type, headers=headers)
+
+    byte_range = None
+    if range_header:
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag:
+            byte_range = parse_range(range_header, stat_result.st_size)
+
+    if byte_range is not None:
+        # Copied through Python, not zero-copy (see the module docstring)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(_read_range(path, start, end), status_code=status.HTTP_206_PARTIAL_CONTENT,
+                                 media_type=media_type, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(serve_path, media_type=media_type, headers=headers, stat_result=stat_result)
@@ -27,6 +27,9 @@ if not DATABASE_URL.startswith("postgresql+asyncpg://"):
     elif DATABASE_URL.startswith("postgresql://"):
         DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
         log.warning("Assuming asyncpg driver for DATABASE_URL.")
+    elif DATABASE_URL.startswith("sqlite+aiosqlite://"):
+        # Local stand-in (benchmarks/bench_e2e.py); Postgres-only features such as job events are off
+        log.warning("Using SQLite for DATABASE_URL: for local benchmarks only.")
     else:
         log.error(f"Invalid DATABASE_URL scheme for async operations: {DATABASE_URL}")
         raise ValueError("DATABASE_URL must use the 'postgresql+asyncpg://' driver scheme for asynchronous operations.")
@@ -0,0 +1,136 @@
+# interface/app/dedupe.py
+"""
+Content-hash deduplication of uploaded videos.
+
+Input videos are indexed by SHA-256 in a content-addressed store under
+data/cas/sha256/, so identical uploads share one copy on disk. A job whose
+input hash and processing parameters match an already COMPLETED job reuses
+that job's outputs through hard links instead of running the pipeline again.
+"""
+import os
+import shutil
+import hashlib
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from .models import Job, JobStatus
+
+log = logging.getLogger(__name__)
+
+HASH_READ_SIZE = 4 * 1024 * 1024
+
+
+def cas_path(data_dir: Path, content_hash: str) -> Path:
+    return data_dir / "cas" / "sha256" / content_hash[:2] / content_hash
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst) # Different filesystem or links not supported
+
+
+def _store_input(data_dir: Path, path: Path, content_hash: str) -> None:
+    blob = cas_path(data_dir, content_hash)
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    if blob.exists():
+        # Already stored: replace our copy with a link to the stored one
+        tmp_path = path.with_name(path.name + ".cas")
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
+            return
+        os.replace(tmp_path, path)
+    else:
+        try:
+            os.link(path, blob)
+        except FileExistsError:
+            pass # Stored concurrently by another upload of the same video
+        except OSError as e:
+            log.warning(f"Could not add {path} to the content-addressed store: {e}")
+
+
+async def store_input(data_dir: Path, path: Path, content_hash: str) -> None:
+    """Adds an input video to the content-addressed store, sharing one inode between duplicates."""
+    await run_in_threadpool(_store_input, data_dir, path, content_hash)
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_READ_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def hash_file(path: Path) -> str:
+    """SHA-256 of a file, computed off the event loop."""
+    return await run_in_threadpool(_hash_file, path)
+
+
+async def find_completed_duplicate(session: AsyncSession, job_id: str, content_hash: str,
+                                   num_frames: int, iterations: int, matcher: Optional[str]) -> Optional[Job]:
+    """
+    Returns the most recent COMPLETED job with the same input and processing parameters.
+    A NULL matcher means automatic selection, the same as "auto".
+    """
+    stmt = (
+        select(Job)
+        .where(
+            Job.content_hash == content_hash,
+            Job.num_frames == num_frames,
+            Job.iterations == iterations,
+            func.coalesce(Job.matcher, "auto") == (matcher or "auto"),
+            Job.status == JobStatus.COMPLETED,
+            Job.output_splat_path.is_not(None),
+            Job.jobid != job_id,
+        )
+        .order_by(Job.completed_at.desc())
+        .limit(1)
+    )
+    result = await session.execute(stmt)
+    return result.scalars().first()
+
+
+def _link_tree(src_dir: Path, dst_dir: Path) -> int:
+    linked = 0
+    for root, _, files in os.walk(src_dir):
+        target_root = dst_dir / Path(root).relative_to(src_dir)
+        target_root.mkdir(parents=True, exist_ok=True)
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            target = target_root / name
+            if not target.exists():
+                _link_or_copy(Path(root) / name, target)
+                linked += 1
+    return linked
+
+
+def _rebase_path(path: Optional[str], source_job_id: str, job_id: str) -> Optional[str]:
+    if not path:
+        return path
+    parts = Path(path).parts
+    if parts and parts[0] == source_job_id:
+        return str(Path(job_id, *parts[1:]))
+    return path
+
+
+async def reuse_job_outputs(session: AsyncSession, data_dir: Path, job_id: str, source: Job) -> None:
+    """Hard-links the outputs of `source` into the new job and marks it COMPLETED."""
+    linked = await run_in_threadpool(_link_tree, data_dir / source.jobid / "output", data_dir / job_id / "output")
+    async with session.begin():
+        job = await session.get(Job, job_id)
+        job.status = JobStatus.COMPLETED
+        job.source_jobid = source.jobid
+        job.output_splat_path = _rebase_path(source.output_splat_path, source.jobid, job_id)
+        job.output_compressed_path = _rebase_path(source.output_compressed_path, source.jobid, job_id)
+        job.completed_at = datetime.now(timezone.utc)
+    log.info(f"[Job {job_id}] Reused {linked} output files of completed duplicate job {source.jobid}; pipeline not dispatched.")
@@ -0,0 +1,134 @@
+# interface/app/events.py
+"""
+Job change events from Postgres LISTEN/NOTIFY, fanned out to Server-Sent Events clients.
+
+A trigger on the job table (migration 7b3d9e1f4a26) sends a JSON payload on channel
+'job_events' whenever a job is created or its status, stage or progress changes.
+This process keeps ONE asyncpg connection listening on that channel, whatever the
+number of clients. Each SSE client gets a bounded in-memory queue, subscribed to one job
+or to all jobs. No client ever queries the database for updates.
+
+A slow client never blocks the listener: when its queue is full, the oldest event is
+dropped. Later events carry the full state of a job, so dropping one only skips an
+intermediate value. If the listener connection is lost, it reconnects with backoff and
+then sends every client a 'resync' event, because notifications during the gap are gone.
+"""
+import asyncio
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set
+
+import asyncpg
+
+log = logging.getLogger(__name__)
+
+JOB_EVENTS_CHANNEL = "job_events"
+JOB_EVENTS_QUEUE_SIZE = int(os.getenv("JOB_EVENTS_QUEUE_SIZE", 100))
+JOB_EVENTS_RECONNECT_MAX_SECONDS = float(os.getenv("JOB_EVENTS_RECONNECT_MAX_SECONDS", 30))
+
+RESYNC_EVENT = {"type": "resync"}
+
+
+def asyncpg_dsn(database_url: str) -> str:
+    """SQLAlchemy URL (postgresql+asyncpg://...) to a plain libpq DSN asyncpg.connect accepts."""
+    return database_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+class JobEventHub:
+    def __init__(self, dsn: str, channel: str = JOB_EVENTS_CHANNEL, queue_size: int = JOB_EVENTS_QUEUE_SIZE):
+        self.dsn = dsn
+        self.channel = channel
+        self.queue_size = queue_size
+        self._all: Set[asyncio.Queue] = set() # Subscribed to every job
+        self._by_job: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.connected = asyncio.Event()
+
+    # --- Subscriptions ---
+
+    @contextmanager
+    def subscribe(self, job_id: Optional[str] = None) -> Iterator[asyncio.Queue]:
+        """Queue of events for one job (or all jobs if `job_id` is None), for the duration of the block."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        subscribers = self._all if job_id is None else self._by_job.setdefault(job_id, set())
+        subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers.discard(queue)
+            if job_id is not None and not subscribers:
+                self._by_job.pop(job_id, None)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._all) + sum(len(queues) for queues in self._by_job.values())
+
+    def publish(self, event: dict, job_id: Optional[str] = None) -> None:
+        """Delivers an event to the subscribers of `job_id` and of all jobs (everyone if `job_id` is None)."""
+        if job_id is None:
+            targets = [self._all, *self._by_job.values()]
+        else:
+            targets = [self._all, self._by_job.get(job_id, ())]
+        for queues in targets:
+            for queue in queues:
+                if queue.full():
+                    queue.get_nowait() # Drop the oldest; later events carry the full job state
+                queue.put_nowait(event)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            log.warning(f"Job events: ignoring malformed payload: {payload[:200]}")
+            return
+        self.publish({"type": "job", **event}, event.get("jobid"))
+
+    # --- Listener connection ---
+
+    async def start(self) -> None:
+        if not self.dsn.startswith("postgresql"):
+            log.warning("Job events: LISTEN/NOTIFY needs Postgres; event streams will stay silent.")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen(), name="job-events-listener")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self) -> None:
+        delay = 1.0
+        reconnecting = False
+        while True:
+            connection = None
+            lost = asyncio.Event()
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(self.channel, self._on_notify)
+                log.info(f"Job events: listening on '{self.channel}'.")
+                self.connected.set()
+                delay = 1.0
+                if reconnecting:
+                    self.publish(RESYNC_EVENT) # Changes during the gap were not delivered
+                await lost.wait()
+                log.warning("Job events: listener connection lost, reconnecting.")
+            except asyncio.CancelledError:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+                raise
+            except Exception as e:
+                log.error(f"Job events: listener connection failed, retrying in {delay:.0f}s: {e}")
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+            self.connected.clear()
+            reconnecting = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, JOB_EVENTS_RECONNECT_MAX_SECONDS)
@@ -0,0 +1,71 @@
+# interface/app/gallery.py
+"""
+Keyset-paginated job listing for the gallery.
+
+Jobs are listed newest first, ordered by (created_at, jobid). jobid breaks ties between
+jobs created in the same instant. A page is fetched with
+`WHERE (created_at, jobid) < cursor ORDER BY created_at DESC, jobid DESC LIMIT n`, which
+the composite indexes ix_job_created_at_jobid and ix_job_status_created_at_jobid answer by
+reading n index entries. The cost per page is therefore independent of the page number
+and of the table size, unlike OFFSET. Only the columns the gallery renders are selected,
+so the description and error_message texts are never loaded.
+"""
+import base64
+import binascii
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Job, JobStatus
+
+GALLERY_PAGE_SIZE = 24
+GALLERY_MAX_PAGE_SIZE = 100
+
+# Everything gallery.html reads from a job
+GALLERY_COLUMNS = (Job.jobid, Job.name, Job.status, Job.current_stage, Job.progress, Job.queue_position,
+                   Job.gpu_eta_at, Job.created_at)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class GalleryPage:
+    jobs: Sequence[Row]
+    next_cursor: Optional[str] # None on the last page
+
+
+def encode_cursor(created_at: datetime, jobid: str) -> str:
+    """Opaque cursor for the position after (created_at, jobid)."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{jobid}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, jobid = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), jobid
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+async def fetch_gallery_page(session: AsyncSession, cursor: Optional[str] = None,
+                             statuses: Optional[List[JobStatus]] = None,
+                             limit: int = GALLERY_PAGE_SIZE) -> GalleryPage:
+    """One page of jobs, newest first, after `cursor` and optionally restricted to `statuses`."""
+    limit = max(1, min(limit, GALLERY_MAX_PAGE_SIZE))
+    stmt = select(*GALLERY_COLUMNS).order_by(Job.created_at.desc(), Job.jobid.desc()).limit(limit + 1)
+    if statuses:
+        stmt = stmt.where(Job.status.in_(statuses))
+    if cursor:
+        created_at, jobid = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(Job.created_at, Job.jobid) < tuple_(created_at, jobid))
+    rows = (await session.execute(stmt)).all()
+    # One extra row tells whether there is a next page without a COUNT
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].jobid) if len(rows) > limit else None
+    return GalleryPage(jobs=rows[:limit], next_cursor=next_cursor)
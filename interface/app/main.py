@@ -1,53 +1,44 @@
 # interface/app/main.py
 import os
+import re
+import json
+import asyncio
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, AsyncIterator
 import logging
 from contextlib import asynccontextmanager
 import aiofiles
 import shutil
+import hashlib
 
 from fastapi import (
     FastAPI,
     Request,
     Form,
+    Query,
     UploadFile,
     File,
     HTTPException,
     status,
     Depends,
 )
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from celery import chain # Import chain
 
 # Import local modules
-from .database import get_async_session, engine
-from .models import Base, Job, JobStatus
+from .database import get_async_session, engine, AsyncSessionFactory, DATABASE_URL
+from .models import Base, Job, JobStatus, MATCHER_OPTIONS, JOB_PRIORITY_MIN, JOB_PRIORITY_MAX
+from .artifacts import serve_artifact, resolve_artifact
+from .events import JobEventHub, asyncpg_dsn
+from .outbox import OutboxDispatcher, enqueue_dispatch
+from .gallery import fetch_gallery_page, InvalidCursor, GALLERY_PAGE_SIZE
+from . import uploads, dedupe, dispatch, metrics
 import nanoid
 
-# Import task signatures from the worker modules
-# This relies on the worker code potentially being accessible in the interface's environment
-# during development (e.g., via mounted volumes and PYTHONPATH adjustments) or installed as a package.
-try:
-    from worker.tasks.preprocess import extract_frames_task, remove_background_task
-    from worker.tasks.colmap import (
-        feature_extraction_task,
-        feature_matching_task,
-        sparse_mapping_task,
-        image_undistortion_task
-    )
-    from worker.tasks.splatting import train_splatting_task
-    from worker.tasks.convert import convert_ply_to_splat_task
-    CAN_IMPORT_TASKS = True
-except ImportError as import_err:
-     logging.warning(f"Could not import worker tasks, Celery dispatch will be disabled: {import_err}")
-     CAN_IMPORT_TASKS = False
-
-
 # --- Logging Setup ---
 logging.basicConfig(
     level=logging.INFO,
@@ -66,8 +57,17 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         log.critical(f"Database connection failed on startup: {e}")
         # Consider if the app should exit or continue without DB
+    await job_events.start() # One LISTEN connection shared by all event stream clients
+    # Broker connection in the background: startup never waits for RabbitMQ
+    broker_warm_up = asyncio.create_task(dispatch.warm_up())
+    await outbox_dispatcher.start() # Also publishes rows left over from before a restart
+    upload_sweeper = asyncio.create_task(uploads.sweep_uploads(DATA_DIR)) # Abandoned resumable uploads
     yield
+    upload_sweeper.cancel()
+    await outbox_dispatcher.stop()
+    broker_warm_up.cancel()
     log.info("FastAPI application shutting down...")
+    await job_events.stop()
     await engine.dispose()
     log.info("Database engine disposed.")
 
@@ -97,6 +97,17 @@ DATA_DIR = APP_ROOT / "data" # /app/data in container
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 log.info(f"Data directory ensured at: {DATA_DIR}")
 
+JOB_ID_PATTERN = re.compile(r"^[a-z]{12}$") # nanoid alphabet/size used in create_job
+SPLAT_MEDIA_TYPE = "application/octet-stream"
+STREAM_CHUNK_SIZE = 1024 * 1024
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", 15))
+TERMINAL_STATUS_VALUES = {JobStatus.COMPLETED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value}
+# "chain": one Celery task per stage; "fused": the CPU stages run back to back in one task on one worker
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "chain")
+
+job_events = JobEventHub(asyncpg_dsn(DATABASE_URL))
+outbox_dispatcher = OutboxDispatcher(AsyncSessionFactory, dispatch.publish_pipelines)
+
 # --- Helper Functions ---
 def get_file_extension(filename: str) -> Optional[str]:
     """Safely get the lowercase file extension."""
@@ -106,34 +117,236 @@ def get_file_extension(filename: str) -> Optional[str]:
     except Exception:
         return None
 
+def check_job_id(job_id: str) -> str:
+    """Rejects anything that is not a job ID before it is used in a path."""
+    if not JOB_ID_PATTERN.match(job_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job_id
+
+def get_job_output_dir(job_id: str) -> Path:
+    """Returns the output directory of a job."""
+    return DATA_DIR / check_job_id(job_id) / "output"
+
+async def load_lod_manifest(job_id: str) -> dict:
+    """Reads the LOD manifest written by the build_lod task."""
+    manifest_path = get_job_output_dir(job_id) / "lod" / "index.json"
+    try:
+        async with aiofiles.open(manifest_path, 'r') as f:
+            return json.loads(await f.read())
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No LOD levels available for this job")
+
+async def stream_files(paths: List[Path]) -> AsyncIterator[bytes]:
+    """Streams files back to back in chunks."""
+    for path in paths:
+        async with aiofiles.open(path, 'rb') as f:
+            while chunk := await f.read(STREAM_CHUNK_SIZE):
+                yield chunk
+
+def job_event(job: Job) -> dict:
+    """The fields of a job that job change events carry (see interface/app/events.py)."""
+    return {
+        "type": "job",
+        "jobid": job.jobid,
+        "status": job.status.value,
+        "current_stage": job.current_stage,
+        "progress": job.progress,
+        "failed_at_step": job.failed_at_step,
+        "error_message": job.error_message[:500] if job.error_message else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "queue_position": job.queue_position,
+        "gpu_eta_at": job.gpu_eta_at.isoformat() if job.gpu_eta_at else None,
+    }
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+async def stream_job_events(request: Request, job_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Server-Sent Events of one job (or all jobs) from the shared listener. A single-job stream
+    starts with the current state and ends after a terminal status.
+    """
+    with job_events.subscribe(job_id) as queue:
+        if job_id is not None:
+            # Read after subscribing, so no change between the read and the first event is lost
+            async with AsyncSessionFactory() as session:
+                job = await session.get(Job, job_id)
+            if job is None:
+                return
+            yield format_sse(job_event(job))
+            if job.status.value in TERMINAL_STATUS_VALUES:
+                yield format_sse({"type": "end", "jobid": job_id})
+                return
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n" # Keeps proxies from closing an idle stream
+                continue
+            yield format_sse(event)
+            if job_id is not None and event.get("status") in TERMINAL_STATUS_VALUES:
+                yield format_sse({"type": "end", "jobid": job_id})
+                return
+
+def validate_video_upload(filename: Optional[str], content_type: Optional[str]) -> str:
+    """Validates the name and content type of an uploaded video. Returns its file extension."""
+    if not filename:
+        log.error("Validation failed: No filename provided.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No filename provided")
+
+    file_extension = get_file_extension(filename)
+    if not file_extension:
+         log.error(f"Validation failed: Could not determine file extension for {filename}.")
+         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not determine file extension")
+
+    if not content_type or not content_type.startswith("video/"):
+        log.error(f"Validation failed: Invalid content type '{content_type}' for {filename}.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid file type '{content_type}', must be video")
+    return file_extension
+
+def validate_matcher(matcher: Optional[str]) -> Optional[str]:
+    """Validates the per-job matcher option. Returns None for automatic selection."""
+    if matcher in (None, "", "auto"):
+        return None
+    if matcher not in MATCHER_OPTIONS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown matcher '{matcher}', must be one of {', '.join(MATCHER_OPTIONS)}")
+    return matcher
+
+def validate_priority(priority: int) -> int:
+    if not JOB_PRIORITY_MIN <= priority <= JOB_PRIORITY_MAX:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Priority must be between {JOB_PRIORITY_MIN} and {JOB_PRIORITY_MAX}")
+    return priority
+
+def get_submitter(request: Request) -> str:
+    """Who submitted a job, for GPU fair share: the X-Submitter header (set by an auth proxy) or the client address."""
+    submitter = request.headers.get("x-submitter") or (request.client.host if request.client else None) or "anonymous"
+    return submitter[:64]
+
+def generate_job_id() -> str:
+    return nanoid.generate('abcdefghijklmnopqrstuvwxyz', size=12) # Use specified alphabet
+
+async def register_job(session: AsyncSession, job_id: str, splat_name: str, description: Optional[str],
+                       original_filename: str, relative_input_video_path: Path, job_dir: Path,
+                       content_hash: Optional[str] = None, num_frames: Optional[int] = None,
+                       iterations: Optional[int] = None, matcher: Optional[str] = None,
+                       submitter: Optional[str] = None, priority: int = 0, dispatch_mode: Optional[str] = None,
+                       cleanup_on_error: bool = True) -> Job:
+    """
+    Creates the QUEUED job record and, if `dispatch_mode` is given, its outbox row in the same transaction.
+    Raises HTTP 500 on failure, removing the job directory if `cleanup_on_error`.
+    """
+    db_job: Optional[Job] = None
+    try:
+        async with session.begin(): # Use transaction block
+            new_job = Job(
+                jobid=job_id,
+                name=splat_name,
+                description=description,
+                status=JobStatus.QUEUED,
+                input_filename=original_filename,
+                input_video_path=str(relative_input_video_path),
+                content_hash=content_hash,
+                num_frames=num_frames,
+                iterations=iterations,
+                matcher=matcher,
+                submitter=submitter,
+                priority=priority,
+            )
+            session.add(new_job)
+            # Flush to get object state before commit (within transaction)
+            await session.flush()
+            await session.refresh(new_job) # Ensure all attributes (like defaults) are loaded
+            if dispatch_mode is not None:
+                enqueue_dispatch(session, job_id, dispatch_mode) # Published by the outbox dispatcher after commit
+            db_job = new_job
+        log.info(f"Successfully created database record for job {job_id}")
+        if dispatch_mode is not None:
+            outbox_dispatcher.wake()
+    except Exception as e:
+        log.error(f"Failed to create database record for job {job_id}: {e}", exc_info=True)
+        if cleanup_on_error:
+            shutil.rmtree(job_dir, ignore_errors=True) # Attempt cleanup
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not create job record in database.")
+
+    if not db_job:
+        log.critical(f"Job object is None after successful DB transaction for job {job_id}. This should not happen.")
+        if cleanup_on_error:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve job details after creation.")
+
+    return db_job
+
+async def find_duplicate(session: AsyncSession, job_id: str, content_hash: str,
+                         num_frames: int, iterations: int, matcher: Optional[str]) -> Optional[Job]:
+    """The COMPLETED job whose outputs a new job can reuse, if any. Errors only mean no reuse."""
+    try:
+        async with session.begin():
+            return await dedupe.find_completed_duplicate(session, job_id, content_hash, num_frames, iterations, matcher)
+    except Exception as e:
+        # Dedupe is an optimisation only: fall back to processing the job
+        log.error(f"[Job {job_id}] Could not look up duplicate jobs, dispatching pipeline: {e}", exc_info=True)
+        return None
+
+async def reuse_duplicate(session: AsyncSession, job_id: str, source: Job) -> Optional[str]:
+    """
+    Reuses the outputs of `source` for a job registered without dispatch. If that fails, the pipeline
+    is queued through the outbox after all. Returns the source job ID when outputs were reused.
+    """
+    try:
+        await dedupe.reuse_job_outputs(session, DATA_DIR, job_id, source)
+        return source.jobid
+    except Exception as e:
+        log.error(f"[Job {job_id}] Could not reuse outputs of a duplicate job, dispatching pipeline: {e}", exc_info=True)
+        await session.rollback()
+    async with session.begin():
+        enqueue_dispatch(session, job_id, PIPELINE_MODE)
+    outbox_dispatcher.wake()
+    return None
+
 # --- Routes ---
 
 @app.get("/", response_class=HTMLResponse, name="serve_create_page")
 async def serve_create_page(request: Request):
     """Serves the main page with the upload form."""
-    return templates.TemplateResponse("create.html", {"request": request})
+    return templates.TemplateResponse(request, "create.html")
 
 
 @app.get("/gallery", response_class=HTMLResponse, name="serve_gallery_page")
 async def serve_gallery_page(
     request: Request,
+    cursor: Optional[str] = None,
+    job_status: List[str] = Query([], alias="status"),
+    limit: int = GALLERY_PAGE_SIZE,
     session: AsyncSession = Depends(get_async_session)
 ):
-    """Serves the gallery page, fetching jobs from the database."""
-    job_list: List[Job] = []
+    """Serves one page of the gallery, newest jobs first. `cursor` comes from the previous page's next link."""
+    try:
+        statuses = [JobStatus(value) for value in job_status if value] # "" is the "All" option
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown status, must be one of {', '.join(s.value for s in JobStatus)}")
+
+    job_list = []
+    next_url: Optional[str] = None
     error_message: Optional[str] = None
     try:
-        stmt = select(Job).order_by(Job.created_at.desc())
-        result = await session.execute(stmt)
-        job_list = result.scalars().all()
+        async with session.begin():
+            page = await fetch_gallery_page(session, cursor, statuses, limit)
+        job_list = page.jobs
+        if page.next_cursor:
+            next_url = str(request.url.include_query_params(cursor=page.next_cursor))
         log.info(f"Fetched {len(job_list)} jobs for gallery.")
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         log.error(f"Error fetching jobs from database: {e}", exc_info=True)
         error_message = "Could not fetch job list from database."
 
     return templates.TemplateResponse(
-        "gallery.html",
-        {"request": request, "jobs": job_list, "error_message": error_message}
+        request, "gallery.html",
+        {"jobs": job_list, "next_url": next_url, "error_message": error_message,
+         "statuses": [s.value for s in JobStatus], "selected_statuses": job_status}
     )
 
 
@@ -145,31 +358,24 @@ async def create_job(
     description: Optional[str] = Form(None),
     num_frames: int = Form(...),
     iterations: int = Form(...),
+    matcher: Optional[str] = Form(None),
+    priority: int = Form(0),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
-    Handles the form submission: Validates, saves file, creates DB record,
-    dispatches Celery chain, updates DB with task ID, and redirects.
+    Handles the form submission: Validates, saves file, creates the DB record together with its
+    outbox row (the Celery chain is published in the background), and redirects.
     """
     log.info("--- Received Job Creation Request ---")
 
     # --- 1. Validation ---
-    if not video_file.filename:
-        log.error("Validation failed: No filename provided.")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No filename provided")
-
+    file_extension = validate_video_upload(video_file.filename, video_file.content_type)
+    matcher = validate_matcher(matcher)
+    priority = validate_priority(priority)
     original_filename = video_file.filename
-    file_extension = get_file_extension(original_filename)
-    if not file_extension:
-         log.error(f"Validation failed: Could not determine file extension for {original_filename}.")
-         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not determine file extension")
-
-    if not video_file.content_type or not video_file.content_type.startswith("video/"):
-        log.error(f"Validation failed: Invalid content type '{video_file.content_type}' for {original_filename}.")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid file type '{video_file.content_type}', must be video")
 
     # --- 2. Generate Job ID and Paths ---
-    job_id = nanoid.generate('abcdefghijklmnopqrstuvwxyz', size=12) # Use specified alphabet
+    job_id = generate_job_id()
     log.info(f"Generated Job ID: {job_id}")
     target_filename = f"input{file_extension}"
     job_dir = DATA_DIR / job_id
@@ -189,12 +395,15 @@ async def create_job(
         log.error(f"Failed to create directories for job {job_id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not create job directories.")
 
-    # --- 4. Save Uploaded File Asynchronously ---
+    # --- 4. Save Uploaded File Asynchronously, hashing it on the way ---
+    digest = hashlib.sha256()
     try:
         async with aiofiles.open(full_input_video_path, 'wb') as out_file:
             while content := await video_file.read(1024 * 1024): # Read in 1MB chunks
+                await run_in_threadpool(digest.update, content) # hashlib releases the GIL for large buffers
                 await out_file.write(content)
-        log.info(f"Successfully saved uploaded video to {full_input_video_path}")
+        content_hash = digest.hexdigest()
+        log.info(f"Successfully saved uploaded video to {full_input_video_path} (sha256 {content_hash})")
     except Exception as e:
         log.error(f"Failed to save uploaded file for job {job_id}: {e}", exc_info=True)
         shutil.rmtree(job_dir, ignore_errors=True) # Attempt cleanup
@@ -203,98 +412,16 @@ async def create_job(
         await video_file.close()
         log.debug(f"Closed upload file handle for {original_filename}")
 
-    # --- 5. Create Job Record in Database ---
-    db_job: Optional[Job] = None
-    try:
-        async with session.begin(): # Use transaction block
-            new_job = Job(
-                jobid=job_id,
-                name=splat_name,
-                description=description,
-                status=JobStatus.QUEUED,
-                input_filename=original_filename,
-                input_video_path=str(relative_input_video_path),
-            )
-            session.add(new_job)
-            # Flush to get object state before commit (within transaction)
-            await session.flush()
-            await session.refresh(new_job) # Ensure all attributes (like defaults) are loaded
-            db_job = new_job
-        log.info(f"Successfully created database record for job {job_id}")
-    except Exception as e:
-        log.error(f"Failed to create database record for job {job_id}: {e}", exc_info=True)
-        shutil.rmtree(job_dir, ignore_errors=True) # Attempt cleanup
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not create job record in database.")
-
-    if not db_job:
-        log.critical(f"Job object is None after successful DB transaction for job {job_id}. This should not happen.")
-        shutil.rmtree(job_dir, ignore_errors=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve job details after creation.")
+    await dedupe.store_input(DATA_DIR, full_input_video_path, content_hash)
 
-    # --- 6. Define and Dispatch Celery Chain ---
-    celery_task_id: Optional[str] = None
-    if CAN_IMPORT_TASKS:
-        try:
-            # Define the granular pipeline chain
-            pipeline = chain(
-                extract_frames_task.s(job_id).set(queue='cpu_queue') |
-                remove_background_task.s(job_id).set(queue='cpu_queue') | # Route as needed
-                feature_extraction_task.s(job_id).set(queue='cpu_queue') |
-                feature_matching_task.s(job_id).set(queue='cpu_queue') |
-                sparse_mapping_task.s(job_id).set(queue='cpu_queue') | # Check if needs GPU later
-                image_undistortion_task.s(job_id).set(queue='cpu_queue') |
-                train_splatting_task.s(job_id).set(queue='gpu_queue') |  # Route to GPU
-                convert_ply_to_splat_task.s(job_id).set(queue='cpu_queue')
-            )
-
-            task_result = pipeline.apply_async()
-            celery_task_id = task_result.id
-            log.info(f"Dispatched Celery chain for job {job_id}. Task ID: {celery_task_id}")
-
-        except Exception as e:
-            log.error(f"Failed to dispatch Celery chain for job {job_id}: {e}", exc_info=True)
-            # Attempt to mark job as FAILED in DB if dispatch fails
-            try:
-                 async with session.begin():
-                     job_to_fail = await session.get(Job, job_id) # Fetch fresh object
-                     if job_to_fail:
-                         job_to_fail.status = JobStatus.FAILED
-                         job_to_fail.failed_at_step = "dispatch"
-                         job_to_fail.error_message = f"Failed to queue tasks: {str(e)[:450]}"
-                         log.info(f"Set job {job_id} status to FAILED due to dispatch error.")
-                     else: log.error(f"Could not find job {job_id} to mark as FAILED after dispatch error.")
-            except Exception as db_e: log.error(f"[Job {job_id}] CRITICAL: Failed to update job status to FAILED after dispatch error: {db_e}", exc_info=True)
-            # Decide if to raise HTTP 500 or just redirect with job marked as failed
-            # raise HTTPException(status_code=500, detail="Failed to queue processing tasks.")
-    else:
-         log.error(f"Cannot dispatch Celery chain for job {job_id}: Worker tasks could not be imported.")
-         # Mark job as FAILED because processing cannot start
-         try:
-             async with session.begin():
-                 job_to_fail = await session.get(Job, job_id)
-                 if job_to_fail:
-                     job_to_fail.status = JobStatus.FAILED
-                     job_to_fail.failed_at_step = "import"
-                     job_to_fail.error_message = "Interface could not import worker tasks."
-                     log.info(f"Set job {job_id} status to FAILED due to task import error.")
-                 else: log.error(f"Could not find job {job_id} to mark as FAILED after import error.")
-         except Exception as db_e: log.error(f"[Job {job_id}] CRITICAL: Failed to update job status to FAILED after import error: {db_e}", exc_info=True)
-
-
-    # --- 7. Update Job Record with Celery Task ID ---
-    if celery_task_id:
-        try:
-            async with session.begin():
-                 job_to_update = await session.get(Job, job_id) # Fetch fresh object
-                 if job_to_update:
-                    job_to_update.celery_task_id = celery_task_id
-                    log.info(f"Successfully updated job {job_id} with Celery task ID.")
-                 else:
-                    # This indicates a potential problem if the job disappears between creation and update
-                    log.error(f"Could not find job {job_id} to update with Celery task ID {celery_task_id}.")
-        except Exception as e:
-            log.error(f"Failed to update job {job_id} with Celery task ID {celery_task_id}: {e}", exc_info=True)
-            # Job is already queued, log error but don't stop the redirect
+    # --- 5-7. Create Job Record with its Dispatch (outbox) in One Transaction, or Reuse a Duplicate's Outputs ---
+    source = await find_duplicate(session, job_id, content_hash, num_frames, iterations, matcher)
+    await register_job(session, job_id, splat_name, description, original_filename, relative_input_video_path, job_dir,
+                       content_hash=content_hash, num_frames=num_frames, iterations=iterations, matcher=matcher,
+                       submitter=get_submitter(request), priority=priority,
+                       dispatch_mode=None if source else PIPELINE_MODE)
+    if source:
+        await reuse_duplicate(session, job_id, source)
 
     # --- 8. Redirect to Gallery ---
     redirect_url = request.url_for('serve_gallery_page')
@@ -303,9 +430,184 @@ async def create_job(
     return RedirectResponse(url=redirect_url, status_code=status.HTTP_303_SEE_OTHER)
 
 
+# --- Resumable Uploads ---
+# POST /uploads -> PUT /uploads/{id}?offset=N (any order, in parallel) -> POST /uploads/{id}/finalize
+# The job is only created and dispatched at finalize.
+
+@app.post("/uploads", status_code=status.HTTP_201_CREATED, name="init_upload")
+async def init_upload(
+    request: Request,
+    filename: str = Form(...),
+    size: int = Form(...),
+    content_type: str = Form(...),
+    splat_name: str = Form(...),
+    description: Optional[str] = Form(None),
+    num_frames: int = Form(...),
+    iterations: int = Form(...),
+    matcher: Optional[str] = Form(None),
+    priority: int = Form(0),
+    chunk_size: Optional[int] = Form(None),
+):
+    """Starts a resumable upload and preallocates the input file. The upload ID is the future job ID."""
+    file_extension = validate_video_upload(filename, content_type)
+    matcher = validate_matcher(matcher)
+    priority = validate_priority(priority)
+    upload_id = generate_job_id()
+    state = await uploads.init_upload(DATA_DIR, upload_id, size, chunk_size, {
+        "filename": filename,
+        "content_type": content_type,
+        "target_filename": f"input{file_extension}",
+        "splat_name": splat_name,
+        "description": description,
+        "num_frames": num_frames,
+        "iterations": iterations,
+        "matcher": matcher,
+        "priority": priority,
+        "submitter": get_submitter(request),
+    })
+    return {
+        **state.describe(),
+        "upload_url": str(request.url_for("upload_chunk", upload_id=upload_id)),
+        "finalize_url": str(request.url_for("finalize_upload", upload_id=upload_id)),
+    }
+
+
+@app.put("/uploads/{upload_id}", name="upload_chunk")
+async def upload_chunk(request: Request, upload_id: str, offset: int):
+    """
+    Writes one chunk (raw request body) at `offset`, which must be a multiple of the chunk size.
+    The X-Chunk-SHA256 header (hex) must match the body; mismatching chunks are rejected with 422.
+    """
+    state = await uploads.load_upload(DATA_DIR, check_job_id(upload_id))
+    index = await uploads.write_chunk(state, offset, request.stream(), request.headers.get("x-chunk-sha256"))
+    return {"upload_id": upload_id, "chunk": index, "offset": offset}
+
+
+@app.get("/uploads/{upload_id}", name="get_upload")
+async def get_upload(upload_id: str):
+    """Reports received and missing chunks, so an interrupted client knows what to resend."""
+    state = await uploads.load_upload(DATA_DIR, check_job_id(upload_id))
+    return state.describe()
+
+
+@app.post("/uploads/{upload_id}/finalize", status_code=status.HTTP_201_CREATED, name="finalize_upload")
+async def finalize_upload(
+    request: Request,
+    upload_id: str,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Assembles the upload, creates the job record and dispatches the pipeline. Concurrent calls
+    for one upload run one at a time, so the later ones find the job and return it.
+    """
+    state = await uploads.load_upload(DATA_DIR, check_job_id(upload_id))
+    job_id = upload_id
+    gallery_url = str(request.url_for('serve_gallery_page'))
+
+    async with uploads.finalize_lock(state) as state:
+        # Finalize is idempotent: a retried request returns the job that was already created
+        existing_job = await session.get(Job, job_id)
+        if existing_job is not None:
+            return {"job_id": job_id, "status": existing_job.status.value, "gallery_url": gallery_url}
+        await session.rollback() # End the implicit transaction started by the lookup
+
+        final_path = await uploads.finalize_upload(state)
+        relative_input_video_path = final_path.relative_to(DATA_DIR)
+        # Chunks arrive out of order, so the hash needs one sequential pass over the assembled file
+        content_hash = await dedupe.hash_file(final_path)
+        await dedupe.store_input(DATA_DIR, final_path, content_hash)
+        num_frames, iterations, matcher = state.data["num_frames"], state.data["iterations"], state.data.get("matcher")
+        source = await find_duplicate(session, job_id, content_hash, num_frames, iterations, matcher)
+        await register_job(session, job_id, state.data["splat_name"], state.data.get("description"),
+                           state.data["filename"], relative_input_video_path, DATA_DIR / job_id,
+                           content_hash=content_hash, num_frames=num_frames, iterations=iterations,
+                           matcher=matcher, submitter=state.data.get("submitter"),
+                           priority=state.data.get("priority", 0), dispatch_mode=None if source else PIPELINE_MODE,
+                           cleanup_on_error=False) # Keep the assembled upload so finalize can be retried
+        source_job_id = await reuse_duplicate(session, job_id, source) if source else None
+        log.info(f"Job {job_id} created from resumable upload ({state.size} bytes).")
+        async with session.begin():
+            job_status = (await session.get(Job, job_id)).status # Reflects reuse
+        return {"job_id": job_id, "status": job_status.value, "source_job_id": source_job_id, "gallery_url": gallery_url}
+
+
+@app.get("/jobs/{job_id}", name="get_job")
+async def get_job(job_id: str, session: AsyncSession = Depends(get_async_session)):
+    """Status, progress, and while waiting for the GPU the queue position and estimated end of training."""
+    async with session.begin():
+        job = await session.get(Job, check_job_id(job_id))
+        if job is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+        return {**job_event(job), "name": job.name, "priority": job.priority}
+
+
+# --- Job Events (Server-Sent Events) ---
+# Pushed from Postgres NOTIFY through one shared listener connection; clients never poll.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.get("/events/jobs", name="stream_all_job_events")
+async def stream_all_job_events(request: Request):
+    """Streams status and progress changes of all jobs. A 'resync' event means changes may have been missed."""
+    return StreamingResponse(stream_job_events(request), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/jobs/{job_id}/events", name="stream_job_events")
+async def stream_one_job_events(request: Request, job_id: str, session: AsyncSession = Depends(get_async_session)):
+    """Streams the current state of a job, then its changes until it completes, fails or is cancelled."""
+    async with session.begin():
+        exists = await session.scalar(select(Job.jobid).where(Job.jobid == check_job_id(job_id)))
+    if exists is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return StreamingResponse(stream_job_events(request, job_id), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/jobs/{job_id}/lod", name="stream_lod")
+async def stream_lod(job_id: str, finest: int = 0):
+    """
+    Streams the LOD levels of a job coarse-to-fine as one .splat byte stream, down to level `finest`.
+    X-Splat-Lod-Levels / X-Splat-Lod-Counts list the levels and their record counts in stream order,
+    so a client can render the first level as soon as it arrives and replace it when the next completes.
+    """
+    manifest = await load_lod_manifest(job_id)
+    lod_dir = get_job_output_dir(job_id) / "lod"
+    levels = sorted((lvl for lvl in manifest["levels"] if lvl["level"] >= finest), key=lambda lvl: -lvl["level"])
+    if not levels:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No LOD level >= {finest} for this job")
+
+    headers = {
+        "Content-Length": str(sum(lvl["bytes"] for lvl in levels)),
+        "X-Splat-Lod-Levels": ",".join(str(lvl["level"]) for lvl in levels),
+        "X-Splat-Lod-Counts": ",".join(str(lvl["count"]) for lvl in levels),
+    }
+    paths = [lod_dir / lvl["file"] for lvl in levels]
+    return StreamingResponse(stream_files(paths), media_type=SPLAT_MEDIA_TYPE, headers=headers)
+
+
+@app.get("/jobs/{job_id}/lod/{level}", name="serve_lod_level")
+async def serve_lod_level(request: Request, job_id: str, level: int):
+    """Serves a single LOD level (0 = full resolution) as a .splat file."""
+    manifest = await load_lod_manifest(job_id)
+    entry = next((lvl for lvl in manifest["levels"] if lvl["level"] == level), None)
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"LOD level {level} not found")
+    path = resolve_artifact(get_job_output_dir(job_id), f"lod/{entry['file']}")
+    return await serve_artifact(request, path, DATA_DIR, download_name=f"{job_id}_lod{level}.splat",
+                                extra_headers={"X-Splat-Count": str(entry["count"])})
+
+
+@app.get("/jobs/{job_id}/output/{artifact_path:path}", name="serve_job_artifact")
+async def serve_job_artifact(request: Request, job_id: str, artifact_path: str):
+    """
+    Serves a file from data/<jobid>/output/ with ETag/If-None-Match, byte ranges,
+    precompressed .br/.gz siblings and zero-copy transfer where the server supports it.
+    """
+    path = resolve_artifact(get_job_output_dir(job_id), artifact_path)
+    return await serve_artifact(request, path, DATA_DIR)
+
+
 @app.get("/health")
 async def health_check(session: AsyncSession = Depends(get_async_session)):
-    """Basic health check including database connectivity."""
+    """Basic health check including database connectivity and the last known broker state."""
     db_status = "connected"
     try:
         # Simple query to ensure connection is truly working
@@ -315,4 +617,14 @@ async def health_check(session: AsyncSession = Depends(get_async_session)):
         log.warning(f"Health check DB query failed: {e}", exc_info=True) # Use warning for health check failure
         db_status = "disconnected/error"
 
-    return {"status": "ok", "database": db_status}
+    # No broker I/O here: the state of the last publish or connection attempt
+    return {"status": "ok", "database": db_status, "broker": dispatch.broker_state}
+
+
+@app.get("/metrics")
+async def serve_metrics(session: AsyncSession = Depends(get_async_session)):
+    """Prometheus metrics: per-stage percentiles from the job_stage table and queue depths (see app/metrics.py)."""
+    queue_depths = await run_in_threadpool(dispatch.queue_depths)
+    async with session.begin():
+        body = await metrics.collect(session, queue_depths)
+    return Response(content=body, media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,102 @@
+# interface/app/metrics.py
+"""
+Prometheus metrics for GET /metrics, in the text exposition format.
+
+Stage metrics come from the job_stage table (written by worker/stage_metrics.py) and
+cover the successful runs that finished in the last METRICS_WINDOW_SECONDS. For every
+stage they give p50 and p95 of the run time, queue wait, CPU seconds, peak RSS, bytes
+read and written and GPU seconds, with their sum and count, plus the number of runs per
+outcome. Postgres computes the percentiles (percentile_cont) in one grouped query over
+the ix_job_stage_finished_at_stage index, so a scrape transfers one row per stage.
+
+Queue depths:
+- ready messages per broker queue (not those already reserved by workers);
+- jobs waiting for a GPU slot (held by the GPU scheduler, not in gpu_queue);
+- pipelines waiting in the dispatch outbox;
+- jobs per status.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import DispatchOutbox, Job, JobStage, JobStatus
+
+METRICS_WINDOW_SECONDS = float(os.getenv("METRICS_WINDOW_SECONDS", 24 * 3600))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+QUANTILES = (0.5, 0.95)
+
+# (job_stage column, metric, help)
+STAGE_METRICS = (
+    ("duration_seconds", "splatgen_stage_duration_seconds", "Run time of a pipeline stage."),
+    ("queue_wait_seconds", "splatgen_stage_queue_wait_seconds", "Time from publishing a stage's task to its start."),
+    ("cpu_seconds", "splatgen_stage_cpu_seconds", "CPU time (user + system) of a stage, subprocesses included."),
+    ("peak_rss_bytes", "splatgen_stage_peak_rss_bytes", "Peak resident memory during a stage."),
+    ("read_bytes", "splatgen_stage_read_bytes", "Bytes a stage read from storage."),
+    ("write_bytes", "splatgen_stage_write_bytes", "Bytes a stage wrote to storage."),
+    ("gpu_seconds", "splatgen_stage_gpu_seconds", "Time a stage held a GPU slot."),
+)
+_TERMINAL = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+def _labels(**labels: str) -> str:
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def _number(value) -> str:
+    return "NaN" if value is None else repr(float(value))
+
+
+def _stage_summary_query(since: datetime):
+    columns = [JobStage.stage]
+    for column_name, _, _ in STAGE_METRICS:
+        column = getattr(JobStage, column_name)
+        columns += [func.percentile_cont(q).within_group(column).label(f"{column_name}_p{q * 100:g}") for q in QUANTILES]
+        columns += [func.count(column).label(f"{column_name}_count"), func.sum(column).label(f"{column_name}_sum")]
+    return (select(*columns).where(JobStage.finished_at >= since, JobStage.status == "SUCCESS")
+            .group_by(JobStage.stage).order_by(JobStage.stage))
+
+
+async def collect(session: AsyncSession, queue_depths: Dict[str, int],
+                  window_seconds: float = METRICS_WINDOW_SECONDS, now: Optional[datetime] = None) -> str:
+    """All metrics as exposition text. `queue_depths` are the broker's ready messages per queue."""
+    since = (now or datetime.now(timezone.utc)) - timedelta(seconds=window_seconds)
+    lines: List[str] = []
+
+    summaries = (await session.execute(_stage_summary_query(since))).mappings().all()
+    for column_name, metric, help_text in STAGE_METRICS:
+        lines += [f"# HELP {metric} {help_text} Successful runs of the last {window_seconds:g}s.",
+                  f"# TYPE {metric} summary"]
+        for row in summaries:
+            if not row[f"{column_name}_count"]:
+                continue # Not measured for this stage (e.g. GPU seconds of CPU stages)
+            for q in QUANTILES:
+                lines.append(f"{metric}{_labels(stage=row['stage'], quantile=f'{q:g}')} {_number(row[f'{column_name}_p{q * 100:g}'])}")
+            lines.append(f"{metric}_sum{_labels(stage=row['stage'])} {_number(row[f'{column_name}_sum'])}")
+            lines.append(f"{metric}_count{_labels(stage=row['stage'])} {row[f'{column_name}_count']}")
+
+    runs = await session.execute(
+        select(JobStage.stage, JobStage.status, func.count())
+        .where(JobStage.finished_at >= since).group_by(JobStage.stage, JobStage.status).order_by(JobStage.stage))
+    lines += [f"# HELP splatgen_stage_runs Stage runs of the last {window_seconds:g}s by outcome.",
+              "# TYPE splatgen_stage_runs gauge"]
+    lines += [f"splatgen_stage_runs{_labels(stage=stage, status=run_status)} {count}" for stage, run_status, count in runs]
+
+    lines += ["# HELP splatgen_queue_messages Messages ready in a broker queue.", "# TYPE splatgen_queue_messages gauge"]
+    lines += [f"splatgen_queue_messages{_labels(queue=queue)} {count}" for queue, count in sorted(queue_depths.items())]
+
+    gpu_waiting = await session.scalar(select(func.count()).select_from(Job).where(
+        Job.gpu_enqueued_at.is_not(None), Job.gpu_started_at.is_(None), Job.status.not_in(_TERMINAL)))
+    outbox_pending = await session.scalar(select(func.count()).select_from(DispatchOutbox))
+    lines += ["# HELP splatgen_gpu_waiting_jobs Jobs whose CPU stages are done, waiting for a GPU slot.",
+              "# TYPE splatgen_gpu_waiting_jobs gauge", f"splatgen_gpu_waiting_jobs {gpu_waiting}",
+              "# HELP splatgen_outbox_pending Pipelines not yet published to the broker.",
+              "# TYPE splatgen_outbox_pending gauge", f"splatgen_outbox_pending {outbox_pending}"]
+
+    by_status = dict((await session.execute(select(Job.status, func.count()).group_by(Job.status))).all())
+    lines += ["# HELP splatgen_jobs Jobs by status.", "# TYPE splatgen_jobs gauge"]
+    lines += [f"splatgen_jobs{_labels(status=s.value)} {by_status.get(s, 0)}" for s in JobStatus]
+    return "\n".join(lines) + "\n"
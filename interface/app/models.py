@@ -1,10 +1,10 @@
 import enum
 from datetime import datetime, timezone
 from sqlalchemy import (
-    create_engine, MetaData, Table, Column, Integer, String, DateTime, Enum, Text
+    create_engine, MetaData, Table, Column, Integer, BigInteger, Float, String, DateTime, Enum, Text, Index, ForeignKey
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 
 class JobStatus(enum.Enum):
@@ -18,6 +18,12 @@ class JobStatus(enum.Enum):
     CANCELLED = "CANCELLED"
 
 
+# Per-job COLMAP matcher option (see worker/matching.py); "auto" picks from the frame count
+MATCHER_OPTIONS = ("auto", "exhaustive", "sequential", "retrieval")
+# Per-job GPU scheduling priority (see worker/gpu_scheduler.py); higher runs first
+JOB_PRIORITY_MIN, JOB_PRIORITY_MAX = -10, 10
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -37,14 +43,101 @@ class Job(Base):
     celery_task_id: Mapped[str | None] = mapped_column(Text, nullable=True, unique=True)
     input_filename: Mapped[str | None] = mapped_column(Text, nullable=True)
     input_video_path: Mapped[str | None] = mapped_column(Text, nullable=True)
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True) # SHA-256 of the input video
+    num_frames: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    iterations: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    matcher: Mapped[str | None] = mapped_column(String(16), nullable=True) # Requested matcher option
+    matching_strategy: Mapped[str | None] = mapped_column(String(32), nullable=True) # Strategy feature_matching used
+    matched_pairs: Mapped[int | None] = mapped_column(Integer, nullable=True) # Geometrically verified image pairs
+    source_jobid: Mapped[str | None] = mapped_column(String(12), nullable=True) # Set when outputs were reused from a duplicate
     output_splat_path: Mapped[str | None] = mapped_column(Text, nullable=True)
+    output_compressed_path: Mapped[str | None] = mapped_column(Text, nullable=True)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+    current_stage: Mapped[str | None] = mapped_column(String(50), nullable=True) # Stage the worker is running
+    progress: Mapped[float | None] = mapped_column(Float, nullable=True) # Of the current stage, 0-1
+    submitter: Mapped[str | None] = mapped_column(String(64), nullable=True) # Fair-share key of the GPU scheduler
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    queue_position: Mapped[int | None] = mapped_column(Integer, nullable=True) # Waiting for the GPU: 1 = next; 0 = training
+    gpu_eta_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True) # Estimated end of training
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=False, server_default=func.now()
     )
     completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True) # Last status/progress write
+    gpu_enqueued_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    gpu_started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    gpu_finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Lookup of a completed job with the same input and processing parameters
+        Index("ix_job_content_hash_params", "content_hash", "num_frames", "iterations"),
+        # Keyset pagination of the gallery, unfiltered and filtered by status (see app/gallery.py)
+        Index("ix_job_created_at_jobid", "created_at", "jobid"),
+        Index("ix_job_status_created_at_jobid", "status", "created_at", "jobid"),
+        # Waiting and running jobs of the GPU scheduler
+        Index("ix_job_gpu_queue", "gpu_started_at", "gpu_finished_at", postgresql_where=text("gpu_enqueued_at IS NOT NULL")),
+    )
 
     def __repr__(self):
         return f"<Job(jobid='{self.jobid}', name='{self.name}', status='{self.status.name}')>"
-    
\ No newline at end of file
+    
+
+
+class DispatchOutbox(Base):
+    """
+    Pipelines waiting to be published to the broker. A row is written in the same transaction as its
+    job and deleted once the chain is published (see app/outbox.py).
+    """
+    __tablename__ = "dispatch_outbox"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    jobid: Mapped[str] = mapped_column(String(12), ForeignKey("job.jobid", ondelete="CASCADE"), nullable=False, index=True)
+    mode: Mapped[str] = mapped_column(String(16), nullable=False) # PIPELINE_MODE at submission
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = (
+        Index("ix_dispatch_outbox_next_attempt_at", "next_attempt_at", "id"),
+    )
+
+    def __repr__(self):
+        return f"<DispatchOutbox(id={self.id}, jobid='{self.jobid}', attempts={self.attempts})>"
+
+
+class JobStage(Base):
+    """
+    One run of one pipeline stage (a task, or a stage of the fused CPU task), recorded by the worker when
+    it ends (see worker/stage_metrics.py). A retried or redelivered stage has several rows.
+    """
+    __tablename__ = "job_stage"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    jobid: Mapped[str] = mapped_column(String(12), ForeignKey("job.jobid", ondelete="CASCADE"), nullable=False, index=True)
+    stage: Mapped[str] = mapped_column(String(50), nullable=False) # Task name without its module, e.g. "sparse_mapping"
+    status: Mapped[str] = mapped_column(String(16), nullable=False) # Celery state: SUCCESS, FAILURE or RETRY
+    task_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    queue: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    worker: Mapped[str | None] = mapped_column(String(255), nullable=True) # Worker hostname
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    queue_wait_seconds: Mapped[float | None] = mapped_column(Float, nullable=True) # Publish to start
+    duration_seconds: Mapped[float] = mapped_column(Float, nullable=False)
+    cpu_seconds: Mapped[float | None] = mapped_column(Float, nullable=True) # User + system, child processes included
+    peak_rss_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    read_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True) # From storage, child processes included
+    write_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    gpu_seconds: Mapped[float | None] = mapped_column(Float, nullable=True) # Time holding a GPU slot
+
+    __table_args__ = (
+        Index("ix_job_stage_finished_at_stage", "finished_at", "stage"),
+    )
+
+    def __repr__(self):
+        return f"<JobStage(id={self.id}, jobid='{self.jobid}', stage='{self.stage}', status='{self.status}')>"
@@ -0,0 +1,142 @@
+# interface/app/outbox.py
+"""
+Transactional outbox for pipeline dispatch.
+
+A request that creates a job writes the job and a dispatch_outbox row in ONE transaction
+and returns without talking to the broker. Either both exist or neither does: a broker
+outage can no longer leave a QUEUED job that was never dispatched, and request latency
+does not depend on RabbitMQ.
+
+OutboxDispatcher runs in the background of every interface process. It wakes up when a
+request commits a row, or every OUTBOX_POLL_SECONDS for rows of other processes and
+retries. It then drains the outbox in batches of up to OUTBOX_BATCH_SIZE:
+- rows are locked with FOR UPDATE SKIP LOCKED, so several processes can drain concurrently;
+- the chains are published back to back in one thread hop;
+- in the same transaction, task IDs are recorded with one executemany UPDATE and
+  published rows are deleted.
+Failed rows are retried with exponential backoff. After OUTBOX_MAX_ATTEMPTS their job is
+marked FAILED at "dispatch". Delivery is at least once: if the commit fails after a
+publish, the chain is published again. The stage cache makes a repeated stage cheap.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple, Union
+
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from .models import DispatchOutbox, Job, JobStatus
+
+log = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 5))
+OUTBOX_LINGER_SECONDS = float(os.getenv("OUTBOX_LINGER_SECONDS", 0.02)) # Lets a burst of submissions share a batch
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 2))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 300))
+
+_job_table = Job.__table__
+
+
+def enqueue_dispatch(session: AsyncSession, job_id: str, mode: str) -> None:
+    """Adds a job's pipeline to the outbox, as part of the caller's transaction."""
+    session.add(DispatchOutbox(jobid=job_id, mode=mode))
+
+
+class OutboxDispatcher:
+    """
+    `publish(jobs)` publishes a list of (job_id, mode) pairs and returns a task ID or an exception
+    for each (see app/dispatch.py). It is blocking and runs in a thread.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker,
+                 publish: Callable[[List[Tuple[str, str]]], List[Union[str, Exception]]],
+                 batch_size: int = OUTBOX_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.publish = publish
+        self.batch_size = batch_size
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self) -> None:
+        """Called after a transaction with outbox rows committed."""
+        self._wake.set()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="outbox-dispatcher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.drain_once() == self.batch_size:
+                    pass # Full batch: more rows are probably waiting
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Outbox: drain failed, retrying in {OUTBOX_POLL_SECONDS:g}s: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_SECONDS)
+                await asyncio.sleep(OUTBOX_LINGER_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def drain_once(self) -> int:
+        """Publishes one batch of due outbox rows. Returns the number of rows processed."""
+        now = datetime.now(timezone.utc)
+        async with self.session_factory() as session:
+            async with session.begin():
+                rows = (await session.execute(
+                    select(DispatchOutbox)
+                    .where(DispatchOutbox.next_attempt_at <= now)
+                    .order_by(DispatchOutbox.id)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )).scalars().all()
+                if not rows:
+                    return 0
+                results = await run_in_threadpool(self.publish, [(row.jobid, row.mode) for row in rows])
+
+                published = [(row, task_id) for row, task_id in zip(rows, results) if not isinstance(task_id, Exception)]
+                if published:
+                    connection = await session.connection()
+                    await connection.execute( # executemany: one statement for the whole batch
+                        update(_job_table).where(_job_table.c.jobid == bindparam("b_jobid"))
+                        .values(celery_task_id=bindparam("b_task_id")),
+                        [{"b_jobid": row.jobid, "b_task_id": task_id} for row, task_id in published],
+                    )
+                    await session.execute(delete(DispatchOutbox).where(DispatchOutbox.id.in_([row.id for row, _ in published])))
+
+                for row, error in zip(rows, results):
+                    if isinstance(error, Exception):
+                        await self._record_failure(session, row, error, now)
+        log.info(f"Outbox: published {len(published)} of {len(rows)} pipeline(s).")
+        return len(rows)
+
+    async def _record_failure(self, session: AsyncSession, row: DispatchOutbox, error: Exception, now: datetime) -> None:
+        row.attempts += 1
+        row.last_error = str(error)[:1000]
+        if row.attempts < OUTBOX_MAX_ATTEMPTS:
+            delay = min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * 2 ** (row.attempts - 1))
+            row.next_attempt_at = now + timedelta(seconds=delay)
+            log.warning(f"[Job {row.jobid}] Outbox: publish attempt {row.attempts} failed, retrying in {delay:g}s: {error}")
+            return
+        log.error(f"[Job {row.jobid}] Outbox: giving up after {row.attempts} publish attempts: {error}")
+        await session.execute(update(_job_table).where(_job_table.c.jobid == row.jobid).values(
+            status=JobStatus.FAILED, failed_at_step="dispatch",
+            error_message=f"Failed to queue tasks: {str(error)[:450]}"))
+        await session.delete(row)
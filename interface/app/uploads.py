@@ -0,0 +1,338 @@
+# interface/app/uploads.py
+"""
+Resumable chunked uploads.
+
+An upload is initialised with the final size; the input file is preallocated as
+data/<jobid>/input/input<ext>.part and chunks are written into it at their offsets
+with pwrite, so any number of chunks can be in flight in parallel and a failed chunk
+is simply sent again. A chunk only counts as received once its SHA-256 matches; that
+is recorded as a marker file, which keeps the upload state consistent across
+uvicorn workers. Finalize checks that every chunk is present and renames the file
+into place. It holds an exclusive flock on the upload's lock file and chunk writes
+hold a shared one, so concurrent finalize calls run one at a time and no chunk is
+written into a finalized file. Uploads that are never finalized are removed once
+they have been idle for UPLOAD_EXPIRY_SECONDS.
+"""
+import os
+import json
+import fcntl
+import shutil
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", 20 * 1024 * 1024 * 1024))
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+# Unfinalized uploads idle for this long are removed, checked every UPLOAD_SWEEP_SECONDS
+UPLOAD_EXPIRY_SECONDS = float(os.getenv("UPLOAD_EXPIRY_SECONDS", 24 * 3600))
+UPLOAD_SWEEP_SECONDS = float(os.getenv("UPLOAD_SWEEP_SECONDS", 3600))
+
+STATE_FILENAME = "upload.json"
+LOCK_FILENAME = "upload.lock"
+CHUNKS_DIRNAME = ".chunks"
+
+
+class UploadState:
+    """Upload metadata persisted next to the partial file in data/<jobid>/input/."""
+
+    def __init__(self, input_dir: Path, data: dict):
+        self.input_dir = input_dir
+        self.data = data
+
+    @property
+    def upload_id(self) -> str:
+        return self.data["upload_id"]
+
+    @property
+    def size(self) -> int:
+        return self.data["size"]
+
+    @property
+    def chunk_size(self) -> int:
+        return self.data["chunk_size"]
+
+    @property
+    def num_chunks(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    @property
+    def part_path(self) -> Path:
+        return self.input_dir / (self.data["target_filename"] + ".part")
+
+    @property
+    def final_path(self) -> Path:
+        return self.input_dir / self.data["target_filename"]
+
+    @property
+    def chunks_dir(self) -> Path:
+        return self.input_dir / CHUNKS_DIRNAME
+
+    @property
+    def lock_path(self) -> Path:
+        return self.input_dir / LOCK_FILENAME
+
+    def idle_seconds(self, now: float) -> float:
+        """Time since the upload was created or last received data."""
+        last = self.data.get("created_at", 0.0)
+        for path in (self.part_path, self.chunks_dir):
+            try:
+                last = max(last, path.stat().st_mtime)
+            except FileNotFoundError:
+                pass
+        return now - last
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def received_chunks(self) -> List[int]:
+        try:
+            return sorted(int(name) for name in os.listdir(self.chunks_dir) if name.isdigit())
+        except FileNotFoundError:
+            return []
+
+    def describe(self) -> dict:
+        received = self.received_chunks()
+        received_set = set(received)
+        return {
+            "upload_id": self.upload_id,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "num_chunks": self.num_chunks,
+            "received": received,
+            "missing": [i for i in range(self.num_chunks) if i not in received_set],
+            "finalized": self.data.get("finalized", False),
+        }
+
+
+def _input_dir(data_dir: Path, upload_id: str) -> Path:
+    return data_dir / upload_id / "input"
+
+
+def _write_state(state: UploadState) -> None:
+    tmp_path = state.input_dir / (STATE_FILENAME + ".tmp")
+    tmp_path.write_text(json.dumps(state.data))
+    os.replace(tmp_path, state.input_dir / STATE_FILENAME)
+
+
+def _preallocate(path: Path, size: int) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        if size > 0:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, size) # Sparse fallback (e.g. filesystems without fallocate)
+    finally:
+        os.close(fd)
+
+
+async def init_upload(data_dir: Path, upload_id: str, size: int, chunk_size: Optional[int], metadata: dict) -> UploadState:
+    """Creates the upload state and the preallocated partial file."""
+    if size <= 0 or size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Upload size must be between 1 and {MAX_UPLOAD_SIZE} bytes")
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Chunk size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes")
+
+    input_dir = _input_dir(data_dir, upload_id)
+    state = UploadState(input_dir, {
+        "upload_id": upload_id,
+        "size": size,
+        "chunk_size": chunk_size,
+        "created_at": time.time(),
+        **metadata,
+    })
+
+    def _create() -> None:
+        (input_dir / CHUNKS_DIRNAME).mkdir(parents=True, exist_ok=True)
+        (data_dir / upload_id / "output").mkdir(parents=True, exist_ok=True)
+        _preallocate(state.part_path, size)
+        _write_state(state)
+
+    await run_in_threadpool(_create)
+    log.info(f"[Upload {upload_id}] Initialised: {size} bytes in {state.num_chunks} chunks of {chunk_size}.")
+    return state
+
+
+async def load_upload(data_dir: Path, upload_id: str) -> UploadState:
+    return await _load_state(_input_dir(data_dir, upload_id))
+
+
+async def _load_state(input_dir: Path) -> UploadState:
+    try:
+        async with aiofiles.open(input_dir / STATE_FILENAME, "r") as f:
+            return UploadState(input_dir, json.loads(await f.read()))
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+
+
+async def write_chunk(state: UploadState, offset: int, body: AsyncIterator[bytes], expected_sha256: Optional[str]) -> int:
+    """
+    Streams one chunk into the partial file at `offset` and verifies its SHA-256.
+    Returns the chunk index. The chunk is only marked as received when the checksum matches.
+    """
+    if not expected_sha256:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing X-Chunk-SHA256 header")
+    if offset < 0 or offset >= state.size or offset % state.chunk_size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Offset must be a multiple of {state.chunk_size} below {state.size}")
+
+    index = offset // state.chunk_size
+    # Shared with other chunks, exclusive against finalize: no chunk is written into a finalized file
+    async with _upload_lock(state, fcntl.LOCK_SH) as state:
+        if state.data.get("finalized"):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is already finalized")
+        return await _write_chunk(state, index, offset, body, expected_sha256)
+
+
+async def _write_chunk(state: UploadState, index: int, offset: int, body: AsyncIterator[bytes], expected_sha256: str) -> int:
+    expected_length = state.chunk_length(index)
+    digest = hashlib.sha256()
+    written = 0
+    buffer = bytearray()
+
+    fd = await run_in_threadpool(os.open, state.part_path, os.O_WRONLY)
+    try:
+        async for piece in body:
+            if written + len(buffer) + len(piece) > expected_length:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Chunk {index} must be {expected_length} bytes")
+            digest.update(piece)
+            buffer += piece
+            # Request bodies arrive in small pieces; write them in ~1 MB blocks
+            if len(buffer) >= WRITE_BLOCK_SIZE:
+                await run_in_threadpool(os.pwrite, fd, bytes(buffer), offset + written)
+                written += len(buffer)
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(os.pwrite, fd, bytes(buffer), offset + written)
+            written += len(buffer)
+    finally:
+        await run_in_threadpool(os.close, fd)
+
+    if written != expected_length:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Chunk {index} must be {expected_length} bytes, got {written}")
+    actual = digest.hexdigest()
+    if actual != expected_sha256.strip().lower():
+        log.warning(f"[Upload {state.upload_id}] Checksum mismatch for chunk {index}.")
+        raise HTTPException(status_code=422, detail=f"Checksum mismatch for chunk {index}")
+
+    async with aiofiles.open(state.chunks_dir / str(index), "w") as marker:
+        await marker.write(actual)
+    return index
+
+
+@asynccontextmanager
+async def _upload_lock(state: UploadState, operation: int) -> AsyncIterator[UploadState]:
+    """Holds the upload's flock (LOCK_SH or LOCK_EX). Yields the upload state as re-read under the lock."""
+    fd = await run_in_threadpool(os.open, state.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        await run_in_threadpool(fcntl.flock, fd, operation)
+        yield await _load_state(state.input_dir)
+    finally:
+        await run_in_threadpool(os.close, fd) # Also releases the lock
+
+
+@asynccontextmanager
+async def finalize_lock(state: UploadState) -> AsyncIterator[UploadState]:
+    """
+    Holds the upload's exclusive lock, across uvicorn workers, for finalizing it and creating
+    its job. Waits for chunk writes in progress. Yields the upload state as re-read under the lock.
+    """
+    async with _upload_lock(state, fcntl.LOCK_EX) as locked_state:
+        yield locked_state
+
+
+async def finalize_upload(state: UploadState) -> Path:
+    """Checks that every chunk arrived, flushes the partial file and renames it into place."""
+    if state.data.get("finalized"):
+        return state.final_path
+    missing = state.describe()["missing"]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail={"message": "Upload is incomplete", "missing": missing[:100]})
+
+    def _finalize() -> None:
+        if not state.part_path.exists() and state.final_path.exists():
+            return # A concurrent finalize call got here first
+        fd = os.open(state.part_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(state.part_path, state.final_path)
+        shutil.rmtree(state.chunks_dir, ignore_errors=True)
+        state.data["finalized"] = True
+        _write_state(state)
+
+    await run_in_threadpool(_finalize)
+    log.info(f"[Upload {state.upload_id}] Finalized into {state.final_path}.")
+    return state.final_path
+
+
+def _is_expired(input_dir: Path, now: float, max_idle: float) -> bool:
+    try:
+        state = UploadState(input_dir, json.loads((input_dir / STATE_FILENAME).read_text()))
+    except (OSError, ValueError):
+        return False # Not a resumable upload any more, or its state is being written
+    return not state.data.get("finalized") and state.idle_seconds(now) >= max_idle
+
+
+def _expire_upload(upload_dir: Path, now: float, max_idle: float) -> bool:
+    input_dir = upload_dir / "input"
+    if not _is_expired(input_dir, now, max_idle):
+        return False
+    try:
+        fd = os.open(input_dir / LOCK_FILENAME, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        return False
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False # Being finalized right now
+        if not _is_expired(input_dir, now, max_idle): # Finalized before we got the lock
+            return False
+        shutil.rmtree(upload_dir, ignore_errors=True)
+    finally:
+        os.close(fd)
+    return True
+
+
+def expire_uploads(data_dir: Path, max_idle: float = UPLOAD_EXPIRY_SECONDS) -> int:
+    """
+    Removes uploads that were never finalized and have been idle for `max_idle` seconds:
+    their preallocated .part file, chunk markers and job directory. No job record exists
+    for them yet. Returns the number of uploads removed.
+    """
+    now = time.time()
+    removed = 0
+    for state_path in data_dir.glob(f"*/input/{STATE_FILENAME}"):
+        upload_dir = state_path.parent.parent
+        if _expire_upload(upload_dir, now, max_idle):
+            log.info(f"[Upload {upload_dir.name}] Expired after {max_idle:g}s without activity, removed.")
+            removed += 1
+    return removed
+
+
+async def sweep_uploads(data_dir: Path, interval: float = UPLOAD_SWEEP_SECONDS) -> None:
+    """Runs `expire_uploads` every `interval` seconds until cancelled."""
+    while True:
+        try:
+            await run_in_threadpool(expire_uploads, data_dir)
+        except Exception as e:
+            log.error(f"Upload sweep failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)
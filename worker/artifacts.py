@@ -0,0 +1,107 @@
+# worker/artifacts.py
+"""Post-completion processing of job output artifacts before they are served."""
+import gzip
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError: # Optional: without it only .gz siblings are written
+    brotli = None
+
+from worker.file_links import link_file
+
+log = logging.getLogger(__name__)
+
+# Outputs that are already compressed, or too small to be worth it
+SKIP_SUFFIXES = {".gz", ".br", ".csplat", ".tmp", ".png", ".jpg", ".jpeg", ".mp4"}
+MIN_SIZE = 1024
+# A sibling is only kept if it saves at least this fraction of the original size
+MIN_SAVING = 0.05
+
+_COPY_CHUNK = 1024 * 1024
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5
+
+
+def _write_atomic(src: Path, dst: Path, encoding: str) -> None:
+    tmp_path = dst.with_name(dst.name + ".tmp")
+    try:
+        with open(src, "rb") as f_in:
+            if encoding == "gzip":
+                # mtime=0 keeps the .gz byte-identical across rebuilds
+                with open(tmp_path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=_GZIP_LEVEL, mtime=0) as f_out:
+                    shutil.copyfileobj(f_in, f_out, _COPY_CHUNK)
+            else:
+                compressor = brotli.Compressor(quality=_BROTLI_QUALITY)
+                with open(tmp_path, "wb") as f_out:
+                    while chunk := f_in.read(_COPY_CHUNK):
+                        f_out.write(compressor.process(chunk))
+                    f_out.write(compressor.finish())
+        os.replace(tmp_path, dst)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _precompress_file(path: Path) -> Dict[str, int]:
+    encodings = [("gzip", ".gz")] + ([("br", ".br")] if brotli is not None else [])
+    size = path.stat().st_size
+    written = {}
+    for encoding, suffix in encodings:
+        sibling = path.with_name(path.name + suffix)
+        _write_atomic(path, sibling, encoding)
+        sibling_size = sibling.stat().st_size
+        if sibling_size > size * (1.0 - MIN_SAVING):
+            sibling.unlink()
+        else:
+            written[encoding] = sibling_size
+    return written
+
+
+def _link_siblings(src: Path, dst: Path, written: Dict[str, int]) -> None:
+    """Gives `dst` the siblings already written for `src`, a hard link of the same file."""
+    for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+        if encoding not in written:
+            continue
+        src_sibling = src.with_name(src.name + suffix)
+        sibling = dst.with_name(dst.name + suffix)
+        if sibling.exists() and sibling.samefile(src_sibling):
+            continue # rename() would be a no-op and leave the temporary link behind
+        tmp_path = sibling.with_name(sibling.name + ".tmp")
+        tmp_path.unlink(missing_ok=True)
+        link_file(src_sibling, tmp_path)
+        os.replace(tmp_path, sibling)
+
+
+def precompress_outputs(output_dir: Path, workers: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Writes .gz (and .br, if brotli is installed) siblings next to every output file,
+    so the interface can serve precompressed bytes without compressing per request.
+    Paths that are hard links of one file (lod/lod0.splat and output.splat) are
+    compressed once and share the siblings.
+    Returns {relative path: {encoding: size}} for the siblings that were kept.
+    """
+    inodes: Dict[Tuple[int, int], List[Path]] = {}
+    for p in sorted(output_dir.rglob("*")):
+        if p.is_file() and not p.is_symlink() and p.suffix.lower() not in SKIP_SUFFIXES:
+            stat = p.stat()
+            if stat.st_size >= MIN_SIZE:
+                inodes.setdefault((stat.st_dev, stat.st_ino), []).append(p)
+    if not inodes:
+        return {}
+    files = [paths[0] for paths in inodes.values()]
+    # zlib and brotli release the GIL, so files compress in parallel threads
+    with ThreadPoolExecutor(max_workers=workers or min(len(files), os.cpu_count() or 1)) as pool:
+        results = dict(zip(files, pool.map(_precompress_file, files)))
+    for paths in inodes.values():
+        for alias in paths[1:]:
+            _link_siblings(paths[0], alias, results[paths[0]])
+            results[alias] = results[paths[0]]
+    summary = {str(p.relative_to(output_dir)): r for p, r in results.items() if r}
+    log.info(f"Precompressed {len(summary)}/{len(results)} output files ({len(files)} distinct) in {output_dir}")
+    return summary
@@ -0,0 +1,62 @@
+# worker/colmap_cli.py
+"""
+Runs COLMAP command-line steps as subprocesses.
+
+Options are passed as a dict of COLMAP option names (without the leading dashes) to
+values; booleans become 1/0. The output of each run is appended to
+colmap/logs/<command>.log in the job directory, and on failure the tail of that log is
+part of the raised error, so the job's error_message says why COLMAP stopped.
+"""
+import logging
+import os
+import subprocess
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+COLMAP_BIN = os.getenv("COLMAP_BIN", "colmap")
+_ERROR_TAIL_LINES = 20
+
+
+class ColmapError(RuntimeError):
+    pass
+
+
+def build_args(command: str, options: Dict[str, Any]) -> List[str]:
+    args = [COLMAP_BIN, command]
+    for name, value in options.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        args += [f"--{name}", str(value)]
+    return args
+
+
+def run_colmap(command: str, options: Dict[str, Any], log_dir: Path, threads: Optional[int] = None,
+               env: Optional[Dict[str, str]] = None) -> float:
+    """
+    Runs `colmap <command>` with `options`. `threads` (see worker/cpu_budget.py) also caps
+    OpenMP inside COLMAP. Returns the wall time in seconds; raises ColmapError on failure.
+    """
+    args = build_args(command, options)
+    env = dict(env or {})
+    if threads:
+        env["OMP_NUM_THREADS"] = str(threads)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_path = log_dir / f"{command}.log"
+    start = time.perf_counter()
+    with open(log_path, "ab") as log_file:
+        log_file.write(f"$ {' '.join(args)}\n".encode())
+        log_file.flush()
+        process = subprocess.run(args, stdout=log_file, stderr=subprocess.STDOUT,
+                                 env={**os.environ, **env})
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        with open(log_path, "r", errors="replace") as f:
+            tail = "".join(deque(f, maxlen=_ERROR_TAIL_LINES))
+        raise ColmapError(f"colmap {command} exited with code {process.returncode}:\n{tail}")
+    return elapsed
@@ -0,0 +1,127 @@
+# worker/cpu_budget.py
+"""
+Per-worker budget of CPU threads for multi-threaded subprocesses (COLMAP).
+
+Celery's prefork pool runs several tasks side by side. If every COLMAP call were
+started with its default thread count (all cores), four concurrent jobs would run
+4x as many threads as cores and each would slow to a crawl. Instead, every CPU core
+of the worker is a slot: a lock file in CPU_BUDGET_DIR. A task claims as many free
+slots as it may use (between `min_threads` and `max_threads`) and starts its
+subprocess with exactly that many threads. Slots are flock()ed, so they are shared
+by all worker processes of the container and are released by the kernel if a process
+dies while holding them.
+
+A task takes at most its fair share: the budget divided by the number of tasks that
+currently hold or wait for threads (each holds a flocked claimant file meanwhile), so
+one job cannot starve the others just by arriving first.
+
+When fewer than `min_threads` slots become free within the wait time,
+CpuBudgetExhausted is raised. Tasks turn it into a Celery retry, so the job is
+requeued and the worker process can take other work meanwhile.
+"""
+import fcntl
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPU_BUDGET_THREADS = int(os.getenv("CPU_BUDGET_THREADS", 0)) or _available_cores()
+CPU_BUDGET_DIR = Path(os.getenv("CPU_BUDGET_DIR", "/tmp/splatgen-cpu-budget"))
+CPU_BUDGET_MIN_THREADS = int(os.getenv("CPU_BUDGET_MIN_THREADS", 2)) # Below this, wait rather than crawl
+CPU_BUDGET_MAX_THREADS = int(os.getenv("CPU_BUDGET_MAX_THREADS", 0)) # Cap per task (0: the whole budget)
+CPU_BUDGET_WAIT_SECONDS = float(os.getenv("CPU_BUDGET_WAIT_SECONDS", 60))
+CPU_BUDGET_RETRY_SECONDS = int(os.getenv("CPU_BUDGET_RETRY_SECONDS", 30)) # Countdown of the requeued task
+_POLL_SECONDS = 0.5
+
+
+class CpuBudgetExhausted(RuntimeError):
+    pass
+
+
+def _claim(slots: int, wanted: int) -> List:
+    """Locks up to `wanted` free slot files without blocking; returns their open handles."""
+    held = []
+    for slot in range(slots):
+        if len(held) == wanted:
+            break
+        handle = open(CPU_BUDGET_DIR / f"slot-{slot}.lock", "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            held.append(handle)
+        except BlockingIOError:
+            handle.close()
+    return held
+
+
+def _live_claimants() -> int:
+    """Counts claimant files locked by a running task; removes those left by dead processes."""
+    count = 0
+    for path in CPU_BUDGET_DIR.glob("claimant-*.lock"):
+        try:
+            with open(path, "r") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                path.unlink(missing_ok=True) # Not held: its task is gone
+        except BlockingIOError:
+            count += 1
+        except FileNotFoundError:
+            pass
+    return count
+
+
+def _release(held: List) -> None:
+    for handle in held:
+        handle.close() # Closing drops the flock
+
+
+@contextmanager
+def cpu_threads(min_threads: int = CPU_BUDGET_MIN_THREADS, max_threads: Optional[int] = None,
+                wait_seconds: float = CPU_BUDGET_WAIT_SECONDS, label: str = "") -> Iterator[int]:
+    """
+    Claims between `min_threads` and `max_threads` (default: the whole budget) free cores and
+    yields how many were claimed. Raises CpuBudgetExhausted after `wait_seconds` without enough.
+    """
+    slots = CPU_BUDGET_THREADS
+    limit = min(max_threads or CPU_BUDGET_MAX_THREADS or slots, slots)
+    needed = min(min_threads, limit)
+    CPU_BUDGET_DIR.mkdir(parents=True, exist_ok=True)
+    claimant_id = uuid.uuid4().hex
+    claimant_path = CPU_BUDGET_DIR / f"claimant-{claimant_id}.lock"
+    # Marks this task as holding or waiting for threads. Locked before it is renamed into view,
+    # so _live_claimants never sees it unlocked and mistakes it for a dead task's
+    tmp_path = CPU_BUDGET_DIR / f"claimant-{claimant_id}.tmp"
+    claimant = open(tmp_path, "w")
+    fcntl.flock(claimant, fcntl.LOCK_EX)
+    os.rename(tmp_path, claimant_path)
+    held: List = []
+    try:
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            fair_share = max(needed, -(-slots // max(1, _live_claimants()))) # Rounded up: no core left idle
+            held = _claim(slots, min(limit, fair_share))
+            if len(held) >= needed:
+                break
+            _release(held)
+            held = []
+            if time.monotonic() >= deadline:
+                raise CpuBudgetExhausted(f"{label or 'task'}: fewer than {needed} of {slots} CPU threads free after {wait_seconds:.0f}s")
+            time.sleep(_POLL_SECONDS)
+
+        log.info(f"{label or 'task'}: running with {len(held)} of {slots} CPU threads.")
+        yield len(held)
+    finally:
+        _release(held)
+        claimant_path.unlink(missing_ok=True)
+        claimant.close()
@@ -25,6 +25,10 @@ else:
     elif not DATABASE_URL_SYNC.startswith("postgresql+psycopg2://") and DATABASE_URL_SYNC.startswith("postgresql://"):
          DATABASE_URL_SYNC = DATABASE_URL_SYNC.replace("postgresql://", "postgresql+psycopg2://", 1)
          log.warning("Worker: Assuming psycopg2 driver for DATABASE_URL.")
+    elif DATABASE_URL_SYNC.startswith("sqlite"):
+        # Local stand-in (benchmarks/bench_e2e.py): plain SQLite, whatever async driver the interface uses
+        DATABASE_URL_SYNC = DATABASE_URL_SYNC.replace("sqlite+aiosqlite://", "sqlite://", 1)
+        log.warning("Worker: Using SQLite for DATABASE_URL: for local benchmarks only.")
     elif not DATABASE_URL_SYNC.startswith("postgresql+psycopg2://"):
         log.error(f"Worker: Invalid DATABASE_URL scheme for synchronous operations: {DATABASE_URL_SYNC}")
         raise ValueError("Worker DATABASE_URL must use 'postgresql+psycopg2://' or 'postgresql://' driver scheme.")
@@ -0,0 +1,12 @@
+# worker/file_links.py
+"""Hard-link helpers shared by the stages that reuse files instead of copying them."""
+import os
+import shutil
+
+
+def link_file(src, dst) -> None:
+    """Hard-links `src` to `dst`, copying instead where links are not possible. Usable as a copytree copy_function."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst) # Different filesystem or links not supported
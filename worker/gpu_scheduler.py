@@ -0,0 +1,226 @@
+# worker/gpu_scheduler.py
+"""
+Scheduling of Gaussian Splatting training on the GPU workers.
+
+Jobs are not sent to gpu_queue when their CPU stages finish. They wait in the
+database instead, and the scheduler releases one job per free GPU slot (GPU_SLOTS). The
+decision is made at the last moment, when a slot frees up. gpu_queue never holds more
+messages than there are GPUs, so a busy worker cannot hoard jobs. The next waiting job
+is chosen by, in order:
+
+1. Priority, strictly.
+2. Fair share: the submitter with the fewest GPU seconds in the last
+   GPU_FAIR_SHARE_WINDOW_SECONDS goes first, counting running and already planned jobs.
+   Twenty jobs from one user therefore interleave with everyone else's.
+3. Shortest estimated job first. The estimate is frames x iterations x
+   GPU_SECONDS_PER_FRAME_ITERATION, plus GPU_JOB_OVERHEAD_SECONDS. It is divided by
+   (1 + waited / GPU_AGING_SECONDS), so a long job is not starved by a stream of short
+   ones. Waiting does not raise the priority: otherwise a submitter who queued many jobs
+   early would outrank everyone after a few hours, defeating fair share.
+4. Arrival order.
+
+The same simulation assigns every waiting job its queue position and estimated finish
+time, which are stored on the job.
+
+A running job holds its slot until its training task ends, even past its estimate: a
+slot is never handed back while the task may still be training on the GPU (with late
+acks, a redelivered task resumes on the same slot). Only a job that is far past its
+estimate (GPU_STALE_FACTOR) and has written no status or progress for GPU_LOST_SECONDS
+is presumed lost, and its slot is reused.
+
+Time comes from an injected clock and all state goes through a store (MemoryGpuStore
+here, the database in worker/tasks/scheduling.py). The policy can therefore be driven
+by a fake clock and a fake worker; see benchmarks/sim_gpu_scheduler.py.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+GPU_SLOTS = int(os.getenv("GPU_SLOTS", 1)) # GPU workers x their concurrency
+GPU_SECONDS_PER_FRAME_ITERATION = float(os.getenv("GPU_SECONDS_PER_FRAME_ITERATION", 0.0005))
+GPU_JOB_OVERHEAD_SECONDS = float(os.getenv("GPU_JOB_OVERHEAD_SECONDS", 60))
+GPU_FAIR_SHARE_WINDOW_SECONDS = float(os.getenv("GPU_FAIR_SHARE_WINDOW_SECONDS", 24 * 3600))
+GPU_AGING_SECONDS = float(os.getenv("GPU_AGING_SECONDS", 3600))
+# A running job this many times past its estimate, and silent for GPU_LOST_SECONDS, no longer occupies a slot
+GPU_STALE_FACTOR = float(os.getenv("GPU_STALE_FACTOR", 3))
+GPU_LOST_SECONDS = float(os.getenv("GPU_LOST_SECONDS", 1800)) # Training reports progress far more often
+
+
+def estimate_seconds(num_frames: Optional[int], iterations: Optional[int]) -> float:
+    return (num_frames or 0) * (iterations or 0) * GPU_SECONDS_PER_FRAME_ITERATION + GPU_JOB_OVERHEAD_SECONDS
+
+
+@dataclass(frozen=True)
+class GpuJob:
+    job_id: str
+    submitter: str
+    priority: int
+    num_frames: int
+    iterations: int
+    enqueued_at: float # Clock seconds
+    started_at: Optional[float] = None
+    heartbeat_at: Optional[float] = None # Last status or progress write of a running job
+
+    @property
+    def estimate(self) -> float:
+        return estimate_seconds(self.num_frames, self.iterations)
+
+    def lost(self, now: float) -> bool:
+        """A running job far past its estimate whose worker has been silent for GPU_LOST_SECONDS."""
+        last_sign_of_life = max(self.started_at, self.heartbeat_at or self.started_at)
+        return (now > self.started_at + GPU_STALE_FACTOR * self.estimate
+                and now - last_sign_of_life > GPU_LOST_SECONDS)
+
+
+@dataclass(frozen=True)
+class Placement:
+    job: GpuJob
+    position: int # 1 = next to start
+    start_at: float
+    finish_at: float
+    ready: bool # Its slot is free now: the job can be started
+
+
+def _sort_key(job: GpuJob, at: float, usage: Dict[str, float]):
+    aged_estimate = job.estimate / (1 + max(0.0, at - job.enqueued_at) / GPU_AGING_SECONDS)
+    return (-job.priority, usage.get(job.submitter, 0.0), aged_estimate, job.enqueued_at, job.job_id)
+
+
+def plan(waiting: List[GpuJob], running: List[GpuJob], usage: Dict[str, float],
+         slots: int, now: float) -> List[Placement]:
+    """
+    Order of the waiting jobs with estimated start and finish times, simulating `slots` GPUs.
+    `usage` holds GPU seconds per submitter within the fair-share window. Ready placements
+    can be started right away.
+    """
+    usage = dict(usage)
+    free_at = [] # (time, held): a job past its estimate frees its slot at an unknown time, expected now
+    for job in running:
+        end = job.started_at + job.estimate
+        free_at.append((max(now, end), end <= now))
+        usage[job.submitter] = usage.get(job.submitter, 0.0) + max(0.0, end - now)
+    free_at += [(now, False)] * max(0, slots - len(running))
+    heapq.heapify(free_at)
+    while len(free_at) > slots: # More jobs running than slots (slots were reduced)
+        heapq.heappop(free_at)
+
+    placements = []
+    remaining = list(waiting)
+    while remaining and free_at:
+        start_at, held = heapq.heappop(free_at)
+        job = min(remaining, key=lambda j: _sort_key(j, start_at, usage))
+        remaining.remove(job)
+        finish_at = start_at + job.estimate
+        placements.append(Placement(job, len(placements) + 1, start_at, finish_at, ready=start_at <= now and not held))
+        usage[job.submitter] = usage.get(job.submitter, 0.0) + job.estimate # Later picks see this job's share
+        heapq.heappush(free_at, (finish_at, False))
+    return placements
+
+
+class GpuScheduler:
+    """
+    Releases waiting jobs to free GPU slots. `dispatch(job_id)` sends a job's GPU work. It is
+    called after the store transaction committed. If it raises, the job goes back to waiting
+    until the next scheduler run (the periodic one at the latest, see worker/tasks/scheduling.py).
+    """
+
+    def __init__(self, store, dispatch: Callable[[str], None], clock: Callable[[], float] = time.time,
+                 slots: int = GPU_SLOTS):
+        self.store = store
+        self.dispatch = dispatch
+        self.clock = clock
+        self.slots = slots
+
+    def enqueue(self, job_id: str) -> None:
+        """Marks a job as waiting for the GPU."""
+        self.store.mark_waiting(job_id, self.clock())
+
+    def finished(self, job_id: str) -> None:
+        """Frees the slot of a job whose GPU work ended (successfully or not)."""
+        self.store.mark_finished(job_id, self.clock())
+
+    def schedule(self) -> List[str]:
+        """Starts as many waiting jobs as there are free slots and updates queue positions. Returns the started IDs."""
+        now = self.clock()
+        with self.store.transaction() as txn:
+            running = []
+            for job in txn.running():
+                if job.lost(now):
+                    log.warning(f"[Job {job.job_id}] GPU scheduler: running {now - job.started_at:.0f}s, "
+                                f"{GPU_STALE_FACTOR:g}x its estimate, with no status or progress for "
+                                f"{GPU_LOST_SECONDS:.0f}s; presumed lost, no longer counted against a slot.")
+                    continue
+                running.append(job)
+            waiting = txn.waiting()
+            placements = plan(waiting, running, txn.usage(now - GPU_FAIR_SHARE_WINDOW_SECONDS, now), self.slots, now)
+            started = [p for p in placements if p.ready]
+            for p in placements:
+                if p.ready:
+                    txn.mark_started(p.job.job_id, now, eta=now + p.job.estimate)
+                else:
+                    txn.set_queue_info(p.job.job_id, p.position - len(started), eta=p.finish_at)
+        for p in started:
+            log.info(f"[Job {p.job.job_id}] GPU scheduler: starting (submitter {p.job.submitter}, priority "
+                     f"{p.job.priority}, estimate {p.job.estimate:.0f}s, waited {now - p.job.enqueued_at:.0f}s).")
+            try:
+                self.dispatch(p.job.job_id)
+            except Exception as e:
+                log.error(f"[Job {p.job.job_id}] GPU scheduler: dispatch failed, job waits again: {e}")
+                self.store.mark_waiting(p.job.job_id, p.job.enqueued_at)
+        return [p.job.job_id for p in started]
+
+
+class MemoryGpuStore:
+    """In-process store for simulations: {job_id: GpuJob} plus finished (submitter, start, end) intervals."""
+
+    def __init__(self):
+        self.jobs: Dict[str, GpuJob] = {}
+        self.queue_info: Dict[str, tuple] = {} # job_id -> (position, eta)
+        self.intervals: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def add(self, job: GpuJob) -> None:
+        self.jobs[job.job_id] = job
+
+    def mark_waiting(self, job_id: str, now: float) -> None:
+        self.jobs[job_id] = replace(self.jobs[job_id], enqueued_at=now, started_at=None)
+
+    def mark_finished(self, job_id: str, now: float) -> None:
+        job = self.jobs.pop(job_id)
+        self.queue_info.pop(job_id, None)
+        if job.started_at is not None:
+            self.intervals.append((job.submitter, job.started_at, now))
+
+    @contextmanager
+    def transaction(self) -> Iterator["MemoryGpuStore"]:
+        with self._lock:
+            yield self
+
+    def waiting(self) -> List[GpuJob]:
+        return [j for j in self.jobs.values() if j.started_at is None]
+
+    def running(self) -> List[GpuJob]:
+        return [j for j in self.jobs.values() if j.started_at is not None]
+
+    def usage(self, since: float, now: float) -> Dict[str, float]:
+        usage: Dict[str, float] = {}
+        for submitter, start, end in self.intervals:
+            if end > since:
+                usage[submitter] = usage.get(submitter, 0.0) + end - max(start, since)
+        for job in self.running():
+            usage[job.submitter] = usage.get(job.submitter, 0.0) + now - max(job.started_at, since)
+        return usage
+
+    def mark_started(self, job_id: str, now: float, eta: float) -> None:
+        self.jobs[job_id] = replace(self.jobs[job_id], started_at=now)
+        self.queue_info[job_id] = (0, eta)
+
+    def set_queue_info(self, job_id: str, position: int, eta: float) -> None:
+        self.queue_info[job_id] = (position, eta)
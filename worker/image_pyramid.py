@@ -0,0 +1,159 @@
+# worker/image_pyramid.py
+"""
+Multi-resolution copy of the segmented frames, written once after background removal.
+
+Layout of data/<jobid>/pyramid/:
+    pyramid.json        levels, image names and per-level sizes
+    images_1/           the frames as they are (hard links to images/, nothing re-encoded)
+    images_2/, images_4/  JPEGs at 1/2 and 1/4 scale (same file names)
+    masks_<f>.npy       foreground masks of level f, bitpacked along the width: uint8 [N, H, ceil(W / 8)]
+
+Consumers read the level they need instead of decoding full-resolution frames and
+resizing them again. A half-scale JPEG decodes in about a quarter of the time of the
+full frame, with no resize at all. The mask stacks are 1 bit per pixel and can be
+memory-mapped, so a consumer that only needs a few frames touches only those rows.
+Level f is made from level f/2 (INTER_AREA), so each step only halves the size.
+"""
+import json
+import logging
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from worker.keyframes import publish_dir
+from worker.file_links import link_file
+
+log = logging.getLogger(__name__)
+
+PYRAMID_FACTORS = (1, 2, 4)
+PYRAMID_MANIFEST = "pyramid.json"
+MASK_THRESHOLD = 128 # Alpha at or above this is foreground
+_JPEG_QUALITY = 95
+
+
+def images_dir(pyramid_dir: Path, factor: int) -> Path:
+    return pyramid_dir / f"images_{factor}"
+
+
+def masks_path(pyramid_dir: Path, factor: int) -> Path:
+    return pyramid_dir / f"masks_{factor}.npy"
+
+
+def read_manifest(pyramid_dir: Path) -> Dict:
+    return json.loads((pyramid_dir / PYRAMID_MANIFEST).read_text())
+
+
+def _half(image: np.ndarray) -> np.ndarray:
+    height, width = image.shape[:2]
+    return cv2.resize(image, (max(1, width // 2), max(1, height // 2)), interpolation=cv2.INTER_AREA)
+
+
+def _build_one(name: str, src_images: Path, src_masks: Path, out_dir: Path,
+               factors: Sequence[int]) -> List[Tuple[np.ndarray, Tuple[int, int]]]:
+    """Writes the downscaled levels of one frame; returns its bitpacked mask and (height, width) per level."""
+    image = cv2.imread(str(src_images / name), cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError(f"Could not read {src_images / name}")
+    mask_file = src_masks / f"{name}.png"
+    alpha = cv2.imread(str(mask_file), cv2.IMREAD_GRAYSCALE) if mask_file.exists() else None
+    if alpha is None:
+        alpha = np.full(image.shape[:2], 255, dtype=np.uint8) # No mask: everything is foreground
+
+    levels = []
+    factor = 1
+    for target in factors:
+        while factor < target:
+            image, alpha = _half(image), _half(alpha)
+            factor *= 2
+        if factor > 1:
+            if not cv2.imwrite(str(images_dir(out_dir, factor) / name), image, [cv2.IMWRITE_JPEG_QUALITY, _JPEG_QUALITY]):
+                raise IOError(f"Could not write level {factor} of {name}")
+        levels.append((np.packbits(alpha >= MASK_THRESHOLD, axis=1), image.shape[:2]))
+    return levels
+
+
+def build_pyramid(src_images: Path, src_masks: Path, out_dir: Path,
+                  factors: Sequence[int] = PYRAMID_FACTORS, workers: int = 0) -> Dict:
+    """
+    Builds the pyramid of every image in `src_images` (masks from `src_masks/<name>.png`)
+    into `out_dir`. The directory is built next to `out_dir` and renamed into place.
+    """
+    factors = sorted(factors)
+    if any(f < 1 or f & (f - 1) for f in factors):
+        raise ValueError(f"Pyramid factors must be powers of two, got {factors}")
+    names = sorted(p.name for p in src_images.iterdir() if p.is_file())
+    if not names:
+        raise ValueError(f"No images in {src_images}")
+
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    for factor in factors:
+        images_dir(tmp_dir, factor).mkdir(parents=True)
+
+    try:
+        if 1 in factors:
+            for name in names:
+                link_file(src_images / name, images_dir(tmp_dir, 1) / name)
+        # cv2 releases the GIL while decoding, resizing and encoding
+        with ThreadPoolExecutor(max_workers=workers or None) as pool:
+            per_image = list(pool.map(lambda name: _build_one(name, src_images, src_masks, tmp_dir, factors), names))
+
+        levels = {}
+        for i, factor in enumerate(factors):
+            sizes = {image_levels[i][1] for image_levels in per_image}
+            if len(sizes) > 1:
+                raise ValueError(f"Images of different sizes cannot share a mask stack: {sorted(sizes)}")
+            np.save(masks_path(tmp_dir, factor), np.stack([image_levels[i][0] for image_levels in per_image]))
+            height, width = sizes.pop()
+            levels[str(factor)] = {"width": width, "height": height}
+
+        manifest = {"factors": factors, "images": names, "levels": levels}
+        (tmp_dir / PYRAMID_MANIFEST).write_text(json.dumps(manifest, indent=2))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    publish_dir(tmp_dir, out_dir)
+    return manifest
+
+
+# --- Readers ---
+
+def select_factor(pyramid_dir: Path, max_size: int) -> int:
+    """Smallest level whose long side is still at least `max_size` (0: full resolution)."""
+    manifest = read_manifest(pyramid_dir)
+    chosen = 1
+    for factor in manifest["factors"]:
+        level = manifest["levels"][str(factor)]
+        if max_size and max(level["width"], level["height"]) >= max_size:
+            chosen = factor
+    return chosen
+
+
+def load_masks(pyramid_dir: Path, factor: int) -> Tuple[List[str], np.ndarray]:
+    """Image names and a memory-mapped bitpacked mask stack of one level (see `unpack_mask`)."""
+    manifest = read_manifest(pyramid_dir)
+    return manifest["images"], np.load(masks_path(pyramid_dir, factor), mmap_mode="r")
+
+
+def unpack_mask(packed: np.ndarray, width: int) -> np.ndarray:
+    """One bitpacked mask -> bool [H, W]."""
+    return np.unpackbits(packed, axis=1, count=width).astype(bool)
+
+
+def write_mask_images(pyramid_dir: Path, factor: int, out_dir: Path) -> int:
+    """
+    Writes the masks of one level as 1-bit PNGs named <image name>.png, the layout of
+    COLMAP's --ImageReader.mask_path (0 = ignored). Returns the number written.
+    """
+    names, stack = load_masks(pyramid_dir, factor)
+    width = read_manifest(pyramid_dir)["levels"][str(factor)]["width"]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, packed in zip(names, stack):
+        mask = unpack_mask(packed, width).astype(np.uint8) * 255
+        if not cv2.imwrite(str(out_dir / f"{name}.png"), mask, [cv2.IMWRITE_PNG_BILEVEL, 1]):
+            raise IOError(f"Could not write mask for {name}")
+    return len(names)
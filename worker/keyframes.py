@@ -0,0 +1,224 @@
+# worker/keyframes.py
+"""
+Keyframe selection for reconstruction.
+
+The video is decoded once. Every frame is scored on a small grayscale copy: sharpness
+is the variance of the Laplacian, and motion is the mean absolute difference to the
+previous frame. Fast camera motion goes with motion blur and a short baseline to the
+next view. The timeline is split into `num_frames` equal bins (even coverage), and
+each bin keeps its best-scoring frame. Only that one full-resolution candidate per
+bin is held in memory, so memory stays flat regardless of video length.
+"""
+import json
+import logging
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+ANALYSIS_WIDTH = 320 # Width of the copy used for the blur metric
+MOTION_WIDTH = 64 # Width of the thumbnail used for the motion estimate
+MOTION_WEIGHT = 0.5 # Penalty per unit of log(motion / running mean motion)
+CENTER_WEIGHT = 0.5 # Penalty for candidates at the edge of their bin (keeps picks evenly spaced)
+_MOTION_EMA = 0.05
+KEYFRAMES_MANIFEST = "keyframes.json"
+
+
+class Candidate(NamedTuple):
+    index: int
+    score: float
+    sharpness: float
+    motion: float
+    frame: np.ndarray
+
+
+def _analysis_copy(frame: np.ndarray, width: int) -> np.ndarray:
+    height, full_width = frame.shape[:2]
+    if full_width > width * 2:
+        # Nearest-neighbour decimation to twice the width first: INTER_AREA over a 4K frame
+        # costs ~20x more than the metric itself (12 ms vs 0.6 ms)
+        frame = cv2.resize(frame, (width * 2, max(1, height * width * 2 // full_width)), interpolation=cv2.INTER_NEAREST)
+        height, full_width = frame.shape[:2]
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    if full_width > width:
+        gray = cv2.resize(gray, (width, max(1, height * width // full_width)), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def sharpness(gray: np.ndarray) -> float:
+    """Variance of the Laplacian: low for blurry frames."""
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+class KeyframeSelector:
+    """
+    Streams frames (in index order) and keeps the best frame of each of `num_frames` equal
+    bins over [0, total_frames). `add` returns the candidates of bins that are complete.
+    """
+
+    def __init__(self, num_frames: int, total_frames: int):
+        self.num_bins = max(1, min(num_frames, total_frames))
+        self.total_frames = max(1, total_frames)
+        self.bin_width = self.total_frames / self.num_bins
+        self.current_bin = -1
+        self.best: Optional[Candidate] = None
+        self.previous_thumb: Optional[np.ndarray] = None
+        self.motion_mean: Optional[float] = None
+        self.sharpness_values: List[float] = [] # Of every frame, for the manifest summary
+
+    def bin_of(self, index: int) -> int:
+        return min(int(index / self.bin_width), self.num_bins - 1)
+
+    def _score(self, index: int, gray: np.ndarray) -> Tuple[float, float, float]:
+        blur = sharpness(gray)
+        thumb = cv2.resize(gray, (MOTION_WIDTH, max(1, gray.shape[0] * MOTION_WIDTH // gray.shape[1])),
+                           interpolation=cv2.INTER_AREA).astype(np.int16)
+        if self.previous_thumb is not None and self.previous_thumb.shape == thumb.shape:
+            motion = float(np.abs(thumb - self.previous_thumb).mean())
+            if self.motion_mean is None:
+                self.motion_mean = motion
+            else:
+                self.motion_mean += _MOTION_EMA * (motion - self.motion_mean)
+            motion_ratio = motion / (self.motion_mean + 1e-6)
+        else:
+            motion, motion_ratio = 0.0, 1.0 # First frame of a stream: no estimate, neutral penalty
+        self.previous_thumb = thumb
+
+        bin_index = self.bin_of(index)
+        center = (bin_index + 0.5) * self.bin_width
+        offset = (index + 0.5 - center) / (self.bin_width / 2.0)
+        score = (math.log1p(blur)
+                 - MOTION_WEIGHT * math.log1p(motion_ratio)
+                 - CENTER_WEIGHT * offset * offset)
+        return score, blur, motion
+
+    def add(self, index: int, frame: np.ndarray, luma: Optional[np.ndarray] = None) -> List[Candidate]:
+        """`luma` (e.g. the Y plane of a YUV frame) is scored instead of `frame` when given."""
+        gray = _analysis_copy(frame if luma is None else luma, ANALYSIS_WIDTH)
+        score, blur, motion = self._score(index, gray)
+        self.sharpness_values.append(blur)
+
+        done = []
+        bin_index = self.bin_of(index)
+        if bin_index != self.current_bin:
+            if self.best is not None:
+                done.append(self.best)
+            self.current_bin, self.best = bin_index, None
+        if self.best is None or score > self.best.score:
+            # Copy: decoders may reuse the frame buffer
+            self.best = Candidate(index, score, blur, motion, frame.copy())
+        return done
+
+    def finish(self) -> List[Candidate]:
+        done = [self.best] if self.best is not None else []
+        self.best = None
+        return done
+
+
+def resize_to_max(frame: np.ndarray, max_size: int) -> np.ndarray:
+    """Downscales so the long side is at most `max_size` (0 keeps the full resolution)."""
+    height, width = frame.shape[:2]
+    scale = max_size / max(height, width) if max_size else 1.0
+    if scale >= 1.0:
+        return frame
+    return cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def frame_filename(number: int, ext: str) -> str:
+    return f"frame_{number:05d}.{ext}"
+
+
+def _write_params(ext: str) -> list:
+    if ext in ("jpg", "jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, 95]
+    if ext == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, 1] # Fast; frames are intermediate files
+    return []
+
+
+def write_candidate(candidate: Candidate, path: Path, max_size: int, ext: str) -> Dict:
+    if not cv2.imwrite(str(path), resize_to_max(candidate.frame, max_size), _write_params(ext)):
+        raise IOError(f"Could not write frame {path}")
+    return {
+        "file": path.name,
+        "source_index": candidate.index,
+        "sharpness": round(candidate.sharpness, 3),
+        "motion": round(candidate.motion, 3),
+    }
+
+
+def publish_dir(tmp_dir: Path, out_dir: Path) -> None:
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    os.replace(tmp_dir, out_dir)
+
+
+def extract_keyframes(video_path: Path, out_dir: Path, num_frames: int,
+                      max_size: int = 0, ext: str = "jpg") -> Dict:
+    """
+    Decodes `video_path` once and writes the selected keyframes to `out_dir` as
+    frame_00001.<ext>, ... in temporal order, plus a keyframes.json manifest.
+    The directory is built next to `out_dir` and renamed into place when complete.
+    """
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise IOError(f"Could not open video {video_path}")
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    if total_frames <= 0:
+        raise ValueError(f"Could not determine the frame count of {video_path}")
+
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    selector = KeyframeSelector(num_frames, total_frames)
+    selected = []
+    decoded = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            for candidate in selector.add(decoded, frame):
+                path = tmp_dir / frame_filename(len(selected) + 1, ext)
+                selected.append(write_candidate(candidate, path, max_size, ext))
+            decoded += 1
+        for candidate in selector.finish():
+            path = tmp_dir / frame_filename(len(selected) + 1, ext)
+            selected.append(write_candidate(candidate, path, max_size, ext))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    finally:
+        capture.release()
+
+    if decoded < total_frames:
+        # Container frame counts are estimates; trailing bins may have stayed empty
+        log.warning(f"{video_path.name}: decoded {decoded} of {total_frames} reported frames.")
+    manifest = write_manifest(tmp_dir, video_path, decoded, fps, selector.sharpness_values, selected)
+    publish_dir(tmp_dir, out_dir)
+    return manifest
+
+
+def write_manifest(out_dir: Path, video_path: Path, decoded: int, fps: float,
+                   sharpness_values: Sequence[float], selected: List[Dict]) -> Dict:
+    blur = np.asarray(sharpness_values, dtype=np.float64)
+    picked = np.array([f["sharpness"] for f in selected], dtype=np.float64)
+    manifest = {
+        "video": video_path.name,
+        "decoded_frames": decoded,
+        "fps": fps,
+        "selected": len(selected),
+        "median_sharpness_all": float(np.median(blur)) if len(blur) else 0.0,
+        "median_sharpness_selected": float(np.median(picked)) if len(picked) else 0.0,
+        "frames": selected,
+    }
+    (out_dir / KEYFRAMES_MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return manifest
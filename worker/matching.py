@@ -0,0 +1,133 @@
+# worker/matching.py
+"""
+Choice of the COLMAP matching strategy.
+
+Exhaustive matching tests all n(n-1)/2 image pairs, which dominates COLMAP time beyond
+a couple of hundred frames. Our input is always a video, so most useful pairs are
+between nearby frames:
+
+    exhaustive   every pair; small jobs only
+    sequential   each frame against the next MATCH_SEQUENTIAL_OVERLAP frames (plus
+                 quadratic offsets), with vocabulary-tree loop detection when a tree
+                 is configured, so revisited places are still connected
+    retrieval    each frame against its nearest neighbours in appearance. This uses
+                 COLMAP's vocab_tree_matcher when a tree is configured. Otherwise the
+                 neighbours come from tiny-image descriptors computed here, and the
+                 pair list goes through matches_importer
+
+"auto" is exhaustive up to MATCH_EXHAUSTIVE_MAX_IMAGES images and sequential above.
+"""
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+MATCH_EXHAUSTIVE_MAX_IMAGES = int(os.getenv("MATCH_EXHAUSTIVE_MAX_IMAGES", 150))
+MATCH_SEQUENTIAL_OVERLAP = int(os.getenv("MATCH_SEQUENTIAL_OVERLAP", 10))
+MATCH_RETRIEVAL_NEIGHBORS = int(os.getenv("MATCH_RETRIEVAL_NEIGHBORS", 20))
+# e.g. vocab_tree_flickr100K_words32K.bin from colmap.github.io; loop detection and vocab_tree_matcher need it
+COLMAP_VOCAB_TREE_PATH = os.getenv("COLMAP_VOCAB_TREE_PATH")
+
+MATCHER_STRATEGIES = ("exhaustive", "sequential", "retrieval")
+_DESCRIPTOR_SIZE = (32, 24) # Tiny-image descriptor, width x height
+
+
+class MatchPlan(NamedTuple):
+    strategy: str # Recorded on the job, e.g. "sequential+loop"
+    command: str # COLMAP command
+    options: Dict[str, Any]
+    pairs: Optional[List[Tuple[str, str]]] = None # Explicit pair list (matches_importer)
+
+
+def vocab_tree_path() -> Optional[str]:
+    if COLMAP_VOCAB_TREE_PATH and Path(COLMAP_VOCAB_TREE_PATH).is_file():
+        return COLMAP_VOCAB_TREE_PATH
+    return None
+
+
+def choose_strategy(num_images: int, requested: Optional[str]) -> str:
+    """Resolves a job's matcher option ("auto", None or one of MATCHER_STRATEGIES) for `num_images` images."""
+    if requested in MATCHER_STRATEGIES:
+        return requested
+    if requested not in (None, "auto"):
+        log.warning(f"Unknown matcher option '{requested}', choosing automatically.")
+    return "exhaustive" if num_images <= MATCH_EXHAUSTIVE_MAX_IMAGES else "sequential"
+
+
+def read_image_names(database_path: Path) -> List[str]:
+    with sqlite3.connect(database_path) as db:
+        return [name for (name,) in db.execute("SELECT name FROM images ORDER BY name")]
+
+
+def count_matched_pairs(database_path: Path) -> int:
+    """Image pairs with a verified two-view geometry (at least one inlier match)."""
+    with sqlite3.connect(database_path) as db:
+        return db.execute("SELECT COUNT(*) FROM two_view_geometries WHERE rows > 0").fetchone()[0]
+
+
+def _tiny_descriptor(path: Path) -> np.ndarray:
+    gray = cv2.imread(str(path), cv2.IMREAD_REDUCED_GRAYSCALE_4) # Decoder-side 1/4 scale: cheap
+    if gray is None:
+        raise IOError(f"Could not read {path}")
+    tiny = cv2.resize(gray, _DESCRIPTOR_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    tiny -= tiny.mean()
+    return tiny / (np.linalg.norm(tiny) + 1e-6)
+
+
+def retrieval_pairs(image_dir: Path, names: List[str], neighbors: int = MATCH_RETRIEVAL_NEIGHBORS,
+                    overlap: int = 2) -> List[Tuple[str, str]]:
+    """
+    Pairs each image with its `neighbors` most similar images (cosine similarity of tiny-image
+    descriptors) and with the next `overlap` frames, so the sequence stays connected.
+    """
+    descriptors = np.stack([_tiny_descriptor(image_dir / name) for name in names])
+    similarity = descriptors @ descriptors.T
+    np.fill_diagonal(similarity, -np.inf)
+    k = min(neighbors, len(names) - 1)
+    pairs = set()
+    for i in range(len(names)):
+        for j in range(i + 1, min(i + 1 + overlap, len(names))):
+            pairs.add((i, j))
+        if k > 0:
+            for j in np.argpartition(-similarity[i], k - 1)[:k]:
+                pairs.add((min(i, int(j)), max(i, int(j))))
+    return [(names[i], names[j]) for i, j in sorted(pairs)]
+
+
+def plan_matching(strategy: str, database_path: Path, image_dir: Path) -> MatchPlan:
+    """COLMAP command and options for `strategy` on the images registered in `database_path`."""
+    tree = vocab_tree_path()
+    options: Dict[str, Any] = {"database_path": database_path}
+    if strategy == "exhaustive":
+        return MatchPlan("exhaustive", "exhaustive_matcher", options)
+    if strategy == "sequential":
+        options.update({
+            "SequentialMatching.overlap": MATCH_SEQUENTIAL_OVERLAP,
+            "SequentialMatching.quadratic_overlap": True,
+            "SequentialMatching.loop_detection": tree is not None,
+            "SequentialMatching.vocab_tree_path": tree,
+        })
+        return MatchPlan("sequential+loop" if tree else "sequential", "sequential_matcher", options)
+    if strategy == "retrieval":
+        if tree:
+            options.update({
+                "VocabTreeMatching.vocab_tree_path": tree,
+                "VocabTreeMatching.num_images": MATCH_RETRIEVAL_NEIGHBORS,
+            })
+            return MatchPlan("vocab_tree", "vocab_tree_matcher", options)
+        pairs = retrieval_pairs(image_dir, read_image_names(database_path))
+        options["match_type"] = "pairs"
+        return MatchPlan("retrieval", "matches_importer", options, pairs)
+    raise ValueError(f"Unknown matching strategy '{strategy}'")
+
+
+def write_pairs(pairs: List[Tuple[str, str]], path: Path) -> Path:
+    """Pair list in COLMAP's matches_importer format (one "name1 name2" per line)."""
+    path.write_text("".join(f"{a} {b}\n" for a, b in pairs))
+    return path
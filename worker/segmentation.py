@@ -0,0 +1,221 @@
+# worker/segmentation.py
+"""
+Background removal with a persistent, batched ONNX Runtime session.
+
+The rembg model (u2net by default) is loaded once per worker process, at process
+start when REMBG_PRELOAD is set, and reused by every job that process runs. Frames
+go through three threads connected by bounded queues: a reader decodes the JPEGs and
+prepares input batches, the inferencer runs the session, and a writer resizes and
+encodes the masks. JPEG/PNG codecs and ONNX Runtime release the GIL, so the three
+stages overlap.
+
+Masks are written to masks/<image name>.png (COLMAP's --ImageReader.mask_path
+naming, 0 = background) as 8-bit alpha. images/ holds the unchanged frames,
+hard-linked from frames/, so no JPEG is re-encoded.
+"""
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from worker.keyframes import publish_dir
+from worker.file_links import link_file
+
+log = logging.getLogger(__name__)
+
+REMBG_MODEL = os.getenv("REMBG_MODEL", "u2net")
+REMBG_MODEL_PATH = os.getenv("REMBG_MODEL_PATH") # Local .onnx file; otherwise rembg's model store is used
+REMBG_BATCH_SIZE = int(os.getenv("REMBG_BATCH_SIZE", 8))
+# 0 lets ONNX Runtime pick (one thread per physical core); lower it when several worker processes share a host
+REMBG_INTRA_OP_THREADS = int(os.getenv("REMBG_INTRA_OP_THREADS", 0))
+REMBG_INTER_OP_THREADS = int(os.getenv("REMBG_INTER_OP_THREADS", 1))
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+_QUEUE_BATCHES = 2 # Batches buffered between stages
+_STOP = None
+
+
+class ModelInput(NamedTuple):
+    size: int
+    mean: Tuple[float, float, float]
+    std: Tuple[float, float, float]
+
+
+# Input geometry and normalisation of the rembg models (as in rembg's sessions)
+MODEL_INPUTS: Dict[str, ModelInput] = {
+    "u2net": ModelInput(320, (0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
+    "u2netp": ModelInput(320, (0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
+    "u2net_human_seg": ModelInput(320, (0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
+    "silueta": ModelInput(320, (0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
+    "isnet-general-use": ModelInput(1024, (0.5, 0.5, 0.5), (1.0, 1.0, 1.0)),
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _model_path() -> str:
+    if REMBG_MODEL_PATH:
+        return REMBG_MODEL_PATH
+    from rembg.sessions import sessions_class # Imported lazily: only needed to locate/download the model
+    for session_class in sessions_class:
+        if session_class.name() == REMBG_MODEL:
+            return str(session_class.download_models())
+    raise ValueError(f"Unknown rembg model '{REMBG_MODEL}'")
+
+
+def get_session():
+    """Returns this process's inference session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = REMBG_INTRA_OP_THREADS
+            options.inter_op_num_threads = REMBG_INTER_OP_THREADS
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL if REMBG_INTER_OP_THREADS > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            start = time.perf_counter()
+            _session = ort.InferenceSession(_model_path(), sess_options=options, providers=["CPUExecutionProvider"])
+            log.info(f"Loaded segmentation model '{REMBG_MODEL}' in {time.perf_counter() - start:.2f}s "
+                     f"(intra-op threads {REMBG_INTRA_OP_THREADS or 'auto'}, inter-op threads {REMBG_INTER_OP_THREADS}).")
+        return _session
+
+
+def preprocess(image: np.ndarray, model_input: ModelInput) -> np.ndarray:
+    """BGR uint8 image -> normalised CHW float32 model input."""
+    size = model_input.size
+    rgb = cv2.cvtColor(cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+    scaled = rgb.astype(np.float32) / max(float(rgb.max()), 1e-6)
+    normalised = (scaled - np.asarray(model_input.mean, dtype=np.float32)) / np.asarray(model_input.std, dtype=np.float32)
+    return normalised.transpose(2, 0, 1)
+
+
+def postprocess(prediction: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """Model output for one image -> uint8 mask at the image size (min-max scaled, like rembg)."""
+    low, high = float(prediction.min()), float(prediction.max())
+    scaled = (prediction - low) / max(high - low, 1e-6)
+    mask = (np.clip(scaled, 0.0, 1.0) * 255.0).astype(np.uint8)
+    return cv2.resize(mask, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+
+
+def run_batch(session, batch: np.ndarray) -> np.ndarray:
+    """Runs one batch; models exported with a fixed batch size of 1 are run image by image."""
+    model_input = session.get_inputs()[0]
+    if model_input.shape and model_input.shape[0] == 1 and len(batch) > 1:
+        return np.concatenate([session.run(None, {model_input.name: batch[i:i + 1]})[0] for i in range(len(batch))])
+    return session.run(None, {model_input.name: batch})[0]
+
+
+class _Batch(NamedTuple):
+    names: List[str]
+    shapes: List[Tuple[int, int]]
+    inputs: np.ndarray
+
+
+def _reader(paths: List[Path], batch_size: int, model_input: ModelInput, out: queue.Queue, errors: list) -> None:
+    try:
+        for start in range(0, len(paths), batch_size):
+            names, shapes, inputs = [], [], []
+            for path in paths[start:start + batch_size]:
+                image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+                if image is None:
+                    raise IOError(f"Could not read frame {path}")
+                names.append(path.name)
+                shapes.append(image.shape[:2])
+                inputs.append(preprocess(image, model_input))
+            out.put(_Batch(names, shapes, np.stack(inputs)))
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        out.put(_STOP)
+
+
+def _writer(masks_dir: Path, inbox: queue.Queue, errors: list) -> None:
+    try:
+        while (item := inbox.get()) is not _STOP:
+            batch, predictions = item
+            for name, shape, prediction in zip(batch.names, batch.shapes, predictions):
+                mask = postprocess(prediction[0], shape)
+                if not cv2.imwrite(str(masks_dir / f"{name}.png"), mask, [cv2.IMWRITE_PNG_COMPRESSION, 1]):
+                    raise IOError(f"Could not write mask for {name}")
+    except BaseException as e:
+        errors.append(e)
+        while inbox.get() is not _STOP: # Drain so the inferencer never blocks on a full queue
+            pass
+
+
+def remove_background(frames_dir: Path, images_dir: Path, masks_dir: Path, batch_size: int = REMBG_BATCH_SIZE,
+                      progress: Optional[Callable[[float], None]] = None) -> Dict:
+    """
+    Writes a mask for every frame in `frames_dir` and links the frames into `images_dir`.
+    Both directories are built next to their final location and renamed into place.
+    `progress` is called with the fraction of frames segmented after every batch.
+    Returns a summary with the throughput in frames/s.
+    """
+    paths = sorted(p for p in frames_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    model_input = MODEL_INPUTS.get(REMBG_MODEL, MODEL_INPUTS["u2net"])
+    session = get_session()
+
+    tmp_images = images_dir.with_name(images_dir.name + ".tmp")
+    tmp_masks = masks_dir.with_name(masks_dir.name + ".tmp")
+    for tmp_dir in (tmp_images, tmp_masks):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+    errors: list = []
+    to_inference: queue.Queue = queue.Queue(maxsize=_QUEUE_BATCHES)
+    to_writer: queue.Queue = queue.Queue(maxsize=_QUEUE_BATCHES)
+    reader = threading.Thread(target=_reader, args=(paths, batch_size, model_input, to_inference, errors), daemon=True)
+    writer = threading.Thread(target=_writer, args=(tmp_masks, to_writer, errors), daemon=True)
+
+    start = time.perf_counter()
+    inference_seconds = 0.0
+    done = 0
+    reader.start()
+    writer.start()
+    try:
+        # Inference runs on this thread
+        while (batch := to_inference.get()) is not _STOP:
+            if errors:
+                continue # Keep draining so the reader can finish
+            batch_start = time.perf_counter()
+            predictions = run_batch(session, batch.inputs)
+            inference_seconds += time.perf_counter() - batch_start
+            to_writer.put((batch, predictions))
+            done += len(batch.names)
+            if progress is not None:
+                progress(done / len(paths))
+    except BaseException:
+        while to_inference.get() is not _STOP: # Unblock the reader before joining it
+            pass
+        raise
+    finally:
+        to_writer.put(_STOP)
+        reader.join()
+        writer.join()
+    if errors:
+        shutil.rmtree(tmp_images, ignore_errors=True)
+        shutil.rmtree(tmp_masks, ignore_errors=True)
+        raise errors[0]
+
+    for path in paths:
+        link_file(path, tmp_images / path.name)
+    publish_dir(tmp_images, images_dir)
+    publish_dir(tmp_masks, masks_dir)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": len(paths),
+        "seconds": elapsed,
+        "frames_per_s": len(paths) / elapsed if elapsed > 0 else 0.0,
+        "inference_seconds": inference_seconds,
+        "batch_size": batch_size,
+    }
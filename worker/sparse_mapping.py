@@ -0,0 +1,150 @@
+# worker/sparse_mapping.py
+"""
+Sparse reconstruction with one incremental mapper or with partitioned submodels.
+
+Incremental SfM gets superlinearly slower with the number of images: every new image
+triggers bundle adjustments over an ever larger model. For long videos the images are
+instead partitioned into overlapping clusters of at most MAPPER_SUBMODEL_IMAGES. COLMAP's
+hierarchical_mapper cuts the match graph, which for video means runs of neighbouring
+frames plus their loop closures. The clusters are mapped in parallel and merged through
+the images they share (MAPPER_SUBMODEL_OVERLAP). Small jobs keep the single mapper:
+there partitioning only adds merge overhead. If the partitioned run fails or
+registers clearly fewer images, the single mapper is run as well and the model with
+more registered images is kept.
+
+Either way the largest model ends up in <output>/0, the layout image_undistorter and
+the Gaussian Splatting loader expect.
+"""
+import json
+import logging
+import os
+import shutil
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from worker.colmap_cli import run_colmap, ColmapError
+
+log = logging.getLogger(__name__)
+
+SPARSE_MAPPER = os.getenv("SPARSE_MAPPER", "auto") # auto | single | hierarchical
+MAPPER_PARTITION_MIN_IMAGES = int(os.getenv("MAPPER_PARTITION_MIN_IMAGES", 400))
+MAPPER_SUBMODEL_IMAGES = int(os.getenv("MAPPER_SUBMODEL_IMAGES", 200))
+MAPPER_SUBMODEL_OVERLAP = int(os.getenv("MAPPER_SUBMODEL_OVERLAP", 50))
+MAPPER_THREADS_PER_SUBMODEL = int(os.getenv("MAPPER_THREADS_PER_SUBMODEL", 2))
+# Partitioned result is discarded if it registers less than this fraction of what it was given
+MAPPER_MIN_REGISTERED_RATIO = float(os.getenv("MAPPER_MIN_REGISTERED_RATIO", 0.8))
+
+MAPPER_MODES = ("single", "hierarchical")
+MAPPING_SUMMARY = "mapping.json"
+
+
+def choose_mode(num_images: int, requested: Optional[str] = None) -> str:
+    requested = requested or SPARSE_MAPPER
+    if requested in MAPPER_MODES:
+        return requested
+    return "hierarchical" if num_images >= MAPPER_PARTITION_MIN_IMAGES else "single"
+
+
+def num_registered_images(model_dir: Path) -> int:
+    """Registered images of a COLMAP model (binary or text format)."""
+    binary = model_dir / "images.bin"
+    if binary.exists():
+        with open(binary, "rb") as f:
+            return struct.unpack("<Q", f.read(8))[0]
+    text = model_dir / "images.txt"
+    if text.exists():
+        lines = [line for line in text.read_text().splitlines() if line and not line.startswith("#")]
+        return len(lines) // 2 # Two lines per image
+    return 0
+
+
+def list_models(output_dir: Path) -> List[Tuple[int, Path]]:
+    """(registered images, model dir) of every model in `output_dir`, largest first."""
+    models = [(num_registered_images(d), d) for d in output_dir.iterdir() if d.is_dir() and d.name.isdigit()] if output_dir.exists() else []
+    return sorted(models, key=lambda m: m[0], reverse=True)
+
+
+def promote_largest_model(output_dir: Path) -> int:
+    """Renames the models so the largest one is <output_dir>/0. Returns its registered image count."""
+    models = list_models(output_dir)
+    if not models:
+        return 0
+    for i, (_, model_dir) in enumerate(models):
+        model_dir.rename(output_dir / f".model-{i}")
+    for i in range(len(models)):
+        (output_dir / f".model-{i}").rename(output_dir / str(i))
+    return models[0][0]
+
+
+def _mapper_options(mode: str, database_path: Path, image_dir: Path, output_dir: Path, threads: int) -> Tuple[str, Dict]:
+    options = {"database_path": database_path, "image_path": image_dir, "output_path": output_dir}
+    if mode == "single":
+        options["Mapper.num_threads"] = threads
+        return "mapper", options
+    # Submodels run in parallel; their threads together stay within the budget
+    workers = max(1, threads // MAPPER_THREADS_PER_SUBMODEL)
+    options.update({
+        "num_workers": workers,
+        "leaf_max_num_images": MAPPER_SUBMODEL_IMAGES,
+        "image_overlap": MAPPER_SUBMODEL_OVERLAP,
+        "Mapper.num_threads": max(1, threads // workers),
+    })
+    return "hierarchical_mapper", options
+
+
+def _run(mode: str, database_path: Path, image_dir: Path, output_dir: Path, log_dir: Path, threads: int) -> Dict:
+    shutil.rmtree(output_dir, ignore_errors=True)
+    output_dir.mkdir(parents=True)
+    command, options = _mapper_options(mode, database_path, image_dir, output_dir, threads)
+    seconds = run_colmap(command, options, log_dir, threads=threads)
+    registered = promote_largest_model(output_dir)
+    return {"mode": mode, "seconds": round(seconds, 2), "registered_images": registered,
+            "models": len(list_models(output_dir))}
+
+
+def run_sparse_mapping(database_path: Path, image_dir: Path, output_dir: Path, log_dir: Path,
+                       num_images: int, threads: int, requested: Optional[str] = None) -> Dict:
+    """
+    Maps the images of `database_path` into `output_dir` (largest model in <output_dir>/0) and
+    writes a mapping.json summary next to it. Returns the summary.
+    """
+    mode = choose_mode(num_images, requested)
+    attempts = []
+    summary = None
+    if mode == "hierarchical":
+        partitioned_dir = output_dir.with_name(output_dir.name + ".partitioned")
+        partitioned = None
+        try:
+            partitioned = _run("hierarchical", database_path, image_dir, partitioned_dir, log_dir, threads)
+            attempts.append(partitioned)
+        except ColmapError as e:
+            log.warning(f"Partitioned mapping failed, falling back to a single mapper: {e}")
+            attempts.append({"mode": "hierarchical", "error": str(e)[-500:]})
+        if partitioned is not None and partitioned["registered_images"] >= MAPPER_MIN_REGISTERED_RATIO * num_images:
+            summary = partitioned
+        elif partitioned is not None:
+            log.warning(f"Partitioned mapping registered only {partitioned['registered_images']} of {num_images} images, "
+                        "trying a single mapper.")
+            try:
+                single = _run("single", database_path, image_dir, output_dir, log_dir, threads)
+                attempts.append(single)
+                summary = single if single["registered_images"] >= partitioned["registered_images"] else partitioned
+            except ColmapError as e:
+                # The partitioned model is incomplete, but better than none
+                log.warning(f"Single mapper failed, keeping the partitioned model: {e}")
+                attempts.append({"mode": "single", "error": str(e)[-500:]})
+                summary = partitioned
+        if summary is not None and summary["mode"] == "hierarchical":
+            shutil.rmtree(output_dir, ignore_errors=True)
+            partitioned_dir.rename(output_dir)
+        shutil.rmtree(partitioned_dir, ignore_errors=True)
+    if summary is None:
+        summary = _run("single", database_path, image_dir, output_dir, log_dir, threads)
+        attempts.append(summary)
+    if summary["registered_images"] == 0:
+        raise ColmapError(f"No images could be registered ({summary['mode']} mapper).")
+
+    summary = {**summary, "images": num_images, "threads": threads, "attempts": attempts}
+    (output_dir.parent / MAPPING_SUMMARY).write_text(json.dumps(summary, indent=2))
+    return summary
@@ -0,0 +1,494 @@
+# worker/splat_compress.py
+"""
+Quantized, entropy-coded splat format (.csplat).
+
+Gaussians are Morton-ordered and grouped into chunks of CHUNK_SIZE splats. Per chunk the
+bounding box of the positions is stored as float32. Per splat, at the bit depths of a
+profile (PROFILES):
+
+    position  x/y/z cell inside the chunk box, interleaved into a chunk-local Morton key.
+              Splats are sorted by that key within their chunk, and each key is stored as
+              the difference to the previous one
+    scale     3 x u8   log-scale, quantized over the scene's log-scale range
+    rotation  3 x u8   x, y, z of the canonical quaternion (below); w is implied
+    color     4 x u8   RGB from SH band 0, alpha from opacity
+    sh        K x u8   optional: indices into a 256-entry codebook of SH band 1+ coefficients
+
+Canonical rotations: a Gaussian does not change when its local axes are permuted or
+flipped together with its scales. Of the 24 equivalent rotations (the cube's rotation
+group), the one closest to identity is stored, largest w first, and the scales are
+permuted to match. x, y and z then lie within +-sin(pi/8): about half the range of the
+smallest-three encoding, with no index to store.
+
+Each column is LZMA-coded (xz) on its own. Its byte layout is whichever codes smallest on
+the first block: byte planes, interleaved rows, or row-to-row byte deltas. LZMA's range
+coder and its adaptive context models then spend few bits on the skewed, locally
+correlated values that Morton order produces.
+
+    b"CSPLAT2\\n" | uint32 header length | header JSON | column blobs
+
+Encoding streams through the memory-mapped PLY block by block, spooling each
+compressed column to a temporary file, so memory stays bounded.
+"""
+import json
+import logging
+import lzma
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from worker.splat_io import (
+    DEFAULT_CHUNK_SIZE, SH_C0, SPLAT_DTYPE,
+    iter_chunks, morton_keys, open_ply_vertices,
+)
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"CSPLAT2\n"
+FORMAT_VERSION = 2
+
+# Bits per value. Position bits are per axis within a chunk's box. On the synthetic scene of
+# benchmarks/bench_splat_compress.py, "compact" is about 5.4x smaller than .splat (4.7x on
+# random attributes); "high" keeps about .splat's precision at about 3x
+PROFILES = {
+    "compact": {"position": 7, "scale": 6, "rotation": 5, "color": 5, "alpha": 5},
+    "high": {"position": 11, "scale": 8, "rotation": 8, "color": 8, "alpha": 8},
+}
+DEFAULT_PROFILE = "compact"
+
+# Splats sharing one quantization bounding box
+CHUNK_SIZE = 256
+# Rows per filter block; a multiple of CHUNK_SIZE
+BLOCK_ROWS = (DEFAULT_CHUNK_SIZE // CHUNK_SIZE) * CHUNK_SIZE
+# Rows of the first block on which the byte layout of a column is chosen
+_LAYOUT_SAMPLE_ROWS = 65_536
+
+SH_CODEBOOK_SIZE = 256
+_SH_CODEBOOK_SAMPLES = 1_000_000
+_LZMA_PRESET = 6 # ~100 MB to compress, ~10 MB to decompress
+
+_ROTATION_RANGE = np.float32(np.sin(np.pi / 8)) # Bound of x, y, z of a canonical quaternion
+
+
+# --- Quantization helpers ---
+
+def _quantize(values: np.ndarray, lo, hi, bits: int) -> np.ndarray:
+    top = (1 << bits) - 1
+    span = np.maximum(hi - lo, np.float32(1e-12))
+    q = np.rint((values - lo) / span * top)
+    return np.clip(q, 0, top).astype(np.uint32)
+
+
+def _dequantize(q: np.ndarray, lo, hi, bits: int) -> np.ndarray:
+    return lo + q.astype(np.float32) / np.float32((1 << bits) - 1) * (hi - lo)
+
+
+def _chunk_bounds(values: np.ndarray, count: int) -> np.ndarray:
+    """Per-chunk (min, max) of (N, 3) values; a trailing partial chunk is padded with its last row."""
+    num_chunks = -(-count // CHUNK_SIZE)
+    padded = np.pad(values, ((0, num_chunks * CHUNK_SIZE - count), (0, 0)), mode="edge")
+    grouped = padded.reshape(num_chunks, CHUNK_SIZE, 3)
+    return np.concatenate([grouped.min(axis=1), grouped.max(axis=1)], axis=1)
+
+
+def _expand_chunks(per_chunk: np.ndarray, count: int) -> np.ndarray:
+    return np.repeat(per_chunk, CHUNK_SIZE, axis=0)[:count]
+
+
+def _chunk_starts(count: int) -> np.ndarray:
+    return np.arange(0, count, CHUNK_SIZE)
+
+
+# --- Positions: chunk-local Morton keys ---
+
+def _positions(vertices: np.ndarray) -> np.ndarray:
+    return np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=1).astype(np.float32)
+
+
+def _position_cells(xyz: np.ndarray, bounds: np.ndarray, bits: int) -> np.ndarray:
+    n = len(xyz)
+    return _quantize(xyz, _expand_chunks(bounds[:, :3], n), _expand_chunks(bounds[:, 3:], n), bits)
+
+
+def _interleave(cells: np.ndarray, bits: int) -> np.ndarray:
+    """(N, 3) cells of `bits` bits to Morton keys (x in the highest bit of each triple)."""
+    keys = np.zeros(len(cells), dtype=np.uint64)
+    cells = cells.astype(np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            keys |= ((cells[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + 2 - axis)
+    return keys
+
+
+def _deinterleave(keys: np.ndarray, bits: int) -> np.ndarray:
+    cells = np.zeros((len(keys), 3), dtype=np.uint32)
+    for bit in range(bits):
+        for axis in range(3):
+            cells[:, axis] |= (((keys >> np.uint64(3 * bit + 2 - axis)) & np.uint64(1)) << np.uint64(bit)).astype(np.uint32)
+    return cells
+
+
+def _key_dtype(bits: int) -> str:
+    return "<u4" if 3 * bits <= 32 else "<u8"
+
+
+def encoding_order(vertices: np.ndarray, position_bits: int) -> np.ndarray:
+    """Order of the splats in the file: Morton order, then the chunk-local Morton key within each chunk."""
+    permutation = np.argsort(morton_keys(vertices))
+    for block_slice in iter_chunks(len(vertices), BLOCK_ROWS):
+        block_permutation = permutation[block_slice]
+        xyz = _positions(vertices[["x", "y", "z"]][block_permutation])
+        keys = _interleave(_position_cells(xyz, _chunk_bounds(xyz, len(xyz)), position_bits), position_bits)
+        chunk_index = np.arange(len(xyz)) // CHUNK_SIZE
+        permutation[block_slice] = block_permutation[np.lexsort((keys, chunk_index))]
+    return permutation
+
+
+# --- Rotations: canonical quaternions ---
+
+def _cube_rotations() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The 24 rotations of the cube as quaternions (w, x, y, z), and for each the permutation of
+    the local axes it applies: axis i of the rotated frame is axis perm[i] of the original.
+    """
+    h, r = 0.5, np.sqrt(0.5)
+    quats = [(1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1)]
+    for axis in range(3): # 90 and 270 degrees about each axis
+        for sign in (1, -1):
+            q = [r, 0, 0, 0]
+            q[1 + axis] = sign * r
+            quats.append(q)
+    for a, b in ((1, 2), (1, 3), (2, 3)): # 180 degrees about the face diagonals
+        for sign in (1, -1):
+            q = [0, 0, 0, 0]
+            q[a], q[b] = r, sign * r
+            quats.append(q)
+    for sx in (1, -1): # 120 and 240 degrees about the body diagonals
+        for sy in (1, -1):
+            for sz in (1, -1):
+                quats.append((h, sx * h, sy * h, sz * h))
+    quats = np.array(quats, dtype=np.float64)
+    perms = np.array([np.argmax(np.abs(_rotation_matrix(q)), axis=0) for q in quats])
+    return quats.astype(np.float32), perms
+
+
+def _rotation_matrix(q: np.ndarray) -> np.ndarray:
+    w, x, y, z = q
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+_CUBE_QUATS, _CUBE_PERMS = _cube_rotations()
+
+
+def canonicalize_rotations(quat: np.ndarray, log_scale: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Same Gaussians with the rotation closest to identity: q * g over the cube rotations g,
+    w >= 0, scales permuted to the new axes. Returns (unit quaternions, log-scales).
+    """
+    quat = quat / np.maximum(np.linalg.norm(quat, axis=1, keepdims=True), np.float32(1e-12))
+    conjugates = _CUBE_QUATS * np.array([1, -1, -1, -1], dtype=np.float32)
+    best = np.argmax(np.abs(quat @ conjugates.T), axis=1) # w of q * g for every g
+    g = _CUBE_QUATS[best]
+    w1, x1, y1, z1 = quat.T
+    w2, x2, y2, z2 = g.T
+    canonical = np.stack([
+        w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+        w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+        w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+        w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2,
+    ], axis=1)
+    canonical *= np.where(canonical[:, 0] < 0, -1.0, 1.0).astype(np.float32)[:, None]
+    return canonical, np.take_along_axis(log_scale, _CUBE_PERMS[best], axis=1)
+
+
+def _pack_rotation(canonical: np.ndarray, bits: int) -> np.ndarray:
+    return _quantize(canonical[:, 1:], -_ROTATION_RANGE, _ROTATION_RANGE, bits)
+
+
+def _unpack_rotation(packed: np.ndarray, bits: int) -> np.ndarray:
+    xyz = _dequantize(packed, -_ROTATION_RANGE, _ROTATION_RANGE, bits)
+    w = np.sqrt(np.maximum(0.0, 1.0 - np.sum(xyz * xyz, axis=1)))
+    quat = np.concatenate([w[:, None], xyz], axis=1)
+    return quat / np.linalg.norm(quat, axis=1, keepdims=True)
+
+
+# --- Column layouts ---
+
+def _filter(rows: np.ndarray, kind: Optional[str]) -> bytes:
+    if kind == "shuffle": # Byte planes
+        return np.ascontiguousarray(rows).view(np.uint8).reshape(len(rows), -1).T.tobytes()
+    if kind == "delta":
+        data = rows.reshape(len(rows), -1)
+        out = np.empty_like(data)
+        out[0] = data[0]
+        np.subtract(data[1:], data[:-1], out=out[1:]) # wraps modulo 256
+        return out.tobytes()
+    return np.ascontiguousarray(rows).tobytes()
+
+
+def _unfilter(raw: bytes, kind: Optional[str], dtype: np.dtype, row_shape: List[int], num_rows: int) -> np.ndarray:
+    if kind == "shuffle":
+        row_bytes = dtype.itemsize * int(np.prod(row_shape, dtype=np.int64))
+        data = np.frombuffer(raw, dtype=np.uint8).reshape(row_bytes, num_rows).T.copy()
+        return data.view(dtype).reshape([num_rows] + row_shape)
+    if kind == "delta":
+        data = np.frombuffer(raw, dtype=dtype).reshape(num_rows, -1)
+        return np.cumsum(data, axis=0, dtype=dtype).reshape([num_rows] + row_shape)
+    return np.frombuffer(raw, dtype=dtype).reshape([num_rows] + row_shape).copy()
+
+
+def _lzma_compressor():
+    return lzma.LZMACompressor(format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC32, preset=_LZMA_PRESET)
+
+
+class _ColumnWriter:
+    """LZMA-codes one column block by block into a temporary spool file, in the best of `layouts`."""
+
+    def __init__(self, name: str, dtype: str, row_shape: List[int], layouts: Sequence[Optional[str]], spool_dir: Path):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.layouts = tuple(layouts)
+        self.filter_kind = self.layouts[0] if len(self.layouts) == 1 else None
+        self._chosen = len(self.layouts) == 1
+        self.rows = 0
+        self.block_rows: List[int] = []
+        self._compressor = _lzma_compressor()
+        self._spool = tempfile.TemporaryFile(dir=spool_dir)
+
+    def _choose_layout(self, rows: np.ndarray) -> None:
+        sample = rows[:_LAYOUT_SAMPLE_ROWS]
+        sizes = {}
+        for kind in self.layouts:
+            compressor = _lzma_compressor()
+            sizes[kind] = len(compressor.compress(_filter(sample, kind))) + len(compressor.flush())
+        self.filter_kind = min(self.layouts, key=sizes.get)
+        self._chosen = True
+
+    def append(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        rows = rows.astype(self.dtype, copy=False)
+        if not self._chosen:
+            self._choose_layout(rows)
+        self._spool.write(self._compressor.compress(_filter(rows, self.filter_kind)))
+        self.rows += len(rows)
+        self.block_rows.append(len(rows))
+
+    def finish(self) -> int:
+        self._spool.write(self._compressor.flush())
+        length = self._spool.tell()
+        self._spool.seek(0)
+        return length
+
+    def describe(self, offset: int, length: int) -> Dict:
+        return {
+            "name": self.name, "dtype": self.dtype.str, "shape": self.row_shape,
+            "rows": self.rows, "blocks": self.block_rows, "filter": self.filter_kind,
+            "codec": "xz", "offset": offset, "length": length,
+        }
+
+    def copy_to(self, out_file) -> None:
+        shutil.copyfileobj(self._spool, out_file, 1024 * 1024)
+        self._spool.close()
+
+
+_BYTE_LAYOUTS = ("shuffle", None, "delta") # For u8 rows: planes, interleaved, deltas
+
+
+# --- Encoding ---
+
+def _sh_rest_names(dtype: np.dtype) -> List[str]:
+    names = [n for n in dtype.names if n.startswith("f_rest_")]
+    return sorted(names, key=lambda n: int(n.rsplit("_", 1)[1]))
+
+
+def _build_sh_codebook(vertices: np.ndarray, names: List[str]) -> np.ndarray:
+    """256 quantile centroids of the SH band 1+ coefficients, from a strided sample."""
+    step = max(1, len(vertices) * len(names) // _SH_CODEBOOK_SAMPLES)
+    sample = np.concatenate([vertices[name][::step].astype(np.float32) for name in names])
+    quantiles = (np.arange(SH_CODEBOOK_SIZE, dtype=np.float64) + 0.5) / SH_CODEBOOK_SIZE
+    return np.unique(np.quantile(sample, quantiles).astype(np.float32))
+
+
+def write_compressed_splat(ply_path: Path, out_path: Path, keep_sh: bool = False,
+                           profile: str = DEFAULT_PROFILE) -> Dict:
+    """
+    Encodes a Gaussian Splatting PLY into the compressed column format.
+    Returns a summary with the record count and output size.
+    """
+    bits = PROFILES[profile]
+    vertices = np.asarray(open_ply_vertices(ply_path))
+    count = len(vertices)
+    permutation = encoding_order(vertices, bits["position"])
+    scale_names = ["scale_0", "scale_1", "scale_2"]
+    scale_range = ([float(min(vertices[name].min() for name in scale_names)),
+                    float(max(vertices[name].max() for name in scale_names))] if count else [0.0, 0.0])
+
+    sh_names = _sh_rest_names(vertices.dtype) if keep_sh else []
+    sh_codebook = _build_sh_codebook(vertices, sh_names) if sh_names and count else None
+    if sh_codebook is not None:
+        sh_midpoints = (sh_codebook[1:] + sh_codebook[:-1]) * 0.5
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    spool_dir = out_path.parent
+    columns = [
+        _ColumnWriter("chunk_position", "<f4", [6], ("shuffle",), spool_dir),
+        _ColumnWriter("position", _key_dtype(bits["position"]), [], ("shuffle",), spool_dir),
+        _ColumnWriter("scale", "u1", [3], _BYTE_LAYOUTS, spool_dir),
+        _ColumnWriter("rotation", "u1", [3], _BYTE_LAYOUTS, spool_dir),
+        _ColumnWriter("color", "u1", [4], _BYTE_LAYOUTS, spool_dir),
+    ]
+    if sh_codebook is not None:
+        columns.append(_ColumnWriter("sh_codebook", "<f4", [], (None,), spool_dir))
+        columns.append(_ColumnWriter("sh", "u1", [len(sh_names)], _BYTE_LAYOUTS, spool_dir))
+    by_name = {c.name: c for c in columns}
+
+    try:
+        if sh_codebook is not None:
+            by_name["sh_codebook"].append(sh_codebook)
+
+        for block_slice in iter_chunks(count, BLOCK_ROWS):
+            block = vertices.take(permutation[block_slice])
+            n = len(block)
+
+            # Keys are sorted within each chunk (encoding_order): store the gaps
+            xyz = _positions(block)
+            pos_bounds = _chunk_bounds(xyz, n)
+            by_name["chunk_position"].append(pos_bounds)
+            keys = _interleave(_position_cells(xyz, pos_bounds, bits["position"]), bits["position"])
+            gaps = np.empty_like(keys)
+            gaps[0] = keys[0]
+            np.subtract(keys[1:], keys[:-1], out=gaps[1:])
+            starts = _chunk_starts(n)
+            gaps[starts] = keys[starts]
+            by_name["position"].append(gaps)
+
+            quat = np.stack([block[f"rot_{i}"] for i in range(4)], axis=1).astype(np.float32)
+            log_scale = np.stack([block[name] for name in scale_names], axis=1).astype(np.float32)
+            canonical, log_scale = canonicalize_rotations(quat, log_scale)
+            by_name["scale"].append(_quantize(log_scale, np.float32(scale_range[0]), np.float32(scale_range[1]), bits["scale"]))
+            by_name["rotation"].append(_pack_rotation(canonical, bits["rotation"]))
+
+            color = np.empty((n, 4), dtype=np.uint32)
+            for channel in range(3):
+                color[:, channel] = _quantize(0.5 + SH_C0 * block[f"f_dc_{channel}"].astype(np.float32), 0.0, 1.0, bits["color"])
+            alpha = 1.0 / (1.0 + np.exp(-block["opacity"].astype(np.float32)))
+            color[:, 3] = _quantize(alpha, 0.0, 1.0, bits["alpha"])
+            by_name["color"].append(color)
+
+            if sh_codebook is not None:
+                sh = np.stack([block[name] for name in sh_names], axis=1).astype(np.float32)
+                by_name["sh"].append(np.searchsorted(sh_midpoints, sh).astype(np.uint8))
+
+        lengths = [c.finish() for c in columns]
+        descriptions, offset = [], 0
+        for column, length in zip(columns, lengths):
+            descriptions.append(column.describe(offset, length))
+            offset += length
+        header = json.dumps({
+            "version": FORMAT_VERSION,
+            "count": count,
+            "chunk_size": CHUNK_SIZE,
+            "profile": profile,
+            "bits": bits,
+            "scale_range": scale_range,
+            "sh_coefficients": len(sh_names) if sh_codebook is not None else 0,
+            "columns": descriptions,
+        }).encode("utf-8")
+
+        with open(tmp_path, "wb") as out_file:
+            out_file.write(MAGIC)
+            out_file.write(struct.pack("<I", len(header)))
+            out_file.write(header)
+            for column in columns:
+                column.copy_to(out_file)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        del vertices
+
+    size = out_path.stat().st_size
+    log.info(f"Wrote {count} compressed splats ({profile}, {size} bytes, {size / max(count, 1):.2f} B/splat) to {out_path}")
+    return {"count": count, "bytes": size}
+
+
+# --- Decoding ---
+
+def read_compressed_splat(path: Path) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """Reads and unfilters every column of a compressed splat file. Returns (header, {column name: array})."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compressed splat file (version {FORMAT_VERSION})")
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_len))
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported compressed splat version {header.get('version')}")
+        data_start = f.tell()
+
+        columns: Dict[str, np.ndarray] = {}
+        for desc in header["columns"]:
+            f.seek(data_start + desc["offset"])
+            raw = lzma.decompress(f.read(desc["length"]))
+            dtype = np.dtype(desc["dtype"])
+            row_bytes = dtype.itemsize * int(np.prod(desc["shape"], dtype=np.int64))
+            parts, pos = [], 0
+            for num_rows in desc["blocks"]:
+                size = num_rows * row_bytes
+                parts.append(_unfilter(raw[pos:pos + size], desc["filter"], dtype, desc["shape"], num_rows))
+                pos += size
+            if parts:
+                columns[desc["name"]] = np.concatenate(parts)
+            else:
+                columns[desc["name"]] = np.empty([0] + desc["shape"], dtype=dtype)
+    return header, columns
+
+
+def decode_compressed_attributes(path: Path) -> Dict[str, np.ndarray]:
+    """
+    Decodes a compressed splat file into float attributes, in file order: position (N, 3),
+    log_scale (N, 3), rotation (N, 4, canonical w, x, y, z) and color (N, 4, RGBA in 0-1).
+    """
+    header, columns = read_compressed_splat(path)
+    count, bits = header["count"], header["bits"]
+    gaps = columns["position"].astype(np.uint64)
+    keys = np.cumsum(gaps, dtype=np.uint64)
+    starts = _chunk_starts(count)
+    if count:
+        keys -= np.repeat(keys[starts] - gaps[starts], np.diff(np.append(starts, count)))
+    pos_bounds = _expand_chunks(columns["chunk_position"], count)
+    position = _dequantize(_deinterleave(keys, bits["position"]), pos_bounds[:, :3], pos_bounds[:, 3:], bits["position"])
+
+    scale_lo, scale_hi = (np.float32(v) for v in header["scale_range"])
+    color = np.empty((count, 4), dtype=np.float32)
+    color[:, :3] = _dequantize(columns["color"][:, :3], 0.0, 1.0, bits["color"])
+    color[:, 3] = _dequantize(columns["color"][:, 3], 0.0, 1.0, bits["alpha"])
+    return {
+        "position": position,
+        "log_scale": _dequantize(columns["scale"], scale_lo, scale_hi, bits["scale"]),
+        "rotation": _unpack_rotation(columns["rotation"], bits["rotation"]),
+        "color": color,
+    }
+
+
+def decode_compressed_splat(path: Path) -> np.ndarray:
+    """Decodes a compressed splat file into .splat records (SPLAT_DTYPE), in file order."""
+    attributes = decode_compressed_attributes(path)
+    out = np.empty(len(attributes["position"]), dtype=SPLAT_DTYPE)
+    out["position"] = attributes["position"]
+    out["scale"] = np.exp(attributes["log_scale"])
+    out["color"] = np.clip(np.rint(attributes["color"] * 255.0), 0, 255)
+    out["rotation"] = np.clip(attributes["rotation"] * 128.0 + 128.0, 0, 255)
+    return out
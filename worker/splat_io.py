@@ -0,0 +1,277 @@
+# worker/splat_io.py
+"""
+Reading of binary 3D Gaussian Splatting PLY files and writing of .splat files.
+
+The PLY is never loaded as a whole: it is memory-mapped as a NumPy structured
+array and converted in fixed-size chunks, so peak memory is bounded by the
+chunk size rather than by the number of Gaussians.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Spherical harmonics band 0 constant, used to turn f_dc_* into base colour
+SH_C0 = 0.28209479177387814
+
+# Gaussians converted per vectorized step (~65 MB of PLY data for a full 3DGS vertex)
+DEFAULT_CHUNK_SIZE = 262_144
+
+# Record orders supported for .splat output
+ORDER_NONE = "none"              # PLY order
+ORDER_IMPORTANCE = "importance"  # largest scale volume x opacity first, for progressive streaming
+ORDER_MORTON = "morton"          # Z-order curve, for spatial locality
+SPLAT_ORDERS = (ORDER_NONE, ORDER_IMPORTANCE, ORDER_MORTON)
+
+# Bits per axis in a Morton key (3 x 21 bits packed into one uint64)
+MORTON_BITS = 21
+
+# One .splat record: position (3 x f32), scale (3 x f32), RGBA (4 x u8), rotation (4 x u8)
+SPLAT_DTYPE = np.dtype([
+    ("position", "<f4", (3,)),
+    ("scale", "<f4", (3,)),
+    ("color", "u1", (4,)),
+    ("rotation", "u1", (4,)),
+])
+assert SPLAT_DTYPE.itemsize == 32
+
+_PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+
+_REQUIRED_PROPERTIES = (
+    "x", "y", "z",
+    "scale_0", "scale_1", "scale_2",
+    "f_dc_0", "f_dc_1", "f_dc_2",
+    "opacity",
+    "rot_0", "rot_1", "rot_2", "rot_3",
+)
+
+
+def read_ply_header(ply_path: Path) -> Tuple[np.dtype, int, int]:
+    """Parses a binary PLY header. Returns (vertex dtype, vertex count, data offset)."""
+    with open(ply_path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"{ply_path} is not a PLY file")
+
+        byte_order = None
+        vertex_count = None
+        fields = []
+        current_element = None
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"{ply_path}: unexpected end of file inside PLY header")
+            tokens = line.decode("ascii", errors="replace").split()
+            if not tokens or tokens[0] in ("comment", "obj_info"):
+                continue
+            if tokens[0] == "end_header":
+                break
+            if tokens[0] == "format":
+                if tokens[1] == "binary_little_endian":
+                    byte_order = "<"
+                elif tokens[1] == "binary_big_endian":
+                    byte_order = ">"
+                else:
+                    raise ValueError(f"{ply_path}: unsupported PLY format '{tokens[1]}', expected binary")
+            elif tokens[0] == "element":
+                current_element = tokens[1]
+                if current_element == "vertex":
+                    vertex_count = int(tokens[2])
+                elif vertex_count is None:
+                    raise ValueError(f"{ply_path}: element '{current_element}' before 'vertex' is not supported")
+            elif tokens[0] == "property" and current_element == "vertex":
+                if tokens[1] == "list":
+                    raise ValueError(f"{ply_path}: list properties on vertices are not supported")
+                if tokens[1] not in _PLY_TYPES:
+                    raise ValueError(f"{ply_path}: unknown PLY property type '{tokens[1]}'")
+                fields.append((tokens[2], _PLY_TYPES[tokens[1]]))
+        data_offset = f.tell()
+
+    if byte_order is None or vertex_count is None:
+        raise ValueError(f"{ply_path}: PLY header is missing 'format' or 'element vertex'")
+
+    dtype = np.dtype([(name, byte_order + code) for name, code in fields])
+    missing = [p for p in _REQUIRED_PROPERTIES if p not in dtype.names]
+    if missing:
+        raise ValueError(f"{ply_path}: not a Gaussian Splatting PLY, missing properties: {', '.join(missing)}")
+    return dtype, vertex_count, data_offset
+
+
+def open_ply_vertices(ply_path: Path) -> np.ndarray:
+    """Memory-maps the vertex data of a binary Gaussian Splatting PLY (read-only)."""
+    dtype, count, offset = read_ply_header(ply_path)
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(ply_path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def iter_chunks(count: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[slice]:
+    """Yields consecutive slices covering range(count)."""
+    for start in range(0, count, chunk_size):
+        yield slice(start, min(start + chunk_size, count))
+
+
+def splat_records(vertices: np.ndarray) -> np.ndarray:
+    """Converts a chunk of PLY vertices into .splat records (vectorized)."""
+    out = np.empty(len(vertices), dtype=SPLAT_DTYPE)
+
+    position = out["position"]
+    scale = out["scale"]
+    for axis, name in enumerate(("x", "y", "z")):
+        position[:, axis] = vertices[name]
+    for axis in range(3):
+        # PLY stores log-scales
+        scale[:, axis] = np.exp(vertices[f"scale_{axis}"])
+
+    color = out["color"]
+    for channel in range(3):
+        c = (0.5 + SH_C0 * vertices[f"f_dc_{channel}"].astype(np.float32)) * 255.0
+        color[:, channel] = np.clip(c, 0.0, 255.0)
+    # PLY stores opacity as a logit
+    alpha = 255.0 / (1.0 + np.exp(-vertices["opacity"].astype(np.float32)))
+    color[:, 3] = np.clip(alpha, 0.0, 255.0)
+
+    rot = np.empty((len(vertices), 4), dtype=np.float32)
+    for i in range(4):
+        rot[:, i] = vertices[f"rot_{i}"]
+    norm = np.linalg.norm(rot, axis=1, keepdims=True)
+    np.maximum(norm, np.finfo(np.float32).tiny, out=norm)
+    rot *= 128.0 / norm
+    rot += 128.0
+    out["rotation"] = np.clip(rot, 0.0, 255.0)
+    return out
+
+
+def importance_keys(vertices: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.ndarray:
+    """
+    Returns log(scale volume x opacity) per Gaussian as float32, computed in chunks.
+    Working in log space keeps the key finite for very large or tiny Gaussians.
+    """
+    keys = np.empty(len(vertices), dtype=np.float32)
+    for chunk in iter_chunks(len(vertices), chunk_size):
+        block = vertices[chunk]
+        log_volume = block["scale_0"].astype(np.float32) + block["scale_1"] + block["scale_2"]
+        # log(sigmoid(opacity)) == -log(1 + exp(-opacity))
+        keys[chunk] = log_volume - np.logaddexp(np.float32(0.0), -block["opacity"].astype(np.float32))
+    return keys
+
+
+def position_bounds(vertices: np.ndarray, max_samples: int = 1_000_000,
+                    percentile: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Robust scene bounds from a strided sample of positions.
+    Trained scenes contain far-away floaters, so the extreme `percentile`
+    on each side is clipped rather than stretching the box to fit them.
+    """
+    step = max(1, len(vertices) // max_samples)
+    sample = vertices[::step]
+    xyz = np.stack([sample["x"], sample["y"], sample["z"]], axis=1).astype(np.float32)
+    lo = np.percentile(xyz, percentile, axis=0).astype(np.float32)
+    hi = np.percentile(xyz, 100.0 - percentile, axis=0).astype(np.float32)
+    return lo, hi
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Spreads the low 21 bits of each uint64 so that there are two zero bits between them."""
+    v = v & np.uint64(0x1FFFFF)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x001F00000000FFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x001F0000FF0000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100F00F00F00F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10C30C30C30C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_keys(vertices: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                bounds: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """Returns 63-bit Morton (Z-order) keys of the Gaussian positions, computed in chunks."""
+    lo, hi = bounds if bounds is not None else position_bounds(vertices)
+    max_cell = (1 << MORTON_BITS) - 1
+    cell_scale = max_cell / np.maximum(hi - lo, np.float32(1e-12))
+
+    keys = np.empty(len(vertices), dtype=np.uint64)
+    for chunk in iter_chunks(len(vertices), chunk_size):
+        block = vertices[chunk]
+        key = np.zeros(len(block), dtype=np.uint64)
+        for axis, name in enumerate(("x", "y", "z")):
+            cell = np.clip((block[name] - lo[axis]) * cell_scale[axis], 0, max_cell).astype(np.uint64)
+            key |= _spread_bits(cell) << np.uint64(axis)
+        keys[chunk] = key
+    return keys
+
+
+def splat_order(vertices: np.ndarray, order: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[np.ndarray]:
+    """Returns the record permutation for the requested order, or None to keep PLY order."""
+    if order == ORDER_NONE:
+        return None
+    if order == ORDER_IMPORTANCE:
+        keys = importance_keys(vertices, chunk_size)
+        np.negative(keys, out=keys) # descending
+        return np.argsort(keys)
+    if order == ORDER_MORTON:
+        return np.argsort(morton_keys(vertices, chunk_size))
+    raise ValueError(f"Unknown splat order '{order}', expected one of: {', '.join(SPLAT_ORDERS)}")
+
+
+def write_splat(ply_path: Path, splat_path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                order: str = ORDER_NONE) -> int:
+    """
+    Streams a Gaussian Splatting PLY into a .splat file, chunk by chunk, in the given record order.
+    The output is written to a temporary file and renamed into place. Returns the record count.
+    """
+    # Plain ndarray view of the mapping: np.take on it is far cheaper than fancy-indexing a np.memmap
+    vertices = np.asarray(open_ply_vertices(ply_path))
+    count = len(vertices)
+    permutation = splat_order(vertices, order, chunk_size)
+
+    splat_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = splat_path.with_name(splat_path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as out_file:
+            for chunk in iter_chunks(count, chunk_size):
+                block = vertices[chunk] if permutation is None else vertices.take(permutation[chunk])
+                splat_records(block).tofile(out_file)
+        os.replace(tmp_path, splat_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        del vertices
+
+    log.info(f"Wrote {count} splats ({count * SPLAT_DTYPE.itemsize} bytes, order={order}) to {splat_path}")
+    return count
+
+
+def read_splat(splat_path: Path) -> np.ndarray:
+    """Memory-maps a .splat file as an array of SPLAT_DTYPE records (read-only)."""
+    size = os.path.getsize(splat_path)
+    if size % SPLAT_DTYPE.itemsize:
+        raise ValueError(f"{splat_path}: size {size} is not a multiple of {SPLAT_DTYPE.itemsize}")
+    if size == 0:
+        return np.empty(0, dtype=SPLAT_DTYPE)
+    return np.memmap(splat_path, dtype=SPLAT_DTYPE, mode="r")
+
+
+def find_trained_ply(model_dir: Path) -> Path:
+    """Returns point_cloud.ply of the highest saved iteration in a Gaussian Splatting model directory."""
+    candidates = []
+    for ply in (model_dir / "point_cloud").glob("iteration_*/point_cloud.ply"):
+        try:
+            candidates.append((int(ply.parent.name.split("_", 1)[1]), ply))
+        except ValueError:
+            continue
+    if not candidates:
+        raise FileNotFoundError(f"No trained point_cloud.ply found under {model_dir / 'point_cloud'}")
+    return max(candidates)[1]
@@ -0,0 +1,161 @@
+# worker/splat_lod.py
+"""
+Level-of-detail pyramid for .splat output.
+
+Level 0 is the full model. Each coarser level keeps a fraction of the Gaussians:
+the most important candidates (scale volume x opacity) are clustered on a voxel
+grid sized so that about the target number of voxels is occupied, and each voxel
+is merged into one Gaussian by importance-weighted moment matching.
+Every level is written importance-ordered, so it also streams progressively.
+"""
+import json
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from worker.file_links import link_file
+from worker.splat_io import SPLAT_DTYPE, read_splat
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LOD_FRACTIONS = (1.0, 0.25, 0.05)
+LOD_MANIFEST = "index.json"
+
+# Candidates considered per output Gaussian when building a coarse level
+_CANDIDATE_FACTOR = 2
+_VOXEL_SEARCH_STEPS = 12
+_IDENTITY_ROTATION = np.array([255, 128, 128, 128], dtype=np.uint8) # (w, x, y, z) = (1, 0, 0, 0)
+
+
+def lod_filename(level: int) -> str:
+    return f"lod{level}.splat"
+
+
+def record_importance(records: np.ndarray) -> np.ndarray:
+    """log(scale volume x opacity) of .splat records, as float32."""
+    log_volume = np.log(np.maximum(records["scale"], np.float32(1e-30))).sum(axis=1, dtype=np.float32)
+    alpha = records["color"][:, 3].astype(np.float32) / 255.0
+    return log_volume + np.log(np.maximum(alpha, np.float32(1.0 / 512.0)))
+
+
+def _voxel_ids(positions: np.ndarray, origin: np.ndarray, voxel_size: float) -> np.ndarray:
+    cells = np.floor((positions - origin) / voxel_size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+
+def _voxel_size_for(positions: np.ndarray, target: int) -> float:
+    """Bisects (geometrically) for the voxel size that leaves about `target` occupied voxels."""
+    origin = positions.min(axis=0)
+    extent = float(np.max(positions.max(axis=0) - origin))
+    if extent <= 0.0:
+        return 1.0
+    lo, hi = extent / (len(positions) ** (1.0 / 3.0) * 64.0), extent
+    for _ in range(_VOXEL_SEARCH_STEPS):
+        mid = math.sqrt(lo * hi)
+        occupied = len(np.unique(_voxel_ids(positions, origin, mid)))
+        if occupied > target:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+def merge_voxels(records: np.ndarray, target: int) -> np.ndarray:
+    """Clusters records on a voxel grid and merges each voxel into a single record."""
+    positions = records["position"].astype(np.float64)
+    origin = positions.min(axis=0)
+    voxel_size = _voxel_size_for(positions, target)
+    _, inverse, members = np.unique(_voxel_ids(positions, origin, voxel_size), return_inverse=True, return_counts=True)
+    num_voxels = len(members)
+
+    importance = record_importance(records).astype(np.float64)
+    weights = np.exp(importance - importance.max())
+    weight_sum = np.bincount(inverse, weights=weights, minlength=num_voxels)
+    weight_sum = np.maximum(weight_sum, 1e-300)
+
+    def weighted_mean(values: np.ndarray) -> np.ndarray:
+        return np.bincount(inverse, weights=weights * values, minlength=num_voxels) / weight_sum
+
+    out = np.empty(num_voxels, dtype=SPLAT_DTYPE)
+    mean = np.stack([weighted_mean(positions[:, axis]) for axis in range(3)], axis=1)
+    out["position"] = mean
+
+    # Axis-aligned moment matching: member variance plus spread of member centres
+    scales = records["scale"].astype(np.float64)
+    spread = positions - mean[inverse]
+    variance = np.stack([weighted_mean(scales[:, a] ** 2 + spread[:, a] ** 2) for a in range(3)], axis=1)
+    out["scale"] = np.sqrt(variance)
+
+    color = records["color"].astype(np.float64)
+    for channel in range(3):
+        out["color"][:, channel] = np.clip(np.rint(weighted_mean(color[:, channel])), 0, 255)
+    alpha_max = np.zeros(num_voxels, dtype=np.uint8)
+    np.maximum.at(alpha_max, inverse, records["color"][:, 3])
+    out["color"][:, 3] = alpha_max
+
+    # A single member keeps its own orientation; merged voxels are axis-aligned by construction
+    single = np.zeros(num_voxels, dtype=np.int64)
+    single[inverse] = np.arange(len(records))
+    out["rotation"] = _IDENTITY_ROTATION
+    out["rotation"][members == 1] = records["rotation"][single[members == 1]]
+    return out
+
+
+def _write_records(records: np.ndarray, path: Path) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        records.tofile(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def build_lod_levels(splat_path: Path, lod_dir: Path,
+                     fractions: Sequence[float] = DEFAULT_LOD_FRACTIONS) -> List[Dict]:
+    """
+    Builds lod<i>.splat files (finest first) and an index.json manifest in `lod_dir`.
+    A fraction of 1.0 links the full model instead of copying it. Returns the manifest levels.
+    """
+    records = read_splat(splat_path)
+    count = len(records)
+    lod_dir.mkdir(parents=True, exist_ok=True)
+
+    importance = record_importance(records) if count else np.empty(0, dtype=np.float32)
+    levels = []
+    for level, fraction in enumerate(sorted(fractions, reverse=True)):
+        path = lod_dir / lod_filename(level)
+        target = max(1, math.ceil(count * fraction)) if count else 0
+        if target >= count:
+            # rename() is a no-op between two links of one file: an existing link is kept as is
+            if not (path.exists() and path.samefile(splat_path)):
+                tmp_path = path.with_name(path.name + ".tmp")
+                tmp_path.unlink(missing_ok=True)
+                link_file(splat_path, tmp_path)
+                os.replace(tmp_path, path)
+            level_count = count
+        else:
+            num_candidates = min(count, target * _CANDIDATE_FACTOR)
+            candidates = np.argpartition(-importance, num_candidates - 1)[:num_candidates]
+            merged = merge_voxels(np.asarray(records[np.sort(candidates)]), target)
+            merged = merged[np.argsort(-record_importance(merged))]
+            _write_records(merged, path)
+            level_count = len(merged)
+        levels.append({
+            "level": level,
+            "fraction": fraction,
+            "count": level_count,
+            "file": path.name,
+            "bytes": level_count * SPLAT_DTYPE.itemsize,
+        })
+        log.info(f"LOD {level}: {level_count} splats ({fraction:.0%} target) -> {path}")
+
+    manifest_tmp = lod_dir / (LOD_MANIFEST + ".tmp")
+    manifest_tmp.write_text(json.dumps({"source": splat_path.name, "levels": levels}, indent=2))
+    os.replace(manifest_tmp, lod_dir / LOD_MANIFEST)
+    return levels
@@ -0,0 +1,288 @@
+# worker/splat_training.py
+"""
+Checkpointed, resumable Gaussian Splatting training.
+
+train_splatting runs with acks_late and reject_on_worker_lost. If the gpu_worker
+container restarts or its process dies, the message is not lost: RabbitMQ redelivers it.
+`run_training` then resumes from the newest valid checkpoint instead of iteration 0.
+Checkpoints are taken every TRAIN_CHECKPOINT_ITERATIONS iterations, or after
+TRAIN_CHECKPOINT_SECONDS if that comes first.
+
+Checkpoints never stall the training loop for I/O. The loop only takes a snapshot of the
+trainer state (an in-memory copy). A background thread (CheckpointWriter) serializes
+and writes it. At most one snapshot waits: if the disk falls behind, a newer snapshot
+replaces the waiting one.
+
+Writes are atomic. A checkpoint is written to a temporary file in the same directory,
+fsynced, and renamed to ckpt-<iteration>.npz, and then the directory is fsynced. A crash
+therefore leaves complete checkpoints only. They are still verified when loading: the
+zip CRCs and the fingerprint of the training parameters must match, otherwise the next
+older checkpoint is used. The newest TRAIN_CHECKPOINT_KEEP checkpoints are kept.
+
+A trainer exposes step(iteration), state(), load_state(state) and export(model_dir). Its
+step must not depend on hidden state, so that a resumed run ends with the same model as
+an uninterrupted one. CpuStandInTrainer follows this contract with numpy, so the whole
+mechanism can be checked without a GPU (benchmarks/bench_train_checkpoint.py).
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Protocol, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+TRAIN_CHECKPOINT_ITERATIONS = int(os.getenv("TRAIN_CHECKPOINT_ITERATIONS", 1000))
+TRAIN_CHECKPOINT_SECONDS = float(os.getenv("TRAIN_CHECKPOINT_SECONDS", 300))
+TRAIN_CHECKPOINT_KEEP = int(os.getenv("TRAIN_CHECKPOINT_KEEP", 2))
+
+CHECKPOINT_PATTERN = re.compile(r"^ckpt-(\d{8})\.npz$")
+_ITERATION_KEY = "__iteration__"
+_FINGERPRINT_KEY = "__fingerprint__"
+
+TrainerState = Dict[str, np.ndarray]
+
+
+class Trainer(Protocol):
+    def step(self, iteration: int) -> None: ...
+    def state(self) -> TrainerState: ... # A snapshot: later steps must not modify it
+    def load_state(self, state: TrainerState) -> None: ...
+    def export(self, model_dir: Path, iteration: int) -> Path: ...
+
+
+# --- Checkpoint files ---
+
+def _fsync_dir(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CheckpointStore:
+    """Checkpoints of one training run in `directory`. `fingerprint` identifies the training parameters."""
+
+    def __init__(self, directory: Path, fingerprint: str, keep: int = TRAIN_CHECKPOINT_KEEP):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.keep = max(1, keep)
+
+    def _checkpoints(self) -> List[Tuple[int, Path]]:
+        """(iteration, path), newest first."""
+        found = []
+        for path in self.directory.glob("ckpt-*.npz") if self.directory.exists() else ():
+            match = CHECKPOINT_PATTERN.match(path.name)
+            if match:
+                found.append((int(match.group(1)), path))
+        return sorted(found, reverse=True)
+
+    def save(self, iteration: int, state: TrainerState) -> Path:
+        """Writes a checkpoint atomically (blocking) and prunes old ones."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"ckpt-{iteration:08d}.npz"
+        tmp_path = self.directory / f".ckpt-{iteration:08d}-{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **state, **{_ITERATION_KEY: np.int64(iteration), _FINGERPRINT_KEY: np.str_(self.fingerprint)})
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            _fsync_dir(self.directory)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        for _, old in self._checkpoints()[self.keep:]:
+            old.unlink(missing_ok=True)
+        return path
+
+    def _load(self, path: Path) -> Optional[Tuple[int, TrainerState]]:
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files} # Reads every member: checks the zip CRCs
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile, zlib.error) as e:
+            log.warning(f"Checkpoint {path.name} is unreadable, skipping it: {e}")
+            return None
+        if str(arrays.pop(_FINGERPRINT_KEY, "")) != self.fingerprint or _ITERATION_KEY not in arrays:
+            log.info(f"Checkpoint {path.name} is from other training parameters, skipping it.")
+            return None
+        return int(arrays.pop(_ITERATION_KEY)), arrays
+
+    def latest(self) -> Optional[Tuple[int, TrainerState]]:
+        """(iteration, state) of the newest valid checkpoint, or None."""
+        for _, path in self._checkpoints():
+            loaded = self._load(path)
+            if loaded is not None:
+                return loaded
+        return None
+
+    def clear(self) -> None:
+        """Removes the checkpoint directory once the trained model is saved."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class CheckpointWriter:
+    """Writes snapshots with a CheckpointStore in a background thread. `submit` never waits for I/O."""
+
+    def __init__(self, store: CheckpointStore):
+        self.store = store
+        self.written: Optional[int] = None # Iteration of the last checkpoint written
+        self.replaced = 0 # Snapshots dropped because a newer one arrived before they were written
+        self._pending: Optional[Tuple[int, TrainerState]] = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, iteration: int, state: TrainerState) -> None:
+        with self._condition:
+            if self._pending is not None:
+                self.replaced += 1
+            self._pending = (iteration, state)
+            self._condition.notify()
+
+    def close(self, write_pending: bool = True) -> None:
+        """Writes (or drops) the waiting snapshot, if any, and stops the thread."""
+        with self._condition:
+            self._closed = True
+            if not write_pending:
+                self._pending = None
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                iteration, state = self._pending
+                self._pending = None
+            start = time.perf_counter()
+            try:
+                path = self.store.save(iteration, state)
+                self.written = iteration
+                log.info(f"Checkpoint {path.name} written in {time.perf_counter() - start:.2f}s.")
+            except Exception as e:
+                # Training goes on: a missing checkpoint only costs iterations if the worker is lost
+                log.error(f"Checkpoint at iteration {iteration} could not be written: {e}")
+
+
+# --- Training loop ---
+
+def run_training(trainer: Trainer, store: CheckpointStore, iterations: int,
+                 progress: Optional[Callable[[float], None]] = None,
+                 checkpoint_iterations: int = TRAIN_CHECKPOINT_ITERATIONS,
+                 checkpoint_seconds: float = TRAIN_CHECKPOINT_SECONDS,
+                 clock: Callable[[], float] = time.monotonic) -> int:
+    """
+    Runs `iterations` training steps, resuming from the newest valid checkpoint of `store`.
+    Returns the iteration it resumed from (0: started from scratch).
+    """
+    start = 0
+    resumed = store.latest()
+    if resumed is not None and resumed[0] <= iterations:
+        start, state = resumed
+        trainer.load_state(state)
+        log.info(f"Training: resuming from the checkpoint at iteration {start} of {iterations}.")
+
+    writer = CheckpointWriter(store)
+    progress_every = max(1, iterations // 100)
+    last_checkpoint = clock()
+    finished = False
+    try:
+        for iteration in range(start, iterations):
+            trainer.step(iteration)
+            done = iteration + 1
+            if done < iterations and (done % checkpoint_iterations == 0 or clock() - last_checkpoint >= checkpoint_seconds):
+                writer.submit(done, trainer.state())
+                last_checkpoint = clock()
+            if progress is not None and done % progress_every == 0:
+                progress(done / iterations)
+        finished = True
+    finally:
+        writer.close(write_pending=not finished) # After a failure the latest snapshot is still worth keeping
+    if writer.replaced:
+        log.warning(f"Training: {writer.replaced} checkpoint(s) were skipped because writing fell behind.")
+    return start
+
+
+# --- CPU stand-in trainer ---
+
+class CpuStandInTrainer:
+    """
+    Stand-in for the GPU trainer. It fits `num_gaussians` Gaussians to a synthetic target with numpy,
+    one random batch per iteration, and sleeps `seconds_per_iteration` to simulate GPU time. The batch of
+    iteration i is drawn from an RNG seeded with (seed, i), so the result does not depend on where a run
+    was interrupted. export() writes a regular point_cloud.ply that the conversion stages can read.
+    """
+
+    def __init__(self, num_gaussians: int = 10_000, seed: int = 0, batch_size: int = 1024,
+                 learning_rate: float = 0.05, seconds_per_iteration: float = 0.0):
+        self.seed = seed
+        self.batch_size = min(batch_size, num_gaussians)
+        self.learning_rate = learning_rate
+        self.seconds_per_iteration = seconds_per_iteration
+        rng = np.random.default_rng(seed)
+        u, v = rng.random(num_gaussians, dtype=np.float32), rng.random(num_gaussians, dtype=np.float32)
+        self._target = {
+            "xyz": np.stack([u * 4.0, np.sin(u * 6.0) * 0.5, v * 3.0], axis=1).astype(np.float32),
+            "f_dc": np.stack([np.sin(u * 10.0), np.cos(v * 7.0), u * v - 0.5], axis=1).astype(np.float32),
+            "opacity": rng.normal(2.0, 1.0, num_gaussians).astype(np.float32),
+            "scale": rng.normal(-5.0, 0.4, (num_gaussians, 3)).astype(np.float32),
+        }
+        self._params = {
+            "xyz": rng.normal(0.0, 1.0, (num_gaussians, 3)).astype(np.float32),
+            "f_dc": np.zeros((num_gaussians, 3), dtype=np.float32),
+            "opacity": np.zeros(num_gaussians, dtype=np.float32),
+            "scale": np.full((num_gaussians, 3), -4.0, dtype=np.float32),
+            "rotation": np.tile(np.array([1, 0, 0, 0], dtype=np.float32), (num_gaussians, 1)),
+        }
+
+    def step(self, iteration: int) -> None:
+        batch = np.random.default_rng([self.seed, iteration]).choice(len(self._params["xyz"]), self.batch_size, replace=False)
+        for name, target in self._target.items():
+            values = self._params[name]
+            values[batch] += self.learning_rate * (target[batch] - values[batch])
+        if self.seconds_per_iteration:
+            time.sleep(self.seconds_per_iteration)
+
+    def state(self) -> TrainerState:
+        return {name: values.copy() for name, values in self._params.items()}
+
+    def load_state(self, state: TrainerState) -> None:
+        self._params = {name: np.array(state[name], dtype=np.float32) for name in self._params}
+
+    def export(self, model_dir: Path, iteration: int) -> Path:
+        """Writes model_dir/point_cloud/iteration_<iteration>/point_cloud.ply (SH degree 0), atomically."""
+        p = self._params
+        names = (["x", "y", "z", "nx", "ny", "nz", "f_dc_0", "f_dc_1", "f_dc_2", "opacity"]
+                 + [f"scale_{i}" for i in range(3)] + [f"rot_{i}" for i in range(4)])
+        vertices = np.zeros(len(p["xyz"]), dtype=[(name, "<f4") for name in names])
+        for axis, name in enumerate("xyz"):
+            vertices[name] = p["xyz"][:, axis]
+        for i in range(3):
+            vertices[f"f_dc_{i}"] = p["f_dc"][:, i]
+            vertices[f"scale_{i}"] = p["scale"][:, i]
+        vertices["opacity"] = p["opacity"]
+        for i in range(4):
+            vertices[f"rot_{i}"] = p["rotation"][:, i]
+        header = (f"ply\nformat binary_little_endian 1.0\nelement vertex {len(vertices)}\n"
+                  + "".join(f"property float {name}\n" for name in names) + "end_header\n")
+
+        ply_path = model_dir / "point_cloud" / f"iteration_{iteration}" / "point_cloud.ply"
+        ply_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = ply_path.with_name(f".point_cloud-{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(header.encode("ascii"))
+            vertices.tofile(f)
+        os.replace(tmp_path, ply_path)
+        return ply_path
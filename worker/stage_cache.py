@@ -0,0 +1,285 @@
+# worker/stage_cache.py
+"""
+Content-addressed cache of pipeline stage outputs.
+
+Each stage declares its outputs (paths inside data/<jobid>/) and the parameters that
+affect them. Its key is a hash of the stage name and version, those parameters and
+the key of the stage it consumes, so a key identifies the whole chain from the input
+video down to that stage. Re-running a video with more iterations therefore reuses
+everything up to sparse_mapping and only undistorts and retrains.
+
+Entries live in data/cache/<stage>/<key>/ on the shared volume, so CPU and GPU workers
+share them. An entry is built in a temporary directory and published with a single
+rename, so readers never see a partial entry; a concurrent publish of the same key
+simply loses the rename and is discarded. Files are hard-linked in and out of the
+cache, except outputs that later stages modify in place (the COLMAP database), which
+are copied. Entries are evicted least recently used first once the cache exceeds
+STAGE_CACHE_MAX_BYTES. Stages marked cacheable=False still get a key, so the chain below
+them stays keyed, but their outputs are always computed.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from worker.file_links import link_file
+
+log = logging.getLogger(__name__)
+
+STAGE_CACHE_ENABLED = os.getenv("STAGE_CACHE", "1") == "1"
+STAGE_CACHE_MAX_BYTES = int(os.getenv("STAGE_CACHE_MAX_BYTES", 100 * 1024 ** 3))
+
+MANIFEST_FILENAME = "manifest.json"
+FILES_DIRNAME = "files"
+STAGE_KEYS_FILENAME = "stage_keys.json"
+_EVICT_LOCK_FILENAME = ".evict.lock"
+_HASH_READ_SIZE = 4 * 1024 * 1024
+_STALE_TMP_SECONDS = 24 * 3600 # Leftovers of workers that died while publishing
+
+
+class StageSpec(NamedTuple):
+    parent: Optional[str] # Stage whose outputs this stage consumes (None: keyed by its params only)
+    outputs: Tuple[str, ...] # Paths relative to data/<jobid>/
+    mutable: Tuple[str, ...] = () # Outputs that later stages modify in place: copied instead of linked
+    version: int = 1 # Bump when a stage's implementation changes its outputs
+    cacheable: bool = True # False: never looked up or published, only keyed (e.g. stub stages)
+
+
+STAGES: Dict[str, StageSpec] = {
+    "extract_frames": StageSpec(None, ("frames",)),
+    "remove_background": StageSpec("extract_frames", ("images", "masks"), version=2),
+    "build_pyramid": StageSpec("remove_background", ("pyramid",)),
+    "feature_extraction": StageSpec("build_pyramid", ("colmap/database.db", "colmap/masks"), mutable=("colmap/database.db",), version=3),
+    "feature_matching": StageSpec("feature_extraction", ("colmap/database.db", "colmap/matching.json"),
+                                  mutable=("colmap/database.db",), version=2),
+    "sparse_mapping": StageSpec("feature_matching", ("colmap/sparse", "colmap/mapping.json"), version=2),
+    # Still a stub whose dense/ is empty: not cached. Bump its version when the real undistorter
+    # lands, so downstream entries keyed on the stub are not reused.
+    "image_undistortion": StageSpec("sparse_mapping", ("dense",), cacheable=False),
+    "train_splatting": StageSpec("image_undistortion", ("model",)),
+}
+
+
+def cache_root(data_dir: Path) -> Path:
+    return Path(os.getenv("STAGE_CACHE_DIR", data_dir / "cache"))
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(_HASH_READ_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_key(stage: str, params: dict, parent_key: Optional[str]) -> str:
+    spec = STAGES[stage]
+    material = {"stage": stage, "version": spec.version, "params": params, "parent": parent_key}
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# --- Per-job key chain ---
+
+def read_stage_keys(job_dir: Path) -> Dict[str, str]:
+    try:
+        return json.loads((job_dir / STAGE_KEYS_FILENAME).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _record_stage_key(job_dir: Path, stage: str, key: str) -> None:
+    keys = read_stage_keys(job_dir)
+    keys[stage] = key
+    tmp_path = job_dir / f"{STAGE_KEYS_FILENAME}.{uuid.uuid4().hex}.tmp"
+    tmp_path.write_text(json.dumps(keys, indent=2))
+    os.replace(tmp_path, job_dir / STAGE_KEYS_FILENAME)
+
+
+# --- Filesystem helpers ---
+
+def _tree_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def _clone(src: Path, dst: Path, link: bool) -> None:
+    """Copies a file or directory tree, hard-linking files when `link` is set (copy fallback)."""
+    if src.is_dir():
+        shutil.copytree(src, dst, copy_function=link_file if link else shutil.copy2)
+    else:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        (link_file if link else shutil.copy2)(src, dst)
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class StageRun:
+    """State of one stage execution inside `stage_cache`."""
+
+    def __init__(self, job_id: str, stage: str, key: Optional[str], entry_dir: Optional[Path]):
+        self.job_id = job_id
+        self.stage = stage
+        self.key = key
+        self.entry_dir = entry_dir
+        self.hit = False
+
+
+def _restore(job_dir: Path, spec: StageSpec, entry_dir: Path) -> None:
+    """Places the entry's outputs into the job directory, each replacing any stale output."""
+    for output in spec.outputs:
+        src = entry_dir / FILES_DIRNAME / output
+        dst = job_dir / output
+        tmp_path = dst.with_name(f"{dst.name}.restore-{uuid.uuid4().hex}")
+        try:
+            _clone(src, tmp_path, link=output not in spec.mutable)
+            if dst.exists():
+                _remove(dst)
+            os.replace(tmp_path, dst)
+        finally:
+            if tmp_path.exists():
+                _remove(tmp_path)
+
+
+def _publish(job_dir: Path, stage: str, spec: StageSpec, key: str, params: dict,
+             parent_key: Optional[str], entry_dir: Path) -> bool:
+    """Builds the entry in a temporary directory and renames it into place. Returns False if it already existed."""
+    missing = [output for output in spec.outputs if not (job_dir / output).exists()]
+    if missing:
+        log.warning(f"Stage {stage}: outputs {missing} were not produced, not caching.")
+        return False
+
+    tmp_dir = entry_dir.with_name(f".tmp-{key}-{uuid.uuid4().hex}")
+    try:
+        for output in spec.outputs:
+            _clone(job_dir / output, tmp_dir / FILES_DIRNAME / output, link=output not in spec.mutable)
+        manifest = {
+            "stage": stage,
+            "key": key,
+            "parent": parent_key,
+            "params": params,
+            "outputs": list(spec.outputs),
+            "bytes": _tree_size(tmp_dir / FILES_DIRNAME),
+            "created_at": time.time(),
+        }
+        (tmp_dir / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2, default=str))
+        try:
+            os.rename(tmp_dir, entry_dir) # Atomic; fails if another worker published the same key first
+        except OSError:
+            if entry_dir.exists():
+                return False
+            raise
+        return True
+    finally:
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# --- Eviction ---
+
+def _cache_entries(root: Path) -> List[Tuple[float, int, Path]]:
+    entries = []
+    for stage_dir in root.iterdir() if root.exists() else ():
+        if not stage_dir.is_dir():
+            continue
+        for entry_dir in stage_dir.iterdir():
+            if entry_dir.name.startswith("."):
+                try:
+                    if time.time() - entry_dir.stat().st_mtime > _STALE_TMP_SECONDS:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            try:
+                manifest = json.loads((entry_dir / MANIFEST_FILENAME).read_text())
+                entries.append((entry_dir.stat().st_mtime, manifest["bytes"], entry_dir))
+            except (OSError, ValueError, KeyError):
+                continue
+    return entries
+
+
+def evict(root: Path, max_bytes: int = STAGE_CACHE_MAX_BYTES) -> int:
+    """Removes least recently used entries until the cache fits in `max_bytes`. Returns bytes freed."""
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / _EVICT_LOCK_FILENAME, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0 # Another worker is already evicting
+
+        entries = sorted(_cache_entries(root))
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, entry_dir in entries:
+            if total - freed <= max_bytes:
+                break
+            # Rename first so readers see the entry disappear atomically, then delete at leisure
+            trash = entry_dir.with_name(f".evicted-{uuid.uuid4().hex}")
+            try:
+                os.rename(entry_dir, trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            freed += size
+            log.info(f"Stage cache: evicted {entry_dir.parent.name}/{entry_dir.name} ({size} bytes).")
+        return freed
+
+
+@contextmanager
+def stage_cache(job_id: str, stage: str, params: dict, data_dir: Path) -> Iterator[StageRun]:
+    """
+    Wraps one stage execution. On a cache hit the outputs are restored into data/<jobid>/
+    and `run.hit` is True, so the body should skip its work. On a miss the body computes
+    the outputs and they are published when it exits without an exception.
+    """
+    spec = STAGES[stage]
+    job_dir = data_dir / job_id
+    keys = read_stage_keys(job_dir)
+    parent_key = keys.get(spec.parent) if spec.parent else None
+    if spec.parent and parent_key is None:
+        # Upstream outputs were not keyed (e.g. produced before caching, or uncacheable): nothing to match on
+        log.info(f"[Job {job_id}] Stage cache: no key for upstream stage '{spec.parent}', running {stage} uncached.")
+        yield StageRun(job_id, stage, None, None)
+        return
+
+    key = stage_key(stage, params, parent_key)
+    root = cache_root(data_dir)
+    entry_dir = root / stage / key
+    run = StageRun(job_id, stage, key, entry_dir)
+    enabled = STAGE_CACHE_ENABLED and spec.cacheable
+
+    if enabled and entry_dir.is_dir():
+        try:
+            _restore(job_dir, spec, entry_dir)
+            os.utime(entry_dir) # Recency for LRU eviction
+            run.hit = True
+            log.info(f"[Job {job_id}] Stage cache hit for {stage} ({key[:12]}), outputs restored.")
+        except OSError as e:
+            # Evicted while restoring: compute instead
+            log.warning(f"[Job {job_id}] Stage cache entry {stage}/{key[:12]} could not be restored: {e}")
+
+    yield run
+
+    # Record the key even when caching is disabled, so downstream keys stay consistent
+    _record_stage_key(job_dir, stage, key)
+    if run.hit or not enabled:
+        return
+    try:
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        if _publish(job_dir, stage, spec, key, params, parent_key, entry_dir):
+            log.info(f"[Job {job_id}] Stage cache: published {stage} ({key[:12]}).")
+            evict(root)
+    except OSError as e:
+        log.warning(f"[Job {job_id}] Stage cache: could not publish {stage}: {e}")
@@ -0,0 +1,206 @@
+# worker/stage_metrics.py
+"""
+Per-stage timing and resource instrumentation, stored in the job_stage table.
+
+Every task of worker/tasks/ that takes a job_id is measured through Celery signals: a
+probe starts at task_prerun and writes one job_stage row at task_postrun, whatever the
+outcome (SUCCESS, FAILURE or RETRY). A row holds:
+- start and end times, and the queue wait: from the publish time, which every task
+  message carries in a `published_at` header, to the start;
+- CPU seconds (user + system) of the worker process and the subprocesses it waited for
+  (ffmpeg, COLMAP), from getrusage;
+- peak RSS during the stage: the kernel's high-water mark is reset at the start
+  (/proc/self/clear_refs), and a subprocess that set a new maximum counts too;
+- bytes read from and written to storage (/proc/self/io, reaped subprocesses included);
+- GPU seconds: the run time of tasks consumed from gpu_queue, which hold a GPU slot.
+
+The fused CPU task (worker/tasks/pipeline.py) sets `measures_stages=True` and measures
+each stage it runs with `measure_stage`, so both pipeline modes produce the same rows.
+The counters are per process: they are exact with the prefork pool (one task per
+process at a time) but would mix concurrent tasks with the threads pool. Missing
+counters (non-Linux) are stored as NULL. Instrumentation never fails a task: write
+errors are only logged.
+"""
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from celery.exceptions import Retry
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from sqlalchemy import insert
+
+from worker.cpu_budget import CpuBudgetExhausted
+from worker.database import get_sync_session
+
+try:
+    from interface.app.models import JobStage
+except ImportError as e:
+    raise RuntimeError("Stage metrics could not import the JobStage model.") from e
+
+log = logging.getLogger(__name__)
+
+STAGE_METRICS_ENABLED = os.getenv("STAGE_METRICS_ENABLED", "1") != "0"
+PUBLISHED_AT_HEADER = "published_at" # Also set by the interface (app/dispatch.py)
+GPU_QUEUE = "gpu_queue"
+
+_job_stage_table = JobStage.__table__
+
+
+def stage_name(task_name: str) -> str:
+    return task_name.rsplit(".", 1)[-1]
+
+
+# --- Process counters ---
+
+def _cpu_seconds() -> float:
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _io_bytes() -> Optional[Tuple[int, int]]:
+    """(read_bytes, write_bytes) of this process and its reaped children, or None without task I/O accounting."""
+    try:
+        fields = dict(line.split(":", 1) for line in Path("/proc/self/io").read_text().splitlines())
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        Path("/proc/self/clear_refs").write_text("5") # Resets VmHWM to the current RSS
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _children_maxrss() -> int:
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss # kB on Linux
+
+
+# --- Probes ---
+
+class StageProbe:
+    """Counters at the start of a stage; `finish` writes the stage's job_stage row."""
+
+    def __init__(self, job_id: str, stage: str, task_id: Optional[str] = None, queue: Optional[str] = None,
+                 worker: Optional[str] = None, published_at: Optional[float] = None):
+        self.job_id = job_id
+        self.stage = stage
+        self.task_id = task_id
+        self.queue = queue
+        self.worker = worker
+        self.published_at = published_at
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._cpu = _cpu_seconds()
+        self._io = _io_bytes()
+        self._children_maxrss = _children_maxrss()
+        self._peak_reset = _reset_peak_rss()
+
+    def finish(self, status: str) -> None:
+        """Writes the stage's row. Never raises."""
+        try:
+            duration = time.perf_counter() - self._start
+            io = _io_bytes()
+            peak_rss = _peak_rss_bytes() if self._peak_reset else None
+            children_maxrss = _children_maxrss()
+            if children_maxrss > self._children_maxrss: # A subprocess of this stage set a new maximum
+                peak_rss = max(peak_rss or 0, children_maxrss * 1024)
+            row = {
+                "jobid": self.job_id,
+                "stage": self.stage,
+                "status": status,
+                "task_id": self.task_id,
+                "queue": self.queue,
+                "worker": self.worker,
+                "started_at": datetime.fromtimestamp(self.started_at, tz=timezone.utc),
+                "finished_at": datetime.fromtimestamp(self.started_at + duration, tz=timezone.utc),
+                # Clamped: the publisher's clock may be slightly ahead of this host's
+                "queue_wait_seconds": max(0.0, self.started_at - self.published_at) if self.published_at else None,
+                "duration_seconds": duration,
+                "cpu_seconds": _cpu_seconds() - self._cpu,
+                "peak_rss_bytes": peak_rss,
+                "read_bytes": io[0] - self._io[0] if io and self._io else None,
+                "write_bytes": io[1] - self._io[1] if io and self._io else None,
+                "gpu_seconds": duration if self.queue == GPU_QUEUE else None,
+            }
+            with get_sync_session() as session:
+                session.execute(insert(_job_stage_table).values(**row))
+        except Exception as e:
+            log.warning(f"[Job {self.job_id}] Could not record metrics of stage {self.stage}: {e}")
+
+
+def _probe_from_request(job_id: str, stage: str, request, published_at: Optional[float]) -> StageProbe:
+    delivery_info = getattr(request, "delivery_info", None) or {}
+    return StageProbe(job_id, stage, getattr(request, "id", None), delivery_info.get("routing_key"),
+                      getattr(request, "hostname", None), published_at)
+
+
+@contextmanager
+def measure_stage(job_id: str, stage: str, request=None, published_at: Optional[float] = None) -> Iterator[None]:
+    """Measures a stage run inside a task (`request`: that task's Celery request) and records its row."""
+    if not STAGE_METRICS_ENABLED:
+        yield
+        return
+    probe = _probe_from_request(job_id, stage, request, published_at)
+    try:
+        yield
+    except (Retry, CpuBudgetExhausted):
+        probe.finish("RETRY")
+        raise
+    except BaseException:
+        probe.finish("FAILURE")
+        raise
+    probe.finish("SUCCESS")
+
+
+# --- Celery signals ---
+
+_probes: Dict[str, StageProbe] = {} # By task ID
+_probes_lock = threading.Lock()
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **extra):
+    """Publish time of every task message this process sends (chain continuations, GPU dispatch, retries)."""
+    if headers is not None:
+        headers[PUBLISHED_AT_HEADER] = time.time()
+
+
+@task_prerun.connect
+def start_stage_probe(task_id=None, task=None, args=None, kwargs=None, **extra):
+    job_id = args[0] if args else (kwargs or {}).get("job_id")
+    if not STAGE_METRICS_ENABLED or not isinstance(job_id, str) or getattr(task, "measures_stages", False):
+        return
+    request = task.request
+    probe = _probe_from_request(job_id, stage_name(task.name), request, request.get(PUBLISHED_AT_HEADER))
+    with _probes_lock:
+        _probes[task_id] = probe
+
+
+@task_postrun.connect
+def finish_stage_probe(task_id=None, state=None, **extra):
+    with _probes_lock:
+        probe = _probes.pop(task_id, None)
+    if probe is not None:
+        probe.finish(state or "UNKNOWN")
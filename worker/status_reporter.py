@@ -0,0 +1,140 @@
+# worker/status_reporter.py
+"""
+Coalescing, asynchronous writer of job status and progress.
+
+Tasks report field changes (status, current stage, progress, output paths...) with
+`report`. Changes are merged per job in memory, so ten progress ticks between two flushes
+cost one row update. A background thread writes them every STATUS_FLUSH_INTERVAL
+seconds. All jobs that changed the same set of columns go into one UPDATE statement,
+executed with one parameter set per job. Terminal updates (FAILED/COMPLETED) are written
+immediately in the caller's thread, together with anything still pending for that job,
+and errors propagate so the task sees them. Pending changes of a job are also flushed when
+its task finishes, before the next stage of the chain can run on another worker.
+
+Buffered writes never move a job out of a terminal state, so a late flush cannot undo a
+failure recorded by another process.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, case, func, literal, update
+
+from worker.database import get_sync_session
+
+try:
+    from interface.app.models import Job, JobStatus
+except ImportError as e:
+    raise RuntimeError("Status reporter could not import the Job model.") from e
+
+log = logging.getLogger(__name__)
+
+STATUS_FLUSH_INTERVAL = float(os.getenv("STATUS_FLUSH_INTERVAL", 1.0))
+
+TERMINAL_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+_job_table = Job.__table__
+# Plain comparisons rather than NOT IN: expanding IN parameters cannot be used with executemany
+_not_terminal = and_(*(_job_table.c.status != s for s in TERMINAL_STATUSES))
+
+
+class StatusReporter:
+    def __init__(self, interval: float = STATUS_FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    # --- Reporting ---
+
+    def report(self, job_id: str, **fields) -> None:
+        """Queues column changes for a job; later values of a column replace earlier ones."""
+        with self._lock:
+            self._pending.setdefault(job_id, {}).update(fields)
+        self._ensure_thread()
+
+    def report_terminal(self, job_id: str, status: JobStatus, **fields) -> None:
+        """Writes a terminal status now, with the job's pending changes. Raises on database errors."""
+        with self._lock:
+            pending = self._pending.pop(job_id, {})
+        values = {**pending, **fields}
+        values.pop("status", None)
+        try:
+            with get_sync_session() as session:
+                session.execute(
+                    update(_job_table)
+                    .where(_job_table.c.jobid == job_id)
+                    .values(
+                        **values,
+                        # A failure after completion does not turn a finished job into a failed one
+                        status=case((_job_table.c.status == JobStatus.COMPLETED, _job_table.c.status),
+                                     else_=literal(status, _job_table.c.status.type))
+                               if status == JobStatus.FAILED else status,
+                        completed_at=func.coalesce(_job_table.c.completed_at, func.now()),
+                        updated_at=func.now(),
+                    )
+                )
+        except Exception:
+            self._requeue({job_id: pending})
+            raise
+        log.info(f"[Job {job_id}] DB updated: status={status.name}"
+                 + "".join(f", {k}={v!r}" for k, v in fields.items()))
+
+    # --- Flushing ---
+
+    def flush(self, job_id: Optional[str] = None) -> int:
+        """Writes pending changes (of one job, or of all jobs). Returns the number of jobs written."""
+        with self._lock:
+            if job_id is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {job_id: self._pending.pop(job_id)} if job_id in self._pending else {}
+        if not batch:
+            return 0
+        groups: Dict[Tuple[str, ...], List[Dict]] = {}
+        for pending_job, fields in batch.items():
+            columns = tuple(sorted(fields))
+            groups.setdefault(columns, []).append({"b_jobid": pending_job, **{f"b_{c}": fields[c] for c in columns}})
+        try:
+            with get_sync_session() as session:
+                for columns, params in groups.items():
+                    statement = (
+                        update(_job_table)
+                        .where(_job_table.c.jobid == bindparam("b_jobid"))
+                        .where(_not_terminal)
+                        .values(**{c: bindparam(f"b_{c}") for c in columns}, updated_at=func.now())
+                    )
+                    session.connection().execute(statement, params) # executemany: one statement per column set
+        except Exception as e:
+            log.error(f"Status reporter: flush of {len(batch)} job(s) failed, will retry: {e}")
+            self._requeue(batch)
+            return 0
+        log.debug(f"Status reporter: flushed {len(batch)} job(s) in {len(groups)} statement(s).")
+        return len(batch)
+
+    def _requeue(self, batch: Dict[str, Dict]) -> None:
+        """Puts changes back after a failed write, behind any newer values reported meanwhile."""
+        with self._lock:
+            for job_id, fields in batch.items():
+                self._pending[job_id] = {**fields, **self._pending.get(job_id, {})}
+
+    def _ensure_thread(self) -> None:
+        # Started lazily, and again in a forked child (threads do not survive fork)
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="status-reporter", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+reporter = StatusReporter()
@@ -1,48 +1,136 @@
 # worker/tasks/colmap.py
+import json
 import logging
+import os
 import time
 from worker.celery_app import celery_app
-from worker.tasks.utils import update_job_status, Job, JobStatus
+from worker.tasks.utils import update_job_status, report_progress, get_job_dir, get_job_params, set_job_fields, DATA_DIR, Job, JobStatus
+from worker.stage_cache import stage_cache
+from worker.colmap_cli import run_colmap
+from worker.cpu_budget import cpu_threads, CpuBudgetExhausted, CPU_BUDGET_RETRY_SECONDS
+from worker import image_pyramid, matching, sparse_mapping
 
 log = logging.getLogger(__name__)
 
-@celery_app.task(name="worker.tasks.colmap.feature_extraction")
-def feature_extraction_task(job_id: str):
+# Long side of the images COLMAP works on; the matching pyramid level is read (0: full resolution)
+COLMAP_MAX_IMAGE_SIZE = int(os.getenv("COLMAP_MAX_IMAGE_SIZE", 1600))
+# Frames of one video share the camera; OPENCV models its lens distortion for image_undistorter
+COLMAP_CAMERA_MODEL = os.getenv("COLMAP_CAMERA_MODEL", "OPENCV")
+MATCHING_SUMMARY = "matching.json"
+
+
+def colmap_image_dir(job_id: str) -> tuple:
+    """Pyramid level and image directory used by every COLMAP step of a job (they must agree)."""
+    pyramid_dir = get_job_dir(job_id) / "pyramid"
+    factor = image_pyramid.select_factor(pyramid_dir, COLMAP_MAX_IMAGE_SIZE)
+    return factor, image_pyramid.images_dir(pyramid_dir, factor)
+
+
+def requeue(task, job_id: str, e: CpuBudgetExhausted):
+    """Puts a task whose CPU budget is exhausted back on the queue (frees this worker process meanwhile)."""
+    log.info(f"[Job {job_id}] Task: {e}. Requeued in {CPU_BUDGET_RETRY_SECONDS}s.")
+    return task.retry(exc=e, countdown=CPU_BUDGET_RETRY_SECONDS, max_retries=None)
+
+@celery_app.task(name="worker.tasks.colmap.feature_extraction", bind=True)
+def feature_extraction_task(self, job_id: str):
     log.info(f"[Job {job_id}] Task: Starting COLMAP feature extraction...")
+    report_progress(job_id, "feature_extraction")
     update_job_status(job_id, status=JobStatus.RUNNING_COLMAP)
     try:
-        # --- TODO: Add COLMAP feature_extractor logic ---
-        time.sleep(4) # Simulate work
+        stage_params = {"max_image_size": COLMAP_MAX_IMAGE_SIZE, "camera_model": COLMAP_CAMERA_MODEL}
+        with stage_cache(job_id, "feature_extraction", stage_params, DATA_DIR) as stage:
+            if not stage.hit:
+                colmap_dir = get_job_dir(job_id) / "colmap"
+                colmap_dir.mkdir(parents=True, exist_ok=True)
+                factor, image_dir = colmap_image_dir(job_id)
+                # COLMAP reads masks as image files: materialise this level's bitpacked masks
+                num_masks = image_pyramid.write_mask_images(get_job_dir(job_id) / "pyramid", factor, colmap_dir / "masks")
+                log.info(f"[Job {job_id}] Task: Extracting features from {image_dir.name} ({num_masks} masks).")
+                database_path = colmap_dir / "database.db"
+                with cpu_threads(label=f"[Job {job_id}] feature_extractor") as threads:
+                    database_path.unlink(missing_ok=True) # A retry starts from an empty database
+                    elapsed = run_colmap("feature_extractor", {
+                        "database_path": database_path,
+                        "image_path": image_dir,
+                        "ImageReader.mask_path": colmap_dir / "masks",
+                        "ImageReader.single_camera": True,
+                        "ImageReader.camera_model": COLMAP_CAMERA_MODEL,
+                        "SiftExtraction.use_gpu": False,
+                        "SiftExtraction.num_threads": threads,
+                    }, colmap_dir / "logs", threads=threads)
+                log.info(f"[Job {job_id}] Task: feature_extractor took {elapsed:.1f}s with {threads} threads.")
         log.info(f"[Job {job_id}] Task: COLMAP feature extraction finished.")
         return job_id
+    except CpuBudgetExhausted as e:
+        raise requeue(self, job_id, e)
     except Exception as e:
         log.error(f"[Job {job_id}] Task: Error during feature extraction: {e}", exc_info=True)
         update_job_status(job_id, failed_step="feature_extraction", error_msg=str(e))
         raise
 
-@celery_app.task(name="worker.tasks.colmap.feature_matching")
-def feature_matching_task(job_id: str):
+@celery_app.task(name="worker.tasks.colmap.feature_matching", bind=True)
+def feature_matching_task(self, job_id: str):
     log.info(f"[Job {job_id}] Task: Starting COLMAP feature matching...")
+    report_progress(job_id, "feature_matching")
     # Status remains RUNNING_COLMAP
     try:
-        # --- TODO: Add COLMAP matcher logic ---
-        time.sleep(4) # Simulate work
-        log.info(f"[Job {job_id}] Task: COLMAP feature matching finished.")
+        colmap_dir = get_job_dir(job_id) / "colmap"
+        database_path = colmap_dir / "database.db"
+        num_images = len(matching.read_image_names(database_path))
+        strategy = matching.choose_strategy(num_images, get_job_params(job_id)["matcher"])
+        stage_params = {"strategy": strategy, "overlap": matching.MATCH_SEQUENTIAL_OVERLAP,
+                        "neighbors": matching.MATCH_RETRIEVAL_NEIGHBORS, "vocab_tree": matching.vocab_tree_path()}
+        with stage_cache(job_id, "feature_matching", stage_params, DATA_DIR) as stage:
+            if not stage.hit:
+                _, image_dir = colmap_image_dir(job_id)
+                plan = matching.plan_matching(strategy, database_path, image_dir)
+                options = {**plan.options, "SiftMatching.use_gpu": False}
+                if plan.pairs is not None:
+                    options["match_list_path"] = matching.write_pairs(plan.pairs, colmap_dir / "match_pairs.txt")
+                log.info(f"[Job {job_id}] Task: Matching {num_images} images with strategy '{plan.strategy}' ({plan.command}"
+                         f"{f', {len(plan.pairs)} candidate pairs' if plan.pairs is not None else ''}).")
+                with cpu_threads(label=f"[Job {job_id}] {plan.command}") as threads:
+                    options["SiftMatching.num_threads"] = threads
+                    elapsed = run_colmap(plan.command, options, colmap_dir / "logs", threads=threads)
+                summary = {"strategy": plan.strategy, "images": num_images,
+                           "matched_pairs": matching.count_matched_pairs(database_path), "seconds": round(elapsed, 2)}
+                (colmap_dir / MATCHING_SUMMARY).write_text(json.dumps(summary, indent=2))
+        # Also on a cache hit: the summary is part of the cached outputs
+        summary = json.loads((colmap_dir / MATCHING_SUMMARY).read_text())
+        set_job_fields(job_id, matching_strategy=summary["strategy"], matched_pairs=summary["matched_pairs"])
+        log.info(f"[Job {job_id}] Task: COLMAP feature matching finished ({summary['matched_pairs']} verified pairs).")
         return job_id
+    except CpuBudgetExhausted as e:
+        raise requeue(self, job_id, e)
     except Exception as e:
         log.error(f"[Job {job_id}] Task: Error during feature matching: {e}", exc_info=True)
         update_job_status(job_id, failed_step="feature_matching", error_msg=str(e))
         raise
 
-@celery_app.task(name="worker.tasks.colmap.sparse_mapping")
-def sparse_mapping_task(job_id: str):
+@celery_app.task(name="worker.tasks.colmap.sparse_mapping", bind=True)
+def sparse_mapping_task(self, job_id: str):
     log.info(f"[Job {job_id}] Task: Starting COLMAP sparse mapping...")
+    report_progress(job_id, "sparse_mapping")
     # Status remains RUNNING_COLMAP
     try:
-        # --- TODO: Add COLMAP mapper logic ---
-        time.sleep(6) # Simulate work
+        colmap_dir = get_job_dir(job_id) / "colmap"
+        database_path = colmap_dir / "database.db"
+        num_images = len(matching.read_image_names(database_path))
+        mode = sparse_mapping.choose_mode(num_images)
+        stage_params = {"mode": mode, "submodel_images": sparse_mapping.MAPPER_SUBMODEL_IMAGES,
+                        "submodel_overlap": sparse_mapping.MAPPER_SUBMODEL_OVERLAP}
+        with stage_cache(job_id, "sparse_mapping", stage_params, DATA_DIR) as stage:
+            if not stage.hit:
+                _, image_dir = colmap_image_dir(job_id)
+                with cpu_threads(label=f"[Job {job_id}] {mode} mapper") as threads:
+                    summary = sparse_mapping.run_sparse_mapping(database_path, image_dir, colmap_dir / "sparse",
+                                                                colmap_dir / "logs", num_images, threads, mode)
+                log.info(f"[Job {job_id}] Task: {summary['mode']} mapper registered {summary['registered_images']} of "
+                         f"{num_images} images in {summary['seconds']:.1f}s ({summary['models']} model(s)).")
         log.info(f"[Job {job_id}] Task: COLMAP sparse mapping finished.")
         return job_id
+    except CpuBudgetExhausted as e:
+        raise requeue(self, job_id, e)
     except Exception as e:
         log.error(f"[Job {job_id}] Task: Error during sparse mapping: {e}", exc_info=True)
         update_job_status(job_id, failed_step="sparse_mapping", error_msg=str(e))
@@ -51,10 +139,17 @@ def sparse_mapping_task(job_id: str):
 @celery_app.task(name="worker.tasks.colmap.image_undistortion")
 def image_undistortion_task(job_id: str):
     log.info(f"[Job {job_id}] Task: Starting COLMAP image undistortion...")
+    report_progress(job_id, "image_undistortion")
     # Status remains RUNNING_COLMAP
     try:
-        # --- TODO: Add COLMAP image_undistorter logic ---
-        time.sleep(3) # Simulate work
+        with stage_cache(job_id, "image_undistortion", {}, DATA_DIR) as stage:
+            if not stage.hit:
+                (get_job_dir(job_id) / "dense").mkdir(parents=True, exist_ok=True)
+                _, image_dir = colmap_image_dir(job_id) # Same level the cameras were calibrated on
+                log.info(f"[Job {job_id}] Task: Undistorting images from {image_dir.name}.")
+                # --- TODO: Add COLMAP image_undistorter logic (--image_path image_dir) ---
+                # (then drop cacheable=False and bump the version of STAGES["image_undistortion"])
+                time.sleep(3) # Simulate work
         log.info(f"[Job {job_id}] Task: COLMAP image undistortion finished.")
         return job_id
     except Exception as e:
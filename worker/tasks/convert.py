@@ -1,28 +1,89 @@
 # worker/tasks/convert.py
 import logging
+import os
 import time
 from pathlib import Path
 from worker.celery_app import celery_app
-from worker.tasks.utils import update_job_status, Job, JobStatus
+from worker.tasks.utils import update_job_status, report_progress, get_job_dir, Job, JobStatus
+from worker.splat_io import DEFAULT_CHUNK_SIZE, ORDER_IMPORTANCE, SPLAT_ORDERS, find_trained_ply, write_splat
+from worker.splat_compress import DEFAULT_PROFILE, PROFILES, write_compressed_splat
+from worker.splat_lod import DEFAULT_LOD_FRACTIONS, build_lod_levels
+from worker.artifacts import precompress_outputs
 
 log = logging.getLogger(__name__)
 
+SPLAT_CHUNK_SIZE = int(os.getenv("SPLAT_CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
+# Record order of output.splat: "importance" (progressive streaming), "morton" (spatial locality) or "none"
+SPLAT_ORDER = os.getenv("SPLAT_ORDER", ORDER_IMPORTANCE).lower()
+if SPLAT_ORDER not in SPLAT_ORDERS:
+    log.warning(f"Unknown SPLAT_ORDER '{SPLAT_ORDER}', falling back to '{ORDER_IMPORTANCE}'.")
+    SPLAT_ORDER = ORDER_IMPORTANCE
+# Also write the quantized column format (output/output.csplat), optionally with SH band 1+ codebooks
+SPLAT_COMPRESSED = os.getenv("SPLAT_COMPRESSED", "1") == "1"
+SPLAT_COMPRESSED_KEEP_SH = os.getenv("SPLAT_COMPRESSED_KEEP_SH", "0") == "1"
+# Bit depths of output.csplat: "compact" (smallest) or "high" (about .splat's precision)
+SPLAT_COMPRESSED_PROFILE = os.getenv("SPLAT_COMPRESSED_PROFILE", DEFAULT_PROFILE).lower()
+if SPLAT_COMPRESSED_PROFILE not in PROFILES:
+    log.warning(f"Unknown SPLAT_COMPRESSED_PROFILE '{SPLAT_COMPRESSED_PROFILE}', falling back to '{DEFAULT_PROFILE}'.")
+    SPLAT_COMPRESSED_PROFILE = DEFAULT_PROFILE
+# Fractions of Gaussians kept per LOD level, finest first (e.g. "1.0,0.25,0.05")
+SPLAT_LOD_FRACTIONS = tuple(
+    float(f) for f in os.getenv("SPLAT_LOD_FRACTIONS", ",".join(str(f) for f in DEFAULT_LOD_FRACTIONS)).split(",") if f.strip()
+)
+
 @celery_app.task(name="worker.tasks.convert.convert_ply_to_splat")
 def convert_ply_to_splat_task(job_id: str):
     log.info(f"[Job {job_id}] Task: Starting PLY to SPLAT conversion...")
+    report_progress(job_id, "convert_ply_to_splat")
     update_job_status(job_id, status=JobStatus.POSTPROCESSING)
     try:
-        # --- TODO: Add actual conversion logic here ---
-        time.sleep(2) # Simulate work
-        log.info(f"[Job {job_id}] Task: PLY to SPLAT conversion finished.")
+        job_dir = get_job_dir(job_id)
+        ply_path = find_trained_ply(job_dir / "model")
+        splat_path = job_dir / "output" / "output.splat"
 
-        # --- Final Step: Update job status to COMPLETED and set output path ---
-        relative_output_path = str(Path(job_id) / "output" / "output.splat") # Example path
-        update_job_status(job_id, status=JobStatus.COMPLETED, output_path=relative_output_path)
-        log.info(f"[Job {job_id}] Task: Pipeline finished successfully.")
-        return job_id # End of the chain
+        start = time.perf_counter()
+        num_splats = write_splat(ply_path, splat_path, chunk_size=SPLAT_CHUNK_SIZE, order=SPLAT_ORDER)
+        log.info(f"[Job {job_id}] Task: PLY to SPLAT conversion finished ({num_splats} splats, order={SPLAT_ORDER}, from {ply_path.name} in {time.perf_counter() - start:.2f}s).")
+
+        relative_compressed_path = None
+        if SPLAT_COMPRESSED:
+            start = time.perf_counter()
+            summary = write_compressed_splat(ply_path, job_dir / "output" / "output.csplat", keep_sh=SPLAT_COMPRESSED_KEEP_SH,
+                                            profile=SPLAT_COMPRESSED_PROFILE)
+            relative_compressed_path = str(Path(job_id) / "output" / "output.csplat")
+            ratio = splat_path.stat().st_size / max(summary["bytes"], 1)
+            log.info(f"[Job {job_id}] Task: Compressed splat written ({summary['bytes']} bytes, {ratio:.1f}x smaller than .splat, {time.perf_counter() - start:.2f}s).")
+
+        relative_output_path = str(Path(job_id) / "output" / "output.splat")
+        update_job_status(job_id, output_path=relative_output_path, compressed_path=relative_compressed_path)
+        return job_id
     except Exception as e:
         log.error(f"[Job {job_id}] Task: Error during PLY to SPLAT conversion: {e}", exc_info=True)
         update_job_status(job_id, failed_step="convert_ply_to_splat", error_msg=str(e))
         raise
-    
\ No newline at end of file
+
+@celery_app.task(name="worker.tasks.convert.build_lod")
+def build_lod_task(job_id: str):
+    log.info(f"[Job {job_id}] Task: Starting LOD pyramid build...")
+    report_progress(job_id, "build_lod")
+    # Status remains POSTPROCESSING
+    try:
+        output_dir = get_job_dir(job_id) / "output"
+        start = time.perf_counter()
+        levels = build_lod_levels(output_dir / "output.splat", output_dir / "lod", fractions=SPLAT_LOD_FRACTIONS)
+        counts = ", ".join(f"lod{lvl['level']}={lvl['count']}" for lvl in levels)
+        log.info(f"[Job {job_id}] Task: LOD pyramid finished ({counts}) in {time.perf_counter() - start:.2f}s.")
+
+        # Precompressed siblings are generated once here, so the interface never compresses per request
+        start = time.perf_counter()
+        precompressed = precompress_outputs(output_dir)
+        log.info(f"[Job {job_id}] Task: Precompressed {len(precompressed)} output files in {time.perf_counter() - start:.2f}s.")
+
+        # --- Final Step: Update job status to COMPLETED ---
+        update_job_status(job_id, status=JobStatus.COMPLETED)
+        log.info(f"[Job {job_id}] Task: Pipeline finished successfully.")
+        return job_id # End of the chain
+    except Exception as e:
+        log.error(f"[Job {job_id}] Task: Error during LOD pyramid build: {e}", exc_info=True)
+        update_job_status(job_id, failed_step="build_lod", error_msg=str(e))
+        raise
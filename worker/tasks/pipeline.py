@@ -1 +1,57 @@
-print("worker.tasks.pipeline module loaded (currently empty)")
\ No newline at end of file
+# worker/tasks/pipeline.py
+"""
+Fused execution of the CPU stages.
+
+In the default chain every stage is its own Celery message: a broker round trip per
+stage, and a possibly different cpu_worker each time, with a cold page cache. In fused mode
+(PIPELINE_MODE=fused on the interface) one task runs the preprocessing and COLMAP
+stages back to back in this process. Frames, pyramid and database stay in the page
+cache, and models such as the segmentation session stay loaded. Only the hop to the
+GPU worker goes through the broker.
+
+The stages are the regular task functions called in-process, so they report status,
+record failures and use the stage cache exactly as in the chain. Each one is measured
+as its own job_stage row (worker/stage_metrics.py), as in the chain; the queue wait of
+the message goes to the first stage.
+"""
+import logging
+import time
+from worker.celery_app import celery_app
+from worker.cpu_budget import CpuBudgetExhausted, CPU_BUDGET_RETRY_SECONDS
+from worker.stage_metrics import measure_stage, stage_name, PUBLISHED_AT_HEADER
+from worker.tasks.preprocess import extract_frames_task, remove_background_task, build_pyramid_task
+from worker.tasks.colmap import (
+    feature_extraction_task, feature_matching_task, sparse_mapping_task, image_undistortion_task
+)
+
+log = logging.getLogger(__name__)
+
+CPU_STAGES = (
+    extract_frames_task,
+    remove_background_task,
+    build_pyramid_task,
+    feature_extraction_task,
+    feature_matching_task,
+    sparse_mapping_task,
+    image_undistortion_task,
+)
+
+@celery_app.task(name="worker.tasks.pipeline.run_cpu_stages", bind=True, measures_stages=True)
+def run_cpu_stages_task(self, job_id: str, start_stage: int = 0):
+    """Runs CPU_STAGES[start_stage:] in this process. Stage failures are recorded by the stages themselves."""
+    log.info(f"[Job {job_id}] Task: Starting fused CPU stages (from {CPU_STAGES[start_stage].name})...")
+    timings = []
+    for index in range(start_stage, len(CPU_STAGES)):
+        stage = CPU_STAGES[index]
+        stage_start = time.perf_counter()
+        published_at = self.request.get(PUBLISHED_AT_HEADER) if index == start_stage else None
+        try:
+            with measure_stage(job_id, stage_name(stage.name), self.request, published_at):
+                stage(job_id) # Direct call: runs in this process, no broker round trip
+        except CpuBudgetExhausted as e:
+            # Requeue from this stage on; the stages before it are done
+            log.info(f"[Job {job_id}] Task: {e}. Fused run requeued at {stage.name} in {CPU_BUDGET_RETRY_SECONDS}s.")
+            raise self.retry(args=(job_id, index), exc=e, countdown=CPU_BUDGET_RETRY_SECONDS, max_retries=None)
+        timings.append(f"{stage_name(stage.name)} {time.perf_counter() - stage_start:.1f}s")
+    log.info(f"[Job {job_id}] Task: Fused CPU stages finished ({', '.join(timings)}).")
+    return job_id
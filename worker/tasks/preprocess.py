@@ -1,17 +1,57 @@
 import logging
+import os
 import time
+from celery.signals import worker_process_init
 from worker.celery_app import celery_app
-from worker.tasks.utils import update_job_status, Job, JobStatus
+from worker.tasks.utils import update_job_status, report_progress, get_job_dir, get_job_params, DATA_DIR, Job, JobStatus
+from worker.stage_cache import stage_cache, file_sha256
+from worker.video_decode import extract_keyframes_parallel
+from worker import segmentation
+from worker.image_pyramid import build_pyramid
 
 log = logging.getLogger(__name__)
 
+# Long side of the extracted frames in pixels (0 keeps the video resolution) and their format
+FRAME_MAX_SIZE = int(os.getenv("FRAME_MAX_SIZE", 1600))
+FRAME_FORMAT = os.getenv("FRAME_FORMAT", "jpg").lower()
+DEFAULT_NUM_FRAMES = int(os.getenv("DEFAULT_NUM_FRAMES", 200)) # For jobs created without num_frames
+# Processes decoding keyframe-aligned segments in parallel (0: one per core, 1: single stream)
+FRAME_DECODE_WORKERS = int(os.getenv("FRAME_DECODE_WORKERS", 0))
+# Load the segmentation model when a worker process starts instead of in the first job
+REMBG_PRELOAD = os.getenv("REMBG_PRELOAD", "1") == "1"
+
+@worker_process_init.connect
+def preload_segmentation_model(**kwargs):
+    if not REMBG_PRELOAD:
+        return
+    try:
+        segmentation.get_session()
+    except Exception as e:
+        # Not fatal: the first background removal task retries the load and reports the error
+        log.warning(f"Could not preload the segmentation model: {e}")
+
 @celery_app.task(name="worker.tasks.preprocess.extract_frames")
 def extract_frames_task(job_id: str):
     log.info(f"[Job {job_id}] Task: Starting frame extraction...")
+    report_progress(job_id, "extract_frames")
     update_job_status(job_id, status=JobStatus.PREPROCESSING)
     try:
-        # --- Todo: Add actual ffmpeg logic ---
-        time.sleep(3) # Simulate work
+        params = get_job_params(job_id)
+        video_path = DATA_DIR / params["input_video_path"]
+        num_frames = params["num_frames"] or DEFAULT_NUM_FRAMES
+        # The first stage is keyed by the video itself; later stages chain from its key
+        video_sha256 = params["content_hash"] or file_sha256(video_path)
+        stage_params = {"video_sha256": video_sha256, "num_frames": num_frames,
+                        "max_size": FRAME_MAX_SIZE, "format": FRAME_FORMAT}
+        with stage_cache(job_id, "extract_frames", stage_params, DATA_DIR) as stage:
+            if not stage.hit:
+                start = time.perf_counter()
+                summary = extract_keyframes_parallel(video_path, get_job_dir(job_id) / "frames", num_frames,
+                                                     max_size=FRAME_MAX_SIZE, ext=FRAME_FORMAT,
+                                                     workers=FRAME_DECODE_WORKERS)
+                log.info(f"[Job {job_id}] Task: Selected {summary['selected']} of {summary['decoded_frames']} frames "
+                         f"(median sharpness {summary['median_sharpness_selected']:.1f} vs {summary['median_sharpness_all']:.1f} overall) "
+                         f"in {time.perf_counter() - start:.2f}s.")
         log.info(f"[Job {job_id}] Task: Frame extraction finished.")
         return job_id # Pass job_id to the next task
     except Exception as e:
@@ -22,14 +62,43 @@ def extract_frames_task(job_id: str):
 @celery_app.task(name="worker.tasks.preprocess.remove_background")
 def remove_background_task(job_id: str):
     log.info(f"[Job {job_id}] Task: Starting background removal...")
+    report_progress(job_id, "remove_background")
     # Status remains PREPROCESSING
     try:
-        # --- TODO: Add actual rembg/SAM logic ---
-        time.sleep(5) # Simulate work
+        stage_params = {"model": segmentation.REMBG_MODEL, "model_path": segmentation.REMBG_MODEL_PATH}
+        with stage_cache(job_id, "remove_background", stage_params, DATA_DIR) as stage:
+            if not stage.hit:
+                job_dir = get_job_dir(job_id)
+                summary = segmentation.remove_background(
+                    job_dir / "frames", job_dir / "images", job_dir / "masks",
+                    progress=lambda fraction: report_progress(job_id, "remove_background", fraction))
+                log.info(f"[Job {job_id}] Task: Segmented {summary['frames']} frames in {summary['seconds']:.2f}s "
+                         f"({summary['frames_per_s']:.1f} frames/s, {summary['inference_seconds']:.2f}s inference, "
+                         f"batch size {summary['batch_size']}).")
         log.info(f"[Job {job_id}] Task: Background removal finished.")
         return job_id
     except Exception as e:
         log.error(f"[Job {job_id}] Task: Error during background removal: {e}", exc_info=True)
         update_job_status(job_id, failed_step="remove_background", error_msg=str(e))
         raise
-    
\ No newline at end of file
+
+@celery_app.task(name="worker.tasks.preprocess.build_pyramid")
+def build_pyramid_task(job_id: str):
+    log.info(f"[Job {job_id}] Task: Building image pyramid...")
+    report_progress(job_id, "build_pyramid")
+    # Status remains PREPROCESSING
+    try:
+        with stage_cache(job_id, "build_pyramid", {}, DATA_DIR) as stage:
+            if not stage.hit:
+                start = time.perf_counter()
+                job_dir = get_job_dir(job_id)
+                manifest = build_pyramid(job_dir / "images", job_dir / "masks", job_dir / "pyramid")
+                sizes = ", ".join(f"{f}x: {l['width']}x{l['height']}" for f, l in manifest["levels"].items())
+                log.info(f"[Job {job_id}] Task: Pyramid of {len(manifest['images'])} images ({sizes}) "
+                         f"built in {time.perf_counter() - start:.2f}s.")
+        log.info(f"[Job {job_id}] Task: Image pyramid finished.")
+        return job_id
+    except Exception as e:
+        log.error(f"[Job {job_id}] Task: Error while building the image pyramid: {e}", exc_info=True)
+        update_job_status(job_id, failed_step="build_pyramid", error_msg=str(e))
+        raise
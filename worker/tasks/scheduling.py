@@ -0,0 +1,159 @@
+# worker/tasks/scheduling.py
+"""
+Database-backed GPU scheduling (policy in worker/gpu_scheduler.py).
+
+The CPU part of the pipeline ends with schedule_gpu_task. It marks the job as waiting
+for the GPU and runs the scheduler. The scheduler runs again whenever a training task
+ends, successfully or not, and then releases the next job(s). It also runs every
+GPU_SCHEDULE_INTERVAL_SECONDS (schedule_gpu_tick, from celery beat), so a job whose
+dispatch failed, or that waits behind a lost job, does not wait for the next submission.
+Scheduler runs on different workers are serialized by a Postgres advisory lock held for
+the transaction.
+"""
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+from celery import chain
+from sqlalchemy import bindparam, func, select, update
+
+from worker.celery_app import celery_app
+from worker.database import get_sync_session
+from worker.gpu_scheduler import GpuJob, GpuScheduler
+from worker.status_reporter import TERMINAL_STATUSES
+from worker.tasks.utils import update_job_status, report_progress, Job
+
+log = logging.getLogger(__name__)
+
+GPU_SCHEDULER_LOCK_KEY = 0x53504C47 # pg_advisory_xact_lock key ("SPLG"), unique to this lock
+_job_table = Job.__table__
+
+
+def _to_datetime(seconds: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc) if seconds is not None else None
+
+
+def _to_gpu_job(job: Job) -> GpuJob:
+    return GpuJob(
+        job_id=job.jobid,
+        submitter=job.submitter or "anonymous",
+        priority=job.priority or 0,
+        num_frames=job.num_frames or 0,
+        iterations=job.iterations or 0,
+        enqueued_at=job.gpu_enqueued_at.timestamp(),
+        started_at=job.gpu_started_at.timestamp() if job.gpu_started_at else None,
+        heartbeat_at=job.updated_at.timestamp() if job.updated_at else None, # Progress writes of the training task
+    )
+
+
+class _SqlGpuTransaction:
+    def __init__(self, session):
+        self.session = session
+        self._queue_info: List[Dict] = []
+
+    def waiting(self) -> List[GpuJob]:
+        jobs = self.session.scalars(select(Job).where(
+            Job.gpu_enqueued_at.is_not(None), Job.gpu_started_at.is_(None), Job.status.not_in(TERMINAL_STATUSES)))
+        return [_to_gpu_job(job) for job in jobs]
+
+    def running(self) -> List[GpuJob]:
+        jobs = self.session.scalars(select(Job).where(
+            Job.gpu_started_at.is_not(None), Job.gpu_finished_at.is_(None), Job.status.not_in(TERMINAL_STATUSES)))
+        return [_to_gpu_job(job) for job in jobs]
+
+    def usage(self, since: float, now: float) -> Dict[str, float]:
+        """GPU seconds per submitter between `since` and `now`."""
+        since_dt = _to_datetime(since)
+        rows = self.session.execute(
+            select(Job.submitter, Job.gpu_started_at, Job.gpu_finished_at)
+            .where(Job.gpu_started_at.is_not(None))
+            .where((Job.gpu_finished_at.is_(None)) | (Job.gpu_finished_at > since_dt))
+        )
+        usage: Dict[str, float] = {}
+        for submitter, started_at, finished_at in rows:
+            end = finished_at.timestamp() if finished_at else now
+            submitter = submitter or "anonymous"
+            usage[submitter] = usage.get(submitter, 0.0) + max(0.0, end - max(started_at.timestamp(), since))
+        return usage
+
+    def mark_started(self, job_id: str, now: float, eta: float) -> None:
+        self.session.execute(update(_job_table).where(_job_table.c.jobid == job_id).values(
+            gpu_started_at=_to_datetime(now), queue_position=0, gpu_eta_at=_to_datetime(eta)))
+
+    def set_queue_info(self, job_id: str, position: int, eta: float) -> None:
+        self._queue_info.append({"b_jobid": job_id, "b_position": position, "b_eta": _to_datetime(eta)})
+
+    def flush(self) -> None:
+        if self._queue_info: # One statement for all waiting jobs
+            self.session.connection().execute(
+                update(_job_table).where(_job_table.c.jobid == bindparam("b_jobid"))
+                .values(queue_position=bindparam("b_position"), gpu_eta_at=bindparam("b_eta")),
+                self._queue_info,
+            )
+
+
+class SqlGpuStore:
+    def mark_waiting(self, job_id: str, now: float) -> None:
+        with get_sync_session() as session:
+            session.execute(update(_job_table).where(_job_table.c.jobid == job_id).values(
+                gpu_enqueued_at=_to_datetime(now), gpu_started_at=None, gpu_finished_at=None,
+                queue_position=None, gpu_eta_at=None))
+
+    def mark_finished(self, job_id: str, now: float) -> None:
+        with get_sync_session() as session:
+            session.execute(update(_job_table).where(_job_table.c.jobid == job_id).values(
+                gpu_finished_at=_to_datetime(now), queue_position=None))
+
+    @contextmanager
+    def transaction(self) -> Iterator[_SqlGpuTransaction]:
+        with get_sync_session() as session:
+            session.execute(select(func.pg_advisory_xact_lock(GPU_SCHEDULER_LOCK_KEY)))
+            txn = _SqlGpuTransaction(session)
+            yield txn
+            txn.flush()
+
+
+def dispatch_gpu_chain(job_id: str) -> None:
+    """Sends training and the stages after it. By task name, so this module imports no task modules."""
+    chain(
+        celery_app.signature("worker.tasks.splatting.train_splatting", args=(job_id,), immutable=True, queue="gpu_queue"),
+        celery_app.signature("worker.tasks.convert.convert_ply_to_splat", args=(job_id,), immutable=True, queue="cpu_queue"),
+        celery_app.signature("worker.tasks.convert.build_lod", args=(job_id,), immutable=True, queue="cpu_queue"),
+    ).apply_async()
+
+
+gpu_scheduler = GpuScheduler(SqlGpuStore(), dispatch_gpu_chain)
+
+
+def release_gpu_slot(job_id: str) -> None:
+    """Called when a job's training ends: frees its slot and starts the next job(s). Never raises."""
+    try:
+        gpu_scheduler.finished(job_id)
+        gpu_scheduler.schedule()
+    except Exception as e:
+        log.error(f"[Job {job_id}] GPU scheduler: could not release the GPU slot: {e}", exc_info=True)
+
+
+@celery_app.task(name="worker.tasks.scheduling.schedule_gpu_tick", ignore_result=True)
+def schedule_gpu_tick_task():
+    """Periodic scheduler run (celery beat, see worker/celery_app.py)."""
+    started = gpu_scheduler.schedule()
+    if started:
+        log.info(f"GPU scheduler: periodic run started {len(started)} job(s): {', '.join(started)}.")
+
+
+@celery_app.task(name="worker.tasks.scheduling.schedule_gpu")
+def schedule_gpu_task(job_id: str):
+    log.info(f"[Job {job_id}] Task: Waiting for a GPU slot...")
+    report_progress(job_id, "waiting_for_gpu")
+    try:
+        gpu_scheduler.enqueue(job_id)
+        started = gpu_scheduler.schedule()
+        if job_id not in started:
+            log.info(f"[Job {job_id}] Task: Queued for the GPU behind other jobs.")
+        return job_id
+    except Exception as e:
+        log.error(f"[Job {job_id}] Task: Error while scheduling GPU training: {e}", exc_info=True)
+        update_job_status(job_id, failed_step="schedule_gpu", error_msg=str(e))
+        raise
@@ -1,22 +1,86 @@
+import json
 import logging
-import time
+import os
+import zlib
+from pathlib import Path
 from worker.celery_app import celery_app
-from worker.tasks.utils import update_job_status, Job, JobStatus
+from worker.tasks.utils import update_job_status, report_progress, get_job_dir, get_job_params, DATA_DIR, Job, JobStatus
+from worker.stage_cache import stage_cache
+from worker.tasks.scheduling import release_gpu_slot
+from worker import image_pyramid
+from worker.splat_training import CheckpointStore, CpuStandInTrainer, Trainer, run_training
 
 log = logging.getLogger(__name__)
 
-@celery_app.task(name="worker.tasks.splatting.train_splatting")
-def train_splatting_task(job_id: str):
+# Long side of the training images; the matching pyramid level is read (0: full resolution)
+TRAIN_MAX_IMAGE_SIZE = int(os.getenv("TRAIN_MAX_IMAGE_SIZE", 1600))
+# Only the CPU stand-in exists until the Gaussian Splatting trainer is integrated (see worker/splat_training.py)
+SPLAT_TRAINER = os.getenv("SPLAT_TRAINER", "stand-in")
+TRAIN_STAND_IN_SECONDS = float(os.getenv("TRAIN_STAND_IN_SECONDS", 15)) # Simulated GPU time of a whole run
+# A job whose training kills its worker every time would otherwise be redelivered forever
+TRAIN_MAX_DELIVERIES = int(os.getenv("TRAIN_MAX_DELIVERIES", 5))
+
+
+def make_trainer(job_id: str, iterations: int) -> Trainer:
+    if SPLAT_TRAINER != "stand-in":
+        raise ValueError(f"Unknown SPLAT_TRAINER '{SPLAT_TRAINER}'")
+    return CpuStandInTrainer(seed=zlib.crc32(job_id.encode()), seconds_per_iteration=TRAIN_STAND_IN_SECONDS / iterations)
+
+
+def count_delivery(checkpoint_dir: Path) -> int:
+    """Counts a start of the job's training; the count is removed with the checkpoints."""
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    path = checkpoint_dir / "deliveries"
+    try:
+        count = int(path.read_text()) + 1
+    except (FileNotFoundError, ValueError):
+        count = 1
+    path.write_text(str(count))
+    return count
+
+
+# Started by the GPU scheduler (worker/tasks/scheduling.py), never queued directly.
+# acks_late with the gpu_worker's prefetch multiplier of 1: a worker holds only the job it is training.
+# reject_on_worker_lost: if the worker process dies, the message is requeued and training resumes from a checkpoint
+@celery_app.task(name="worker.tasks.splatting.train_splatting", bind=True, acks_late=True, reject_on_worker_lost=True)
+def train_splatting_task(self, job_id: str):
     log.info(f"[Job {job_id}] Task: Starting Gaussian Splatting training...")
+    report_progress(job_id, "train_splatting")
     update_job_status(job_id, status=JobStatus.RUNNING_SPLATTING)
     try:
-        # --- Todo: Add actual Gaussian Splatting training logic ---
-        # This step implicitly saves the .ply file based on train.py parameters
-        log.info(f"[Job {job_id}] Task: Gaussian Splatting training simulation (long step)...")
-        time.sleep(15) # Simulate long GPU work
+        params = get_job_params(job_id)
+        # Keyed by iterations on top of the undistorted reconstruction: more iterations only retrains.
+        # The trainer is part of the key, so stand-in models are never served once a real trainer runs
+        stage_params = {"trainer": SPLAT_TRAINER, "iterations": params["iterations"], "max_image_size": TRAIN_MAX_IMAGE_SIZE}
+        with stage_cache(job_id, "train_splatting", stage_params, DATA_DIR) as stage:
+            if not stage.hit:
+                job_dir = get_job_dir(job_id)
+                (job_dir / "model").mkdir(parents=True, exist_ok=True)
+                pyramid_dir = job_dir / "pyramid"
+                factor = image_pyramid.select_factor(pyramid_dir, TRAIN_MAX_IMAGE_SIZE)
+                names = image_pyramid.read_manifest(pyramid_dir)["images"]
+                log.info(f"[Job {job_id}] Task: Training on {len(names)} images at 1/{factor} scale "
+                         f"({image_pyramid.images_dir(pyramid_dir, factor).name}).")
+                checkpoint_dir = job_dir / "checkpoints" / "train_splatting"
+                deliveries = count_delivery(checkpoint_dir)
+                if deliveries > TRAIN_MAX_DELIVERIES:
+                    raise RuntimeError(f"Training was started {deliveries - 1} times without finishing, giving up.")
+                if self.request.delivery_info and self.request.delivery_info.get("redelivered"):
+                    log.warning(f"[Job {job_id}] Task: Redelivered (start {deliveries}), resuming from the latest checkpoint.")
+                iterations = max(1, params["iterations"] or 1)
+                store = CheckpointStore(checkpoint_dir, json.dumps(stage_params, sort_keys=True))
+                trainer = make_trainer(job_id, iterations)
+                resumed_from = run_training(trainer, store, iterations,
+                                            progress=lambda fraction: report_progress(job_id, "train_splatting", fraction))
+                ply_path = trainer.export(job_dir / "model", iterations)
+                store.clear() # The model is saved: the checkpoints are no longer needed
+                log.info(f"[Job {job_id}] Task: Trained {iterations - resumed_from} of {iterations} iterations in this run "
+                         f"({ply_path.relative_to(job_dir)}).")
         log.info(f"[Job {job_id}] Task: Gaussian Splatting training finished.")
         return job_id
     except Exception as e:
         log.error(f"[Job {job_id}] Task: Error during Gaussian Splatting training: {e}", exc_info=True)
         update_job_status(job_id, failed_step="train_splatting", error_msg=str(e))
         raise
+    finally:
+        release_gpu_slot(job_id) # Lets the scheduler start the next job on this GPU
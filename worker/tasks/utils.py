@@ -1,7 +1,11 @@
 import logging
+import os
+from pathlib import Path
 from worker.database import get_sync_session
+from worker.status_reporter import reporter, TERMINAL_STATUSES
+from worker import stage_metrics # noqa: F401 (connects the per-stage instrumentation signals)
 from typing import Optional
-from datetime import datetime, timezone # Import datetime components
+from celery.signals import task_postrun, worker_process_shutdown
 
 # Import directly - assumes PYTHONPATH=/app is set in the worker container
 # and the interface code is mounted at /app/interface
@@ -16,72 +20,76 @@ except ImportError as e:
 
 log = logging.getLogger(__name__)
 
-# Use the direct type hint now that import should work
+# Shared data volume (/app/data in every container), laid out as data/<jobid>/...
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(__file__).resolve().parent.parent.parent / "data"))
+
+
+def get_job_dir(job_id: str) -> Path:
+    """Returns the data directory of a job."""
+    return DATA_DIR / job_id
+
+
+def get_job_params(job_id: str) -> dict:
+    """Reads the processing parameters and input of a job from the database."""
+    with get_sync_session() as session:
+        job = session.get(Job, job_id)
+        if not job:
+            raise ValueError(f"Job {job_id} not found in database")
+        return {
+            "num_frames": job.num_frames,
+            "iterations": job.iterations,
+            "content_hash": job.content_hash,
+            "input_video_path": job.input_video_path,
+            "matcher": job.matcher,
+        }
+
+
+def set_job_fields(job_id: str, **fields) -> None:
+    """Stores task results on the job record (e.g. matching_strategy=..., matched_pairs=...), coalesced."""
+    reporter.report(job_id, **fields)
+
+
 def update_job_status(job_id: str, status: Optional[JobStatus] = None,
                       failed_step: Optional[str] = None, error_msg: Optional[str] = None,
-                      output_path: Optional[str] = None):
-    """Helper to update job status and optionally other fields in the database."""
-    log_prefix = f"[Job {job_id}]"
-    try:
-        with get_sync_session() as session:
-            # Use session.get for primary key lookup
-            job = session.get(Job, job_id)
-            if not job:
-                log.error(f"{log_prefix} Job not found in database during status update.")
-                return
-
-            updated = False
-            update_log = []
-
-            # Update status if provided and different
-            if status is not None and isinstance(status, JobStatus) and job.status != status:
-                job.status = status
-                updated = True
-                update_log.append(f"status={status.name}")
-
-            # Handle failure conditions
-            if failed_step is not None:
-                job.failed_at_step = failed_step
-                # Automatically set status to FAILED on failure, unless already completed/failed
-                if job.status not in [JobStatus.FAILED, JobStatus.COMPLETED]:
-                    job.status = JobStatus.FAILED
-                    if status != JobStatus.FAILED: # Avoid duplicate log if status was already set to FAILED
-                        update_log.append(f"status=FAILED")
-                updated = True
-                update_log.append(f"failed_at_step='{failed_step}'")
-
-            # Update error message if provided
-            if error_msg is not None:
-                job.error_message = error_msg[:1000] # Truncate to prevent overflow
-                updated = True
-                # Log the error message content separately if needed for debugging
-
-            # Update output path if provided
-            if output_path is not None:
-                job.output_splat_path = output_path
-                updated = True
-                update_log.append(f"output_splat_path='{output_path}'")
-
-            # Set completion timestamp if status is now COMPLETED or FAILED
-            # and it hasn't been set yet (DB default might handle this too)
-            if job.status in [JobStatus.COMPLETED, JobStatus.FAILED] and job.completed_at is None:
-                 job.completed_at = datetime.now(timezone.utc)
-                 updated = True
-                 update_log.append("completed_at=now()")
-
-
-            # If any changes were made, log them
-            if updated:
-                # session.add(job) is not strictly needed if object was fetched from session
-                # and modified, but explicit doesn't hurt.
-                session.add(job)
-                # Commit happens automatically due to the context manager `get_sync_session`
-                log.info(f"{log_prefix} DB updated: {', '.join(update_log)}")
-            else:
-                 log.debug(f"{log_prefix} No DB changes needed for this update call.")
-
-    except Exception as db_e:
-        # Log critical error if DB update fails
-        log.critical(f"{log_prefix} CRITICAL: Failed to update job in database: {db_e}", exc_info=True)
-        # Re-raise the exception so Celery knows the task might have failed here
-        raise
+                      output_path: Optional[str] = None, compressed_path: Optional[str] = None):
+    """
+    Reports a job status change and optionally other fields. Failures and completion are written
+    immediately; other changes are coalesced and written by the status reporter shortly after.
+    """
+    fields = {}
+    if failed_step is not None:
+        fields["failed_at_step"] = failed_step
+    if error_msg is not None:
+        fields["error_message"] = error_msg[:1000] # Truncate to prevent overflow
+    if output_path is not None:
+        fields["output_splat_path"] = output_path
+    if compressed_path is not None:
+        fields["output_compressed_path"] = compressed_path
+
+    if failed_step is not None or status == JobStatus.FAILED:
+        reporter.report_terminal(job_id, JobStatus.FAILED, **fields)
+    elif status in TERMINAL_STATUSES:
+        reporter.report_terminal(job_id, status, **fields)
+    else:
+        if status is not None:
+            fields["status"] = status
+        if fields:
+            reporter.report(job_id, **fields)
+
+
+def report_progress(job_id: str, stage: str, progress: float = 0.0) -> None:
+    """Reports the running stage and its progress (0-1). Cheap: coalesced with other updates of the job."""
+    reporter.report(job_id, current_stage=stage, progress=round(min(max(progress, 0.0), 1.0), 4))
+
+
+@task_postrun.connect
+def flush_job_status(task=None, args=None, kwargs=None, **extra):
+    """Writes a task's pending status changes before the next stage can start on another worker."""
+    job_id = args[0] if args else (kwargs or {}).get("job_id")
+    if isinstance(job_id, str):
+        reporter.flush(job_id)
+
+
+@worker_process_shutdown.connect
+def flush_all_job_status(**extra):
+    reporter.flush()
@@ -0,0 +1,264 @@
+# worker/video_decode.py
+"""
+Parallel, segmented decoding of the input video for keyframe extraction.
+
+ffprobe lists the packet timestamps and keyframe flags without decoding anything.
+The timeline is then cut at the keyframes closest to equal splits, so every
+segment starts on a keyframe and decodes independently. Each segment runs its own
+ffmpeg process, which scales to the target resolution and pipes raw YUV 4:2:0 frames
+to a pool worker. The worker scores the luma plane directly (worker.keyframes) and
+converts to BGR only the best frame of each bin, which it writes in the target format. Bins that straddle a segment boundary get one
+candidate from each side; the ordered merge at the end keeps the better one and
+numbers the frames by source position, so the output does not depend on scheduling.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+from bisect import bisect_left
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+from worker.keyframes import (
+    KeyframeSelector, extract_keyframes, frame_filename, publish_dir, write_candidate, write_manifest,
+)
+
+log = logging.getLogger(__name__)
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+SEGMENTS_PER_WORKER = 2 # More segments than workers evens out uneven GOP lengths
+
+
+class VideoInfo(NamedTuple):
+    width: int # Display size, after rotation metadata is applied
+    height: int
+    fps: float
+    start_us: int # Container start time in microseconds (ffmpeg's -ss is relative to it)
+    frame_times_us: np.ndarray # Presentation timestamps of all frames in microseconds (rounded down), sorted
+    keyframes: List[int] # Positions of keyframes in frame_times_us
+
+
+class Segment(NamedTuple):
+    first_frame: int
+    num_frames: int
+    start_us: int # Relative to the container start time, as ffmpeg -ss expects
+
+
+def probe_video(video_path: Path) -> VideoInfo:
+    """Reads stream geometry and every packet's timestamp and keyframe flag (no decoding)."""
+    result = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-select_streams", "v:0", "-of", "json",
+         "-show_entries", "stream=width,height,avg_frame_rate,time_base:stream_tags=rotate:stream_side_data=rotation"
+                          ":format=start_time:packet=pts,flags",
+         str(video_path)],
+        check=True, capture_output=True, text=True,
+    )
+    data = json.loads(result.stdout)
+    stream = data["streams"][0]
+    width, height = int(stream["width"]), int(stream["height"])
+    rotation = int(float(stream.get("tags", {}).get("rotate", 0)))
+    for side_data in stream.get("side_data_list", []):
+        rotation = int(float(side_data.get("rotation", rotation)))
+    if abs(rotation) % 180 == 90:
+        width, height = height, width # ffmpeg autorotates before our scale filter
+
+    numerator, _, denominator = stream.get("avg_frame_rate", "0/1").partition("/")
+    fps = float(numerator) / float(denominator or 1) if float(denominator or 1) else 0.0
+
+    # Packets flagged D (e.g. cut by an MP4 edit list) are never output by the decoder
+    packets = [p for p in data.get("packets", []) if "D" not in p.get("flags", "")]
+    if not packets or not all(isinstance(p.get("pts"), int) for p in packets):
+        raise ValueError(f"{video_path.name}: packets without timestamps, cannot segment")
+    # Integer arithmetic: a seek target that rounds above a keyframe's timestamp would drop the keyframe
+    tb_num, _, tb_den = stream["time_base"].partition("/")
+    pts = np.array([p["pts"] for p in packets], dtype=np.int64)
+    times_us = (pts * int(tb_num) * 1_000_000) // int(tb_den)
+    order = np.argsort(times_us, kind="stable")
+    is_key = np.array(["K" in p.get("flags", "") for p in packets])[order]
+    start_us = round(float(data.get("format", {}).get("start_time", 0.0) or 0.0) * 1_000_000)
+    return VideoInfo(width, height, fps, start_us, times_us[order], np.flatnonzero(is_key).tolist())
+
+
+def output_size(width: int, height: int, max_size: int) -> Tuple[int, int]:
+    """Frame size with the long side limited to `max_size`, rounded to even numbers for the scaler."""
+    scale = min(1.0, max_size / max(width, height)) if max_size else 1.0
+    return max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2)
+
+
+def plan_segments(info: VideoInfo, num_segments: int) -> List[Segment]:
+    """Cuts the video at the keyframes closest to `num_segments` equal splits."""
+    total = len(info.frame_times_us)
+    cuts = {0}
+    if info.keyframes:
+        for i in range(1, num_segments):
+            target = total * i / num_segments
+            position = bisect_left(info.keyframes, target)
+            nearby = info.keyframes[max(0, position - 1):position + 1]
+            cuts.add(min(nearby, key=lambda k: abs(k - target)))
+    bounds = sorted(cuts) + [total]
+    return [
+        Segment(first, last - first, int(info.frame_times_us[first]) - info.start_us)
+        for first, last in zip(bounds[:-1], bounds[1:]) if last > first
+    ]
+
+
+def decode_segment(video_path: Path, segment: Segment, size: Tuple[int, int], threads: int = 1) -> Iterator[np.ndarray]:
+    """
+    Yields the frames of one segment at `size` as I420 arrays of shape (height * 3 / 2, width),
+    decoded by ffmpeg from the segment's keyframe. The first `height` rows are the luma plane.
+    """
+    width, height = size
+    command = [FFMPEG_BIN, "-v", "error", "-nostdin", "-threads", str(threads)]
+    if segment.first_frame > 0:
+        # Accurate seek: the demuxer lands on a keyframe at or before the target (exactly ours when its
+        # index is precise, an earlier one otherwise) and frames before the target are discarded
+        command += ["-ss", f"{segment.start_us}us"]
+    command += [
+        "-i", str(video_path),
+        "-map", "0:v:0", "-an", "-sn", "-dn",
+        "-vf", f"scale={width}:{height}:flags=area",
+        "-vsync", "passthrough",
+        "-frames:v", str(segment.num_frames),
+        # YUV output: converting every frame to BGR in swscale would cost more than decoding it
+        "-f", "rawvideo", "-pix_fmt", "yuv420p", "pipe:1",
+    ]
+    frame_bytes = width * height * 3 // 2
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=frame_bytes)
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height * 3 // 2, width)
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed on segment at frame {segment.first_frame}: {stderr.strip()[-500:]}")
+
+
+def _init_pool_worker() -> None:
+    cv2.setNumThreads(1) # One segment per process; avoid oversubscribing the cores
+
+
+def select_segment(video_path: Path, segment: Segment, size: Tuple[int, int], threads: int,
+                   num_frames: int, total_frames: int, out_dir: Path, ext: str) -> Dict:
+    """
+    Pool task: decodes one segment, scores its frames against the global bins and writes
+    the best frame of each bin it touches as cand_<bin>_<frame>.<ext>.
+    """
+    selector = KeyframeSelector(num_frames, total_frames)
+    candidates = []
+
+    def write(candidate) -> None:
+        path = out_dir / f"cand_{selector.bin_of(candidate.index):05d}_{candidate.index:07d}.{ext}"
+        bgr = cv2.cvtColor(candidate.frame, cv2.COLOR_YUV2BGR_I420)
+        entry = write_candidate(candidate._replace(frame=bgr), path, 0, ext)
+        candidates.append({**entry, "bin": selector.bin_of(candidate.index), "score": candidate.score})
+
+    decoded = 0
+    height = size[1]
+    for frame in decode_segment(video_path, segment, size, threads):
+        for candidate in selector.add(segment.first_frame + decoded, frame, luma=frame[:height]):
+            write(candidate)
+        decoded += 1
+    for candidate in selector.finish():
+        write(candidate)
+    return {"first_frame": segment.first_frame, "decoded": decoded, "expected": segment.num_frames,
+            "candidates": candidates, "sharpness": selector.sharpness_values}
+
+
+def merge_candidates(tmp_dir: Path, results: List[Dict], ext: str) -> List[Dict]:
+    """Keeps the best candidate per bin and renames the winners to frame_00001.<ext>, ... in source order."""
+    best: Dict[int, Dict] = {}
+    for result in results:
+        for candidate in result["candidates"]:
+            current = best.get(candidate["bin"])
+            # Ties go to the earlier frame so the result never depends on completion order
+            if current is None or (candidate["score"], -candidate["source_index"]) > (current["score"], -current["source_index"]):
+                if current is not None:
+                    (tmp_dir / current["file"]).unlink()
+                best[candidate["bin"]] = candidate
+            else:
+                (tmp_dir / candidate["file"]).unlink()
+
+    selected = []
+    for number, bin_index in enumerate(sorted(best), start=1):
+        candidate = best[bin_index]
+        name = frame_filename(number, ext)
+        os.replace(tmp_dir / candidate["file"], tmp_dir / name)
+        selected.append({**{k: v for k, v in candidate.items() if k not in ("bin", "score")}, "file": name})
+    return selected
+
+
+def _make_executor(workers: int) -> Executor:
+    if multiprocessing.current_process().daemon:
+        # Daemonic processes (e.g. some Celery pool children) cannot fork a pool. The decoding
+        # itself still runs in separate ffmpeg processes; threads only score and write frames.
+        log.warning("Running inside a daemonic process: scoring segments in threads instead of processes.")
+        return ThreadPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker)
+
+
+def extract_keyframes_parallel(video_path: Path, out_dir: Path, num_frames: int,
+                               max_size: int = 0, ext: str = "jpg", workers: int = 0) -> Dict:
+    """
+    Same output as worker.keyframes.extract_keyframes, decoded as keyframe-aligned segments in
+    parallel. Falls back to the single-stream decoder for one worker or when the video cannot
+    be segmented (no ffprobe, missing timestamps).
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        try:
+            info = probe_video(video_path)
+        except (OSError, ValueError, KeyError, IndexError, subprocess.CalledProcessError) as e:
+            log.warning(f"Cannot segment {video_path.name} ({e}), decoding as a single stream.")
+            workers = 1
+    if workers <= 1:
+        return extract_keyframes(video_path, out_dir, num_frames, max_size=max_size, ext=ext)
+
+    total_frames = len(info.frame_times_us)
+    segments = plan_segments(info, workers * SEGMENTS_PER_WORKER)
+    size = output_size(info.width, info.height, max_size)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    log.info(f"{video_path.name}: {total_frames} frames, {len(info.keyframes)} keyframes, "
+             f"{len(segments)} segments on {workers} workers, output {size[0]}x{size[1]}.")
+
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    start = time.perf_counter()
+    try:
+        with _make_executor(min(workers, len(segments))) as executor:
+            futures = [
+                executor.submit(select_segment, video_path, segment, size, threads,
+                                num_frames, total_frames, tmp_dir, ext)
+                for segment in segments
+            ]
+            results = [future.result() for future in futures] # Submission order = timeline order
+        for result in results:
+            if result["decoded"] != result["expected"]:
+                log.warning(f"{video_path.name}: segment at frame {result['first_frame']} decoded "
+                            f"{result['decoded']} of {result['expected']} frames.")
+        selected = merge_candidates(tmp_dir, results, ext)
+        decoded = sum(result["decoded"] for result in results)
+        sharpness_values = [value for result in results for value in result["sharpness"]]
+        manifest = write_manifest(tmp_dir, video_path, decoded, info.fps, sharpness_values, selected)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    publish_dir(tmp_dir, out_dir)
+
+    elapsed = time.perf_counter() - start
+    manifest["decode_fps"] = decoded / elapsed if elapsed > 0 else 0.0
+    log.info(f"{video_path.name}: decoded {decoded} frames in {elapsed:.2f}s ({manifest['decode_fps']:.1f} frames/s).")
+    return manifest